@@ -0,0 +1,149 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""Batched writing of triage actions.
+
+The actions of a PR are coalesced before anything is sent. The new labels
+are added with a single call, removed labels are deleted one by one, which
+is rare. Replacing all labels of the PR with one call instead would drop
+the labels added since they were read, maybe minutes earlier in the sweep.
+All comments of a PR go out as one comment. A queue writes the actions of
+many PRs with a pool of threads.
+
+Label writes answered with a server error are retried, as adding and
+removing labels is idempotent. Deleting a label which is gone already
+counts as done. Comments are not, a comment GitHub answered with an error
+for may have been posted anyway. Refusals for the rate limits are retried
+below, by the connection, see ghclient.py.
+"""
+
+import threading
+import time
+
+import github
+
+try:
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+DEFAULT_WRITERS = 4
+
+# Between the comments merged into one
+COMMENT_SEPARATOR = "\n\n"
+
+# Attempts of a label write answered with one of RETRY_STATUSES, and the
+# seconds to wait before the first retry, doubled with every further one
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 2
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Sentinel stopping a writer thread
+DONE = object()
+
+
+def plan_writes(actions):
+    """Returns the API calls applying actions to an issue, as (verb, path
+    relative to the issue, input)"""
+    writes = []
+    for label in actions['unlabel']:
+        writes.append(('DELETE', '/labels/%s' % quote(label, safe=''), None))
+    if actions['newlabel']:
+        writes.append(('POST', '/labels', list(actions['newlabel'])))
+    if actions['comments']:
+        writes.append(('POST', '/comments', {
+            'body': COMMENT_SEPARATOR.join(actions['comments']),
+        }))
+    return writes
+
+
+def send(requester, verb, url, data):
+    """Sends a write, retrying label writes GitHub failed to process"""
+    attempt = 1
+    is_label = '/labels' in url
+    while True:
+        try:
+            return requester.requestJsonAndCheck(verb, url, input=data)
+        except github.GithubException as e:
+            if verb == 'DELETE' and is_label and e.status == 404:
+                return None
+            if (e.status not in RETRY_STATUSES or attempt >= MAX_ATTEMPTS or
+                    not is_label):
+                raise
+        time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+        attempt += 1
+
+
+class ActionQueue(object):
+    """Applies the writes of PRs with a pool of writer threads.
+
+    apply is called with a PR and its writes, see plan_writes(), in one of
+    the threads. Failures do not stop the queue, flush() hands them back.
+    """
+
+    def __init__(self, apply, writers=DEFAULT_WRITERS):
+        self.apply = apply
+        self.writers = writers
+        self.queue = queue.Queue()
+        self.threads = []
+        self.failures = []
+        self.lock = threading.Lock()
+
+    def submit(self, pull_request, writes):
+        """Queues the writes of a PR"""
+        if not self.threads:
+            for _ in range(self.writers):
+                thread = threading.Thread(target=self.work)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+        self.queue.put((pull_request, writes))
+
+    def work(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is DONE:
+                    return
+                pull_request, writes = item
+                try:
+                    self.apply(pull_request, writes)
+                except Exception as e:
+                    with self.lock:
+                        self.failures.append((pull_request, writes, e))
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """Waits until all queued writes are applied, returns the failed
+        ones as (pull request, writes, exception)"""
+        self.queue.join()
+        with self.lock:
+            failures, self.failures = self.failures, []
+        return failures
+
+    def close(self):
+        """Stops the writer threads once the queue is empty"""
+        for _ in self.threads:
+            self.queue.put(DONE)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
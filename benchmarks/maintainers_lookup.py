@@ -0,0 +1,141 @@
+#!/usr/bin/python
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""Micro-benchmark of maintainer lookups on a generated MAINTAINERS file.
+
+Compares the substring scan over all owner namespaces triage.py used to do
+for every file of a PR with lookups in the prefix trie of maintainerindex.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import maintainerindex
+
+
+def generate(entries, seed):
+    """Returns generated MAINTAINERS lines and module paths"""
+    rand = random.Random(seed)
+    logins = ['maintainer%d' % n for n in range(entries // 4 + 1)]
+    lines = []
+    paths = []
+    for n in range(entries):
+        namespace = 'ns%d/sub%d' % (n % 50, n % 400)
+        if n % 20 == 0:
+            owner_space = namespace + '/'
+        elif n % 20 == 10:
+            # Prefix of the names of several modules
+            owner_space = '%s/prefix_%d_' % (namespace, n)
+            paths.extend('%s%s.py' % (owner_space, name)
+                         for name in ('info', 'facts'))
+        else:
+            owner_space = '%s/module_%d.py' % (namespace, n)
+            paths.append(owner_space)
+        lines.append('%s: %s\n' % (owner_space,
+                                   ' '.join(rand.sample(logins, 2))))
+    return lines, paths
+
+
+def substring_scan(lines, filenames):
+    """The lookup triage.py did before maintainerindex"""
+    maintainers = {}
+    for line in lines:
+        owner_space = (line.split(': ')[0]).strip()
+        maintainers[owner_space] = (line.split(': ')[-1]).strip().split(' ')
+    result = []
+    for owner_space, owners in maintainers.items():
+        for filename in filenames:
+            if owner_space in filename:
+                for owner in owners:
+                    if owner not in result:
+                        result.extend(owners)
+    return result
+
+
+def timed(function, *args):
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark maintainer "
+                                                 "lookups")
+    parser.add_argument("--entries", type=int, default=12000,
+                        help="Entries of the generated MAINTAINERS file")
+    parser.add_argument("--prs", type=int, default=1000,
+                        help="Number of PRs looked up")
+    parser.add_argument("--files", type=int, default=5,
+                        help="Files per PR")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    lines, paths = generate(args.entries, args.seed)
+    rand = random.Random(args.seed)
+    prs = [rand.sample(paths, args.files) for _ in range(args.prs)]
+
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(fd, 'w') as f:
+        f.writelines(lines)
+
+    try:
+        def scan_all():
+            # triage.py parsed the file once per run, prbot.py once per PR
+            for filenames in prs:
+                substring_scan(lines, filenames)
+
+        def build():
+            maintainerindex.MaintainersIndex(path)
+
+        index = maintainerindex.MaintainersIndex(path)
+
+        def lookup_all():
+            for filenames in prs:
+                index.lookup_all(filenames)
+
+        maintainerindex.load(path)
+
+        def reload_check():
+            for _ in prs:
+                maintainerindex.load(path)
+
+        build_time = timed(build)
+        results = [
+            ('substring scan', timed(scan_all)),
+            ('trie lookup', timed(lookup_all)),
+            ('mtime check', timed(reload_check)),
+        ]
+    finally:
+        os.remove(path)
+
+    print("%d entries, %d PRs, %d files per PR" %
+          (args.entries, args.prs, args.files))
+    print("%-16s %10.4f s" % ('trie build', build_time))
+    for name, seconds in results:
+        print("%-16s %10.4f s  %10.1f us/PR" %
+              (name, seconds, seconds * 1e6 / args.prs))
+
+if __name__ == "__main__":
+    main()
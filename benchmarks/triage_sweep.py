@@ -0,0 +1,263 @@
+#!/usr/bin/python
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""End-to-end benchmark of triage sweeps.
+
+Runs Triage over generated PR queues served by fakegithub.py on localhost,
+so no network access and no credentials are needed. The datasets follow
+from fixed seeds and are the same on every machine. For each dataset it
+reports PRs per second, wall time and HTTP requests per rule phase, HTTP
+requests per PR and the memory a PR holds once it is triaged.
+
+Results can be written as JSON. Given a baseline written by an earlier run,
+the benchmark fails if any dataset needs more API calls per PR than the
+baseline allows:
+
+    benchmarks/triage_sweep.py --output new.json \\
+        --baseline benchmarks/baseline.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import fakegithub
+import instrument
+import triage
+
+# Generation parameters of the datasets. PRs in unknown mergeable state
+# are left out, the backoff of their rechecks would measure time.sleep().
+DATASETS = [
+    ('small', {'seed': 1, 'prs': 50, 'unknown': 0.0}),
+    ('medium', {'seed': 2, 'prs': 500, 'unknown': 0.0}),
+    ('large', {'seed': 3, 'prs': 2000, 'unknown': 0.0, 'huge': 0.005,
+               'max_comments': 600}),
+]
+
+# Top level steps of Triage.process() reported as phases, see instrument.py
+PHASES = ['labels', 'maintainers', 'comments', 'mergeability', 'build_state',
+          'actions', 'writes']
+
+# Allowed growth of API calls per PR over the baseline
+DEFAULT_THRESHOLD = 0.02
+
+# Shared by everything, not held by any one object
+SKIPPED_TYPES = (type, types.ClassType, types.ModuleType, types.FunctionType,
+                 types.MethodType, types.BuiltinFunctionType)
+
+
+def retained_size(obj, shared):
+    """Returns the bytes of the objects reachable from obj, leaving out
+    the objects in shared and everything reachable only through them"""
+    seen = set(id(item) for item in shared)
+    pending = [obj]
+    size = 0
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, SKIPPED_TYPES):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+        elif isinstance(item, types.GeneratorType):
+            if item.gi_frame is not None:
+                pending.extend(item.gi_frame.f_locals.values())
+        else:
+            if hasattr(item, '__dict__'):
+                pending.append(item.__dict__)
+            for cls in type(item).__mro__:
+                for slot in getattr(cls, '__slots__', ()):
+                    if hasattr(item, slot):
+                        pending.append(getattr(item, slot))
+    return size
+
+
+class MeasuredTriage(triage.Triage):
+    """Triage taking the memory each PR holds once it is triaged"""
+
+    def __init__(self, *args, **kwargs):
+        triage.Triage.__init__(self, *args, **kwargs)
+        self.pr_sizes = []
+
+    def record_state(self):
+        triage.Triage.record_state(self)
+        pull_request = self.pull_request
+        self.pr_sizes.append(retained_size(pull_request, [
+            pull_request.repo, pull_request.requester,
+            pull_request.meter, pull_request.commit_states,
+            pull_request.command_scanner,
+        ]))
+
+
+def run_dataset(name, params, maintainers_file, latency):
+    """Sweeps one generated queue, returns its results"""
+    repo = fakegithub.Repository(
+        'ansible', 'ansible-modules-core',
+        maintainers=fakegithub.parse_maintainers(maintainers_file),
+        **params
+    )
+    # A rate limit high enough to never slow the sweep down
+    api = fakegithub.FakeGithub([repo], latency=latency,
+                                rate_limit=1000000)
+    server = fakegithub.Server(('127.0.0.1', 0), api)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    workdir = tempfile.mkdtemp(prefix='triage-bench-')
+    stdout = sys.stdout
+    try:
+        instance = MeasuredTriage('core', triage.Options(
+            github_user='benchmark', force=True,
+            cache_dir=os.path.join(workdir, 'cache'),
+            state_dir=os.path.join(workdir, 'state'),
+            base_url=server.base_url,
+        ))
+
+        sys.stdout = open(os.devnull, 'w')
+        start = time.time()
+        instance.run()
+        elapsed = time.time() - start
+    finally:
+        if sys.stdout is not stdout:
+            sys.stdout.close()
+            sys.stdout = stdout
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(workdir)
+
+    prs = len(repo.pulls)
+    steps = instance.meter.steps
+    for phase in PHASES:
+        steps.setdefault(phase, instrument.Totals())
+    return {
+        'dataset': name,
+        'params': params,
+        'prs': prs,
+        'seconds': round(elapsed, 3),
+        'prs_per_second': round(prs / elapsed, 2),
+        'requests': api.requests,
+        'requests_per_pr': round(float(api.requests) / prs, 3),
+        'bytes_per_pr': sum(instance.pr_sizes) // len(instance.pr_sizes),
+        'max_bytes_per_pr': max(instance.pr_sizes),
+        'phases': dict(
+            (phase, {
+                'seconds': round(steps[phase].seconds, 3),
+                'requests': steps[phase].calls,
+            }) for phase in PHASES
+        ),
+    }
+
+
+def print_result(result):
+    print("%(dataset)s: %(prs)d PRs in %(seconds).2f s, "
+          "%(prs_per_second).1f PRs/s, %(requests)d requests, "
+          "%(requests_per_pr).2f requests/PR" % result)
+    print("  memory per PR: %s on average, %s at most" %
+          (instrument.format_bytes(result['bytes_per_pr']),
+           instrument.format_bytes(result['max_bytes_per_pr'])))
+    for phase in PHASES:
+        stats = result['phases'][phase]
+        print("  %-14s %9.3f s %8d requests" %
+              (phase, stats['seconds'], stats['requests']))
+
+
+def check_regressions(results, baseline, threshold):
+    """Returns messages for datasets needing more API calls per PR than
+    the baseline allows"""
+    allowed = dict((result['dataset'], result['requests_per_pr'])
+                   for result in baseline['results'])
+    failures = []
+    for result in results:
+        limit = allowed.get(result['dataset'])
+        if limit is None:
+            continue
+        if result['requests_per_pr'] > limit * (1 + threshold):
+            failures.append(
+                "%s: %.3f requests/PR, baseline %.3f (+%d%% allowed)" %
+                (result['dataset'], result['requests_per_pr'], limit,
+                 threshold * 100)
+            )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark triage sweeps "
+                                                 "against generated queues")
+    parser.add_argument("--dataset", action="append",
+                        choices=[name for name, _ in DATASETS],
+                        help="Dataset to run, may be repeated (default: "
+                             "all)")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds added to every request")
+    parser.add_argument("--output", "-o", type=str,
+                        help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", type=str,
+                        help="JSON results to compare API calls per PR to")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed growth of API calls per PR over the "
+                             "baseline, as a fraction")
+    args = parser.parse_args()
+
+    # Templates and MAINTAINERS files are looked up relative to the repo
+    os.chdir(ROOT)
+    maintainers_file = triage.MAINTAINERS_FILES['core']
+
+    results = []
+    for name, params in DATASETS:
+        if args.dataset and name not in args.dataset:
+            continue
+        result = run_dataset(name, params, maintainers_file, args.latency)
+        print_result(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                            time.gmtime()),
+                'python': sys.version.split()[0],
+                'latency': args.latency,
+                'results': results,
+            }, f, indent=2, sort_keys=True, separators=(',', ': '))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = check_regressions(results, baseline, args.threshold)
+        for failure in failures:
+            print("Regression: " + failure, file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
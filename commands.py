@@ -0,0 +1,107 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""Scanning of PR comments for bot commands.
+
+All commands are matched by one compiled pattern in a single pass over a
+comment. A command has to stand on its own: 'shipit' in 'shipit.' or
+"'shipit'" counts, '+1' in 'pull/1+1' or 'line +10' does not. Fenced code
+blocks, where pasted logs usually live, are skipped.
+"""
+
+import re
+import threading
+
+COMMANDS = [
+    "shipit",
+    "+1",
+    "LGTM",
+    "needs_revision",
+    "needs_info",
+    "close_me",
+    "ready_for_review",
+    "pending",
+]
+
+# Commands approving a PR
+SHIPIT_COMMANDS = frozenset(["shipit", "+1", "LGTM"])
+
+COMMAND_PATTERN = re.compile(
+    r'(?<![\w/+=.-])(%s)(?![\w/+=-])' %
+    '|'.join(re.escape(command) for command in
+             sorted(COMMANDS, key=len, reverse=True))
+)
+
+CODE_BLOCK_PATTERN = re.compile(r'^```.*?^```', re.MULTILINE | re.DOTALL)
+
+# Scanned comments remembered between runs
+DEFAULT_MAX_CACHED = 100000
+
+
+def scan(body):
+    """Returns the set of commands in a comment body"""
+    if not body:
+        return frozenset()
+    body = CODE_BLOCK_PATTERN.sub('', body)
+    return frozenset(match.group(1)
+                     for match in COMMAND_PATTERN.finditer(body))
+
+
+class CommandScanner(object):
+    """Scans comments for commands, remembering results by comment ID.
+
+    A comment is scanned again only if it was edited since it was scanned.
+    Comments may be scanned from several threads.
+    """
+
+    def __init__(self, store=None, max_cached=DEFAULT_MAX_CACHED):
+        self.store = store
+        self.max_cached = max_cached
+        self.memory = {}
+        self.lock = threading.Lock()
+        self.stats = {
+            'scanned': 0,
+            'cached': 0,
+        }
+
+    def scan_comment(self, comment):
+        """Returns the set of commands in an IssueComment"""
+        updated_at = str(comment.updated_at)
+        cached = self.memory.get(comment.id)
+        if cached is None and self.store is not None:
+            cached = self.store.get(comment.id)
+        if cached is not None and cached[0] == updated_at:
+            found = frozenset(cached[1])
+            kind = 'cached'
+        else:
+            found = scan(comment.body)
+            kind = 'scanned'
+        with self.lock:
+            self.stats[kind] += 1
+            self.memory[comment.id] = (updated_at, sorted(found))
+        return found
+
+    def save(self):
+        """Persists the results of this run into the store"""
+        if self.store is None:
+            return
+        for comment_id, result in self.memory.items():
+            self.store.set(comment_id, result)
+        if len(self.store) > self.max_cached:
+            newest = sorted(self.store.keys(), key=int)[-self.max_cached:]
+            self.store.data = dict((key, self.store.data[key])
+                                   for key in newest)
+        self.store.save()
@@ -0,0 +1,766 @@
+#!/usr/bin/python
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""A stand-in for the parts of the GitHub REST API the triage tools use.
+
+Repositories are generated from a seed, so the same parameters always give
+the same PR queue, at any size from a handful to tens of thousands of PRs.
+The server paginates like GitHub, sends ETags and rate limit headers, can
+add latency to every request and refuse bursts of writes like GitHub's
+secondary rate limit. Point triage.py or new-module-alert.py at
+it with --base-url:
+
+    ./fakegithub.py --prs 10000 --huge 0.01 --max-comments 600 &
+    ./triage.py core --force --base-url http://localhost:8080
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+    from urllib import unquote
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, unquote, urlparse
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+BOTS = ['gregdek', 'robynbergeron']
+ORG_MEMBERS = ['bcoca', 'jimi-c', 'abadger', 'gregdek', 'robynbergeron',
+               'nitzmahone', 'mattclay']
+
+COMMENT_BODIES = [
+    "shipit",
+    "+1",
+    "LGTM",
+    "needs_revision",
+    "needs_info",
+    "ready_for_review",
+    "close_me",
+    "Thanks, I will take a look at this.",
+    "Could you add an example to the documentation?",
+    "See https://github.com/ansible/ansible/pull/1+1 for the related change.",
+    "Traceback (most recent call last):\n  File \"x.py\", line 1\n" * 20,
+]
+
+BODIES = [
+    "##### Issue Type:\n- Bugfix Pull Request\n",
+    "##### Issue Type:\n- Feature Pull Request\n",
+    "##### Issue Type:\n- Docs Pull Request\n",
+    "##### Issue Type:\n- New Module Pull Request\n",
+    "",
+]
+
+LABELS = [
+    'community_review', 'core_review', 'needs_revision', 'needs_info',
+    'shipit', 'bugfix_pull_request', 'feature_pull_request', 'cloud',
+    'networking', 'new_plugin', 'owner_pr', 'P3',
+]
+
+
+def parse_maintainers(path):
+    """Returns (file, maintainers) pairs from a MAINTAINERS file"""
+    entries = []
+    with open(path) as f:
+        for line in f:
+            if ': ' not in line:
+                continue
+            owner_space, maintainers = line.split(': ', 1)
+            entries.append((owner_space.strip(), maintainers.split()))
+    return entries
+
+
+class Repository(object):
+    """Generated data of one repository"""
+
+    def __init__(self, owner, name, seed=0, prs=100, comments=10,
+                 max_comments=500, files=3, max_files=3000, unknown=0.05,
+                 labeled=0.7, huge=0.0, maintainers=None, now=None):
+        self.owner = owner
+        self.name = name
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.now = now or datetime(2016, 6, 1)
+        self.pulls = {}
+        # PRs by the SHA of their head commit
+        self.heads = {}
+        self.next_comment_id = 1
+
+        entries = maintainers or [
+            ('cloud/amazon/ec2.py', ['ansible']),
+            ('network/basics/uri.py', ['ansible']),
+            ('packaging/os/yum.py', ['ansible']),
+            ('system/mount.py', ['ansible']),
+            ('windows/win_ping.ps1', ['ansible']),
+        ]
+        self.maintained = entries
+        maintainer_logins = sorted(set(
+            login for _, logins in entries for login in logins
+            if login not in ('ansible', 'DEPRECATED')
+        ))
+        self.users = (['user%d' % n for n in range(50)] +
+                      maintainer_logins[:50] + ORG_MEMBERS)
+
+        for number in range(1, prs + 1):
+            pull = self.generate_pull(number, comments, max_comments, files,
+                                      max_files, unknown, labeled, huge)
+            self.pulls[number] = pull
+            self.heads[pull['commits'][-1]] = pull
+
+    def sha(self, *parts):
+        return hashlib.sha1(
+            ':'.join(str(p) for p in parts).encode('utf-8')
+        ).hexdigest()
+
+    def generate_pull(self, number, comments, max_comments, files,
+                      max_files, unknown, labeled, huge):
+        rand = self.random
+        created = self.now - timedelta(days=rand.randint(1, 400),
+                                       seconds=rand.randint(0, 86400))
+        submitter = rand.choice(self.users)
+
+        # Most PRs are small, a share of huge ones gets close to the maxima
+        is_huge = huge and rand.random() < huge
+        if is_huge:
+            n_files = rand.randint(max_files // 2, max_files)
+        else:
+            n_files = min(max_files, int(rand.expovariate(1.0 / files)) + 1)
+        filenames = []
+        for index in range(n_files):
+            if index == 0 or rand.random() < 0.5:
+                filename = rand.choice(self.maintained)[0]
+                if not filename.endswith('/') and '.' not in filename:
+                    # A prefix entry like monitoring/zabbix_
+                    filename += ('' if filename.endswith('_') else '_') + \
+                        'generated.py'
+            else:
+                filename = 'lib/generated/file_%d_%d.py' % (number, index)
+            status = 'added' if rand.random() < 0.15 else 'modified'
+            filenames.append({'filename': filename, 'status': status})
+
+        if is_huge:
+            n_comments = rand.randint(max_comments // 2, max_comments)
+        else:
+            n_comments = min(max_comments,
+                             int(rand.expovariate(1.0 / max(comments, 1))))
+        pr_comments = []
+        when = created
+        for _ in range(n_comments):
+            when += timedelta(hours=rand.randint(1, 200))
+            if when > self.now:
+                when = self.now
+            user = rand.choice(self.users + BOTS)
+            pr_comments.append({
+                'id': self.next_comment_id,
+                'user': user,
+                'body': rand.choice(COMMENT_BODIES),
+                'created_at': when,
+            })
+            self.next_comment_id += 1
+
+        labels = []
+        if rand.random() < labeled:
+            labels = rand.sample(LABELS, rand.randint(1, 3))
+
+        updated = max([created] + [c['created_at'] for c in pr_comments])
+        commits = [self.sha(self.name, number, n)
+                   for n in range(rand.randint(1, 5))]
+        return {
+            'number': number,
+            'title': ('[WIP] ' if rand.random() < 0.05 else '') +
+                     'Change number %d' % number,
+            'body': rand.choice(BODIES),
+            'user': submitter,
+            'created_at': created,
+            'updated_at': updated,
+            'base': 'stable-2.0' if rand.random() < 0.05 else 'devel',
+            'commits': commits,
+            'files': filenames,
+            'labels': labels,
+            'comments': pr_comments,
+            'build_state': rand.choice(['success', 'success', 'failure',
+                                        'pending', None]),
+            'mergeable_state': ('dirty' if rand.random() < 0.1
+                                else 'clean'),
+            # Number of fetches answering "unknown" before GitHub is done
+            'unknown_fetches': (rand.randint(1, 4)
+                                if rand.random() < unknown else 0),
+        }
+
+    def touch(self, pull):
+        pull['updated_at'] = datetime.utcnow()
+
+
+class FakeGithub(object):
+    """State of the fake API shared by all request handlers"""
+
+    def __init__(self, repos, latency=0.0, per_page=30, rate_limit=5000,
+                 rate_window=3600, write_limit=None):
+        self.repos = dict(('%s/%s' % (r.owner, r.name), r) for r in repos)
+        self.latency = latency
+        self.per_page = per_page
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.rate_remaining = rate_limit
+        self.rate_reset = int(time.time()) + rate_window
+        # Writes allowed per second, and the times of the recent ones
+        self.write_limit = write_limit
+        self.writes = deque()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.refused_writes = 0
+
+    def admit_write(self):
+        """Returns False if a write exceeds the secondary rate limit"""
+        if not self.write_limit:
+            return True
+        with self.lock:
+            now = time.time()
+            while self.writes and self.writes[0] <= now - 1:
+                self.writes.popleft()
+            if len(self.writes) >= self.write_limit:
+                self.refused_writes += 1
+                return False
+            self.writes.append(now)
+            return True
+
+    def charge(self, conditional_hit):
+        """Accounts a request against the rate limit"""
+        with self.lock:
+            self.requests += 1
+            now = time.time()
+            if now >= self.rate_reset:
+                self.rate_remaining = self.rate_limit
+                self.rate_reset = int(now) + self.rate_window
+            if conditional_hit:
+                return True
+            if self.rate_remaining <= 0:
+                return False
+            self.rate_remaining -= 1
+            return True
+
+    def rate_headers(self):
+        return [
+            ('X-RateLimit-Limit', str(self.rate_limit)),
+            ('X-RateLimit-Remaining', str(self.rate_remaining)),
+            ('X-RateLimit-Reset', str(self.rate_reset)),
+        ]
+
+
+def date(value):
+    return value.strftime(DATE_FORMAT) if value else None
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Request handler serving a FakeGithub"""
+
+    protocol_version = 'HTTP/1.1'
+
+    # Send every response in one write, small writes on a kept alive
+    # connection stall on delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    ROUTES = [
+        ('GET', r'/rate_limit$', 'get_rate_limit'),
+        ('GET', r'/users/(?P<login>[^/]+)$', 'get_user'),
+        ('GET', r'/orgs/(?P<org>[^/]+)$', 'get_org'),
+        ('GET', r'/orgs/(?P<org>[^/]+)/members$', 'get_members'),
+        ('GET', r'/orgs/(?P<org>[^/]+)/members/(?P<login>[^/]+)$',
+         'get_member'),
+        ('GET', r'/repos/(?P<repo>[^/]+/[^/]+)$', 'get_repo'),
+        ('GET', r'/repos/(?P<repo>[^/]+/[^/]+)/pulls$', 'get_pulls'),
+        ('GET', r'/repos/(?P<repo>[^/]+/[^/]+)/pulls/(?P<number>\d+)$',
+         'get_pull'),
+        ('GET', r'/repos/(?P<repo>[^/]+/[^/]+)/pulls/(?P<number>\d+)/files$',
+         'get_files'),
+        ('GET',
+         r'/repos/(?P<repo>[^/]+/[^/]+)/pulls/(?P<number>\d+)/commits$',
+         'get_commits'),
+        ('GET', r'/repos/(?P<repo>[^/]+/[^/]+)/statuses/(?P<sha>\w+)$',
+         'get_statuses'),
+        ('GET', r'/repos/(?P<repo>[^/]+/[^/]+)/commits/(?P<sha>\w+)/status$',
+         'get_combined_status'),
+        ('GET', r'/repos/(?P<repo>[^/]+/[^/]+)/issues$', 'get_issues'),
+        ('GET', r'/repos/(?P<repo>[^/]+/[^/]+)/issues/(?P<number>\d+)$',
+         'get_issue'),
+        ('GET',
+         r'/repos/(?P<repo>[^/]+/[^/]+)/issues/(?P<number>\d+)/comments$',
+         'get_comments'),
+        ('POST',
+         r'/repos/(?P<repo>[^/]+/[^/]+)/issues/(?P<number>\d+)/comments$',
+         'post_comment'),
+        ('POST',
+         r'/repos/(?P<repo>[^/]+/[^/]+)/issues/(?P<number>\d+)/labels$',
+         'post_labels'),
+        ('PUT',
+         r'/repos/(?P<repo>[^/]+/[^/]+)/issues/(?P<number>\d+)/labels$',
+         'put_labels'),
+        ('DELETE',
+         r'/repos/(?P<repo>[^/]+/[^/]+)/issues/(?P<number>\d+)/labels/'
+         r'(?P<label>[^/]+)$',
+         'delete_label'),
+    ]
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    @property
+    def api(self):
+        return self.server.api
+
+    @property
+    def base_url(self):
+        return 'http://%s' % (self.headers.get('Host') or
+                              '%s:%s' % self.server.server_address)
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b''
+        if not data:
+            return None
+        return json.loads(data.decode('utf-8'))
+
+    def dispatch(self, verb):
+        if self.api.latency:
+            time.sleep(self.api.latency)
+        url = urlparse(self.path)
+        self.query = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+        body = self.read_body() if verb != 'GET' else None
+        if verb == 'GET':
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        elif not self.api.admit_write():
+            return self.respond(403, {
+                'message': 'You have exceeded a secondary rate limit. '
+                           'Please wait a few minutes before you try again.',
+            }, headers=[('Retry-After', '1')])
+        for route_verb, pattern, handler in self.ROUTES:
+            match = re.match(pattern, url.path)
+            if match and route_verb == verb:
+                kwargs = dict((k, unquote(v))
+                              for k, v in match.groupdict().items())
+                if 'repo' in kwargs:
+                    repo = self.api.repos.get(kwargs.pop('repo'))
+                    if repo is None:
+                        return self.respond(404, {'message': 'Not Found'})
+                    kwargs['repo'] = repo
+                if body is not None:
+                    kwargs['body'] = body
+                try:
+                    with self.api.lock:
+                        result = getattr(self, handler)(**kwargs)
+                except KeyError:
+                    return self.respond(404, {'message': 'Not Found'})
+                return self.respond(*result)
+        self.respond(404, {'message': 'Not Found'})
+
+    def respond(self, status, data, links=None, headers=None):
+        headers = list(headers or [])
+        payload = b''
+        if data is not None:
+            payload = json.dumps(data, sort_keys=True).encode('utf-8')
+            etag = '"%s"' % hashlib.sha1(payload).hexdigest()
+            headers.append(('ETag', etag))
+            headers.append(('Content-Type', 'application/json; '
+                                            'charset=utf-8'))
+        not_modified = (status == 200 and data is not None and
+                        self.headers.get('If-None-Match') == etag)
+        if not self.api.charge(not_modified):
+            status, not_modified = 403, False
+            payload = json.dumps({
+                'message': 'API rate limit exceeded for 127.0.0.1.',
+            }).encode('utf-8')
+        if not_modified:
+            status, payload = 304, b''
+        if links:
+            headers.append(('Link', ', '.join(
+                '<%s>; rel="%s"' % (url, rel) for rel, url in links
+            )))
+        headers.extend(self.api.rate_headers())
+        headers.append(('Content-Length', str(len(payload))))
+
+        self.send_response(status)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def paginate(self, items, render=None):
+        """Returns a page of items, rendering only the items on it"""
+        per_page = int(self.query.get('per_page') or self.api.per_page)
+        page = int(self.query.get('page') or 1)
+        last = max(1, (len(items) + per_page - 1) // per_page)
+        path = urlparse(self.path).path
+
+        def page_url(number):
+            # GitHub puts the page parameter last
+            query = [(k, v) for k, v in sorted(self.query.items())
+                     if k != 'page']
+            query.append(('page', number))
+            return '%s%s?%s' % (self.base_url, path, '&'.join(
+                '%s=%s' % (k, v) for k, v in query
+            ))
+        links = []
+        if page < last:
+            links.append(('next', page_url(page + 1)))
+            links.append(('last', page_url(last)))
+        if page > 1:
+            links.append(('first', page_url(1)))
+            links.append(('prev', page_url(page - 1)))
+        items = items[(page - 1) * per_page:page * per_page]
+        if render:
+            items = [render(item) for item in items]
+        return (200, items, links)
+
+    # Representations
+
+    def user(self, login):
+        return {
+            'login': login,
+            'id': int(hashlib.sha1(login.encode('utf-8')).hexdigest()[:6],
+                      16),
+            'url': '%s/users/%s' % (self.base_url, login),
+            'type': 'User',
+        }
+
+    def repo_url(self, repo):
+        return '%s/repos/%s/%s' % (self.base_url, repo.owner, repo.name)
+
+    def label(self, repo, name):
+        return {
+            'name': name,
+            'color': 'ededed',
+            'url': '%s/labels/%s' % (self.repo_url(repo), name),
+        }
+
+    def pull(self, repo, pull, full=False):
+        url = '%s/pulls/%d' % (self.repo_url(repo), pull['number'])
+        data = {
+            'number': pull['number'],
+            'id': pull['number'],
+            'state': 'open',
+            'title': pull['title'],
+            'body': pull['body'],
+            'user': self.user(pull['user']),
+            'created_at': date(pull['created_at']),
+            'updated_at': date(pull['updated_at']),
+            'url': url,
+            'html_url': url.replace('/repos/', '/', 1),
+            'issue_url': '%s/issues/%d' % (self.repo_url(repo),
+                                          pull['number']),
+            'head': {'sha': pull['commits'][-1], 'ref': 'topic',
+                     'label': '%s:topic' % pull['user']},
+            'base': {'sha': repo.sha(repo.name, pull['base']),
+                     'ref': pull['base'], 'label': 'ansible:%s' %
+                     pull['base']},
+        }
+        if full:
+            state = pull['mergeable_state']
+            if pull['unknown_fetches']:
+                pull['unknown_fetches'] -= 1
+                state = 'unknown'
+            data.update({
+                'mergeable_state': state,
+                'mergeable': None if state == 'unknown' else state != 'dirty',
+                'comments': len(pull['comments']),
+                'commits': len(pull['commits']),
+                'changed_files': len(pull['files']),
+            })
+        return data
+
+    def issue(self, repo, pull):
+        url = '%s/issues/%d' % (self.repo_url(repo), pull['number'])
+        return {
+            'number': pull['number'],
+            'id': pull['number'],
+            'state': 'open',
+            'title': pull['title'],
+            'body': pull['body'],
+            'user': self.user(pull['user']),
+            'labels': [self.label(repo, n) for n in pull['labels']],
+            'comments': len(pull['comments']),
+            'created_at': date(pull['created_at']),
+            'updated_at': date(pull['updated_at']),
+            'url': url,
+            'html_url': url.replace('/repos/', '/', 1),
+            'pull_request': {
+                'url': '%s/pulls/%d' % (self.repo_url(repo), pull['number']),
+            },
+        }
+
+    def comment(self, repo, pull, comment):
+        return {
+            'id': comment['id'],
+            'body': comment['body'],
+            'user': self.user(comment['user']),
+            'created_at': date(comment['created_at']),
+            'updated_at': date(comment['created_at']),
+            'url': '%s/issues/comments/%d' % (self.repo_url(repo),
+                                              comment['id']),
+        }
+
+    # Handlers
+
+    def get_rate_limit(self):
+        rate = {
+            'limit': self.api.rate_limit,
+            'remaining': self.api.rate_remaining,
+            'reset': self.api.rate_reset,
+        }
+        return (200, {'resources': {'core': rate}, 'rate': rate})
+
+    def get_user(self, login):
+        return (200, self.user(login))
+
+    def get_org(self, org):
+        return (200, {'login': org, 'id': 1,
+                      'url': '%s/orgs/%s' % (self.base_url, org)})
+
+    def get_members(self, org):
+        return self.paginate([self.user(login) for login in ORG_MEMBERS])
+
+    def get_member(self, org, login):
+        return (204 if login in ORG_MEMBERS else 404, None)
+
+    def get_repo(self, repo):
+        return (200, {
+            'id': 1,
+            'name': repo.name,
+            'full_name': '%s/%s' % (repo.owner, repo.name),
+            'owner': self.user(repo.owner),
+            'url': self.repo_url(repo),
+        })
+
+    def sorted_pulls(self, repo):
+        pulls = list(repo.pulls.values())
+        sort = self.query.get('sort', 'created')
+        key = 'updated_at' if sort == 'updated' else 'created_at'
+        pulls.sort(key=lambda p: (p[key], p['number']),
+                   reverse=self.query.get('direction', 'desc') == 'desc')
+        since = self.query.get('since')
+        if since:
+            pulls = [p for p in pulls
+                     if date(p['updated_at']) >= since]
+        return pulls
+
+    def get_pulls(self, repo):
+        return self.paginate(self.sorted_pulls(repo),
+                             lambda p: self.pull(repo, p))
+
+    def get_pull(self, repo, number):
+        return (200, self.pull(repo, repo.pulls[int(number)], full=True))
+
+    def get_files(self, repo, number):
+        pull = repo.pulls[int(number)]
+        return self.paginate(pull['files'], lambda f: {
+            'filename': f['filename'],
+            'status': f['status'],
+            'sha': repo.sha(f['filename'], number),
+        })
+
+    def get_commits(self, repo, number):
+        pull = repo.pulls[int(number)]
+        return self.paginate([{
+            'sha': sha,
+            'url': '%s/commits/%s' % (self.repo_url(repo), sha),
+        } for sha in pull['commits']])
+
+    def get_statuses(self, repo, sha):
+        pull = repo.heads.get(sha)
+        if not pull or not pull['build_state']:
+            return self.paginate([])
+        return self.paginate([{
+            'id': pull['number'],
+            'state': pull['build_state'],
+            'context': 'continuous-integration/travis-ci/pr',
+            'created_at': date(pull['updated_at']),
+            'updated_at': date(pull['updated_at']),
+            'url': '%s/statuses/%s' % (self.repo_url(repo), sha),
+        }])
+
+    def get_combined_status(self, repo, sha):
+        pull = repo.heads.get(sha)
+        state = pull['build_state'] if pull else None
+        return (200, {
+            'state': state or 'pending',
+            'sha': sha,
+            'total_count': 1 if state else 0,
+            'statuses': [],
+        })
+
+    def get_issues(self, repo):
+        pulls = self.sorted_pulls(repo)
+        labels = self.query.get('labels')
+        if labels:
+            wanted = set(labels.split(','))
+            pulls = [p for p in pulls if wanted.issubset(p['labels'])]
+        return self.paginate(pulls, lambda p: self.issue(repo, p))
+
+    def get_issue(self, repo, number):
+        return (200, self.issue(repo, repo.pulls[int(number)]))
+
+    def get_comments(self, repo, number):
+        pull = repo.pulls[int(number)]
+        comments = pull['comments']
+        since = self.query.get('since')
+        if since:
+            comments = [c for c in comments
+                        if date(c['created_at']) >= since]
+        return self.paginate(comments,
+                             lambda c: self.comment(repo, pull, c))
+
+    def post_comment(self, repo, number, body):
+        pull = repo.pulls[int(number)]
+        comment = {
+            'id': repo.next_comment_id,
+            'user': BOTS[0],
+            'body': body['body'],
+            'created_at': datetime.utcnow().replace(microsecond=0),
+        }
+        repo.next_comment_id += 1
+        pull['comments'].append(comment)
+        repo.touch(pull)
+        return (201, self.comment(repo, pull, comment))
+
+    def post_labels(self, repo, number, body):
+        pull = repo.pulls[int(number)]
+        for name in body:
+            if name not in pull['labels']:
+                pull['labels'].append(name)
+        repo.touch(pull)
+        return (200, [self.label(repo, n) for n in pull['labels']])
+
+    def put_labels(self, repo, number, body):
+        pull = repo.pulls[int(number)]
+        pull['labels'] = list(body)
+        repo.touch(pull)
+        return (200, [self.label(repo, n) for n in pull['labels']])
+
+    def delete_label(self, repo, number, label):
+        pull = repo.pulls[int(number)]
+        if label not in pull['labels']:
+            return (404, {'message': 'Label does not exist'})
+        pull['labels'].remove(label)
+        repo.touch(pull)
+        return (204, None)
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, api, verbose=False):
+        HTTPServer.__init__(self, address, Handler)
+        self.api = api
+        self.verbose = verbose
+
+    @property
+    def base_url(self):
+        return 'http://%s:%d' % self.server_address
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a generated fake "
+                                                 "GitHub API for load tests")
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the generated data")
+    parser.add_argument("--prs", type=int, default=100,
+                        help="Open PRs per repository")
+    parser.add_argument("--comments", type=int, default=10,
+                        help="Mean number of comments per PR")
+    parser.add_argument("--max-comments", type=int, default=500,
+                        help="Maximum number of comments per PR")
+    parser.add_argument("--files", type=int, default=3,
+                        help="Mean number of files per PR")
+    parser.add_argument("--max-files", type=int, default=3000,
+                        help="Maximum number of files per PR")
+    parser.add_argument("--labeled", type=float, default=0.7,
+                        help="Share of PRs already carrying labels")
+    parser.add_argument("--huge", type=float, default=0.0,
+                        help="Share of PRs with close to the maximum number "
+                             "of comments and files")
+    parser.add_argument("--unknown", type=float, default=0.05,
+                        help="Share of PRs in unknown mergeable state")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds added to every request")
+    parser.add_argument("--per-page", type=int, default=30,
+                        help="Default page size")
+    parser.add_argument("--rate-limit", type=int, default=5000,
+                        help="Requests allowed per rate limit window")
+    parser.add_argument("--rate-window", type=int, default=3600,
+                        help="Seconds of a rate limit window")
+    parser.add_argument("--write-limit", type=int,
+                        help="Writes allowed per second, more are refused "
+                             "like for GitHub's secondary rate limit")
+    parser.add_argument("--verbose", "-v", action="store_true",
+                        help="Log every request")
+    args = parser.parse_args()
+
+    repos = []
+    for name, maintainers_file in (('core', 'MAINTAINERS-CORE.txt'),
+                                   ('extras', 'MAINTAINERS-EXTRAS.txt')):
+        try:
+            maintainers = parse_maintainers(maintainers_file)
+        except IOError:
+            maintainers = None
+        repos.append(Repository(
+            'ansible', 'ansible-modules-%s' % name, seed=args.seed,
+            prs=args.prs, comments=args.comments,
+            max_comments=args.max_comments, files=args.files,
+            max_files=args.max_files, unknown=args.unknown,
+            labeled=args.labeled, huge=args.huge, maintainers=maintainers,
+        ))
+    api = FakeGithub(repos, latency=args.latency, per_page=args.per_page,
+                     rate_limit=args.rate_limit, rate_window=args.rate_window,
+                     write_limit=args.write_limit)
+    server = Server((args.host, args.port), api, verbose=args.verbose)
+    print("Serving fake GitHub API on %s" % server.base_url, file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,738 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""HTTP layer used underneath PyGithub by the triage tools.
+
+PyGithub sends every request through an httplib style connection object.
+We inject our own connection classes into its Requester. They send the
+requests through one pooled requests session, so connections are kept alive
+and reused, and put a response cache in front of the API without touching
+the rest of the code.
+
+The same place lets us record all traffic of a run into a cassette, and
+replay a cassette later without any network access.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import github.Requester
+import requests
+import requests.adapters
+from github import Github
+
+DEFAULT_BASE_URL = "https://api.github.com"
+
+# Connections kept open per host
+DEFAULT_POOL_SIZE = 10
+
+DEFAULT_TIMEOUT = 60
+
+# Below this share of the hourly rate limit, requests are spread evenly over
+# the time left until the limit resets. Below the same share of a sweep's
+# budget, optional fetches are skipped.
+LOW_QUOTA_SHARE = 0.2
+
+# Seconds to wait after a refusal for a secondary rate limit which did not
+# say how long, and the number of times a request is retried after one
+SECONDARY_LIMIT_WAIT = 60
+MAX_SECONDARY_RETRIES = 5
+
+DEFAULT_CACHE_DIR = os.path.expanduser("~/.ansibullbot/cache")
+
+# Seconds a response held in memory is served without asking GitHub again.
+# Anything older is revalidated with a conditional request. Resources we
+# write to, or which GitHub computes lazily (mergeable state), are never
+# served without revalidation.
+RESOURCE_TTLS = {
+    'pull': 0,
+    'issue': 0,
+    'pulls': 60,
+    'issues': 60,
+    'files': 300,
+    'commits': 60,
+    'statuses': 60,
+    'comments': 60,
+    'members': 3600,
+    'users': 3600,
+}
+DEFAULT_TTL = 0
+
+# Number of responses kept in the memory tier
+DEFAULT_MAX_ENTRIES = 2048
+
+RESOURCE_PATTERNS = [
+    ('pull', re.compile(r'/repos/[^/]+/[^/]+/pulls/\d+$')),
+    ('issue', re.compile(r'/repos/[^/]+/[^/]+/issues/\d+$')),
+    ('pulls', re.compile(r'/repos/[^/]+/[^/]+/pulls$')),
+    ('issues', re.compile(r'/repos/[^/]+/[^/]+/issues$')),
+    ('files', re.compile(r'/pulls/\d+/files$')),
+    ('commits', re.compile(r'/pulls/\d+/commits$')),
+    ('statuses', re.compile(r'/statuses(/[^/]+)?$')),
+    ('comments', re.compile(r'/issues/\d+/comments$')),
+    ('members', re.compile(r'/orgs/[^/]+/(public_)?members(/[^/]+)?$')),
+    ('users', re.compile(r'/users/[^/]+$')),
+]
+
+# Writes to /repos/<owner>/<repo>/<issues|pulls>/<number>/... make every
+# cached response below that PR or issue stale.
+WRITE_SCOPE = re.compile(r'^(/repos/[^/]+/[^/]+/)(?:issues|pulls)/(\d+)')
+
+
+def resource_type(path):
+    """Returns the resource type of an API path"""
+    path = path.split('?')[0]
+    for name, pattern in RESOURCE_PATTERNS:
+        if pattern.search(path):
+            return name
+    return None
+
+
+class Response(object):
+    """Minimal stand-in for an httplib response"""
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def getheaders(self):
+        return self.headers
+
+    def getheader(self, name, default=None):
+        for key, value in self.headers:
+            if key.lower() == name.lower():
+                return value
+        return default
+
+    def read(self):
+        return self.body
+
+
+class ResponseCache(object):
+    """Two tier cache of GET responses.
+
+    The memory tier is an LRU capped at max_entries and serves responses
+    without a request while they are younger than their resource TTL. The
+    disk tier keeps the ETag / Last-Modified validators of every response so
+    later runs can send conditional requests. A 304 answer does not count
+    against the rate limit and is served from the cached body.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR,
+                 max_entries=DEFAULT_MAX_ENTRIES, ttls=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.ttls = dict(RESOURCE_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.memory = OrderedDict()
+        # Requests may come from several threads, see pipeline.py
+        self.lock = threading.RLock()
+        self.stats = {
+            'fresh': 0,
+            'not_modified': 0,
+            'fetched': 0,
+        }
+        if self.cache_dir and not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def key(self, url, headers):
+        """Returns the cache key of a request"""
+        auth = headers.get('Authorization') or ''
+        auth_hash = hashlib.sha1(auth.encode('utf-8')).hexdigest()[:8]
+        accept = headers.get('Accept') or ''
+        return hashlib.sha1(
+            ('%s %s %s' % (auth_hash, accept, url)).encode('utf-8')
+        ).hexdigest()
+
+    def ttl(self, url):
+        """Returns the TTL for the resource behind url"""
+        return self.ttls.get(resource_type(url), DEFAULT_TTL)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def get(self, key):
+        """Returns the cached entry for key, promoting disk hits to memory"""
+        with self.lock:
+            entry = self.memory.pop(key, None)
+        if entry is None and self.cache_dir:
+            try:
+                with open(self._path(key)) as f:
+                    entry = json.load(f)
+            except (IOError, OSError, ValueError):
+                entry = None
+            if entry is not None:
+                # Only the validators are trusted from disk
+                entry['stored_at'] = 0
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def is_fresh(self, entry):
+        """Returns True if entry may be served without a request"""
+        ttl = self.ttl(entry['url'])
+        return ttl > 0 and time.time() - entry['stored_at'] < ttl
+
+    def _remember(self, key, entry):
+        with self.lock:
+            self.memory[key] = entry
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def store(self, key, url, status, headers, body):
+        """Stores a response if it carries a validator"""
+        header_dict = dict((k.lower(), v) for k, v in headers)
+        entry = {
+            'url': url,
+            'status': status,
+            'headers': list(headers),
+            'body': body.decode('utf-8') if isinstance(body, bytes) else body,
+            'etag': header_dict.get('etag'),
+            'last_modified': header_dict.get('last-modified'),
+            'stored_at': time.time(),
+        }
+        if not entry['etag'] and not entry['last_modified']:
+            return
+        self._remember(key, entry)
+        if self.cache_dir:
+            path = self._path(key)
+            if not os.path.isdir(os.path.dirname(path)):
+                try:
+                    os.makedirs(os.path.dirname(path))
+                except OSError:
+                    # created by another thread meanwhile
+                    pass
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.rename(tmp_path, path)
+
+    def touch(self, key, entry):
+        """Marks an entry as just revalidated"""
+        entry['stored_at'] = time.time()
+        self._remember(key, entry)
+
+    def invalidate(self, url):
+        """Forces revalidation of entries made stale by a write to url"""
+        match = WRITE_SCOPE.match(url.split('?')[0])
+        if not match:
+            return
+        owner_repo, number = match.groups()
+        scopes = ['%s%s/%s' % (owner_repo, kind, number)
+                  for kind in ('issues', 'pulls')]
+        with self.lock:
+            for entry in self.memory.values():
+                path = entry['url'].split('?')[0]
+                if path in scopes or path.startswith(
+                        tuple(scope + '/' for scope in scopes)):
+                    entry['stored_at'] = 0
+
+    def response(self, entry):
+        """Builds a response object from a cached entry"""
+        body = entry['body']
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        headers = [tuple(header) for header in entry['headers']]
+        return Response(entry['status'], headers, body)
+
+
+class CachingConnection(object):
+    """httplib connection wrapper answering GETs from a ResponseCache"""
+
+    connection_class = None
+    cache = None
+
+    def __init__(self, host, port=None, **kwargs):
+        self.connection = self.connection_class(host, port, **kwargs)
+        self.response = None
+        self.key = None
+        self.entry = None
+        self.url = None
+
+    def request(self, verb, url, body=None, headers=None):
+        headers = dict(headers or {})
+        self.response = None
+        self.key = None
+        if verb != 'GET':
+            self.cache.invalidate(url)
+            self.connection.request(verb, url, body, headers)
+            return
+
+        self.key = self.cache.key(url, headers)
+        self.entry = self.cache.get(self.key)
+        if self.entry is not None:
+            if self.cache.is_fresh(self.entry):
+                self.cache.count('fresh')
+                self.response = self.cache.response(self.entry)
+                return
+            if self.entry['etag']:
+                headers['If-None-Match'] = self.entry['etag']
+            if self.entry['last_modified']:
+                headers['If-Modified-Since'] = self.entry['last_modified']
+        self.url = url
+        self.connection.request(verb, url, body, headers)
+
+    def getresponse(self):
+        if self.response is not None:
+            return self.response
+
+        response = self.connection.getresponse()
+        if self.key is None:
+            return response
+
+        if response.status == 304 and self.entry is not None:
+            response.read()
+            self.cache.count('not_modified')
+            self.cache.touch(self.key, self.entry)
+            return self.cache.response(self.entry)
+
+        self.cache.count('fetched')
+        headers = response.getheaders()
+        body = response.read()
+        if response.status == 200:
+            self.cache.store(self.key, self.url, response.status, headers,
+                             body)
+        return Response(response.status, headers, body)
+
+    def close(self):
+        self.connection.close()
+
+    def set_tunnel(self, *args, **kwargs):
+        self.connection.set_tunnel(*args, **kwargs)
+
+
+class RateLimiter(object):
+    """Schedules requests according to GitHub's rate limit.
+
+    The X-RateLimit headers of every response tell how many requests are
+    left until the limit resets. While plenty are left requests go out
+    unhindered, once the quota runs low they are spread over the rest of the
+    window, and when it is used up we wait for the reset instead of failing.
+
+    Requests refused for a secondary rate limit, which GitHub applies to
+    bursts of requests and of writes in particular, are retried after the
+    time GitHub asks for, all requests pause in the meantime.
+
+    A budget optionally caps the requests of a sweep. Responses answered
+    with 304 Not Modified do not count against either.
+    """
+
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.used = 0
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.next_request_at = 0
+        self.lock = threading.Lock()
+
+    def interval(self, now):
+        """Returns the seconds to leave between two requests"""
+        if self.remaining is None or self.reset is None:
+            return 0
+        if self.remaining > self.limit * LOW_QUOTA_SHARE:
+            return 0
+        return max(0, self.reset - now) / max(self.remaining, 1)
+
+    def wait(self):
+        """Blocks until the next request may be sent"""
+        with self.lock:
+            now = time.time()
+            if self.remaining == 0 and self.reset and self.reset > now:
+                start = self.reset + 1
+                sys.stderr.write("Rate limit exhausted, waiting %d seconds "
+                                 "for the reset\n" % (start - now))
+            else:
+                start = max(now, self.next_request_at)
+            self.next_request_at = start + self.interval(start)
+        if start > now:
+            time.sleep(start - now)
+
+    def update(self, status, headers):
+        """Takes note of a response"""
+        with self.lock:
+            if status != 304:
+                self.used += 1
+            if 'x-ratelimit-remaining' in headers:
+                self.limit = int(headers['x-ratelimit-limit'])
+                self.remaining = int(headers['x-ratelimit-remaining'])
+                self.reset = int(headers['x-ratelimit-reset'])
+
+    def is_rate_limited(self, status):
+        """Returns True if a response was refused due to the rate limit"""
+        return status == 403 and self.remaining == 0
+
+    def retry_after(self, status, headers, content):
+        """Returns the seconds to wait before retrying a request refused for
+        a secondary rate limit, None if it was not"""
+        if status not in (403, 429) or self.is_rate_limited(status):
+            return None
+        if 'retry-after' in headers:
+            return int(headers['retry-after'])
+        content = content.lower()
+        if 'secondary rate limit' in content or 'abuse' in content:
+            return SECONDARY_LIMIT_WAIT
+        return None
+
+    def pause(self, seconds):
+        """Holds back all requests for some seconds"""
+        with self.lock:
+            self.next_request_at = max(self.next_request_at,
+                                       time.time() + seconds)
+
+    def budget_left(self):
+        """Returns the requests left in the budget, or None without one"""
+        if self.budget is None:
+            return None
+        return max(0, self.budget - self.used)
+
+    def is_exhausted(self):
+        """Returns True if the budget of the sweep is used up"""
+        return self.budget is not None and self.used >= self.budget
+
+    def is_low(self):
+        """Returns True if optional requests should rather not be made"""
+        if self.budget is not None:
+            if self.budget_left() < self.budget * LOW_QUOTA_SHARE:
+                return True
+        if self.remaining is not None and self.limit:
+            return self.remaining < self.limit * LOW_QUOTA_SHARE
+        return False
+
+
+class SessionConnection(object):
+    """httplib style connection sending requests through a shared session"""
+
+    session = None
+    rate_limiter = None
+    meter = None
+    scheme = 'https'
+
+    def __init__(self, host, port=None, strict=None, timeout=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self.response = None
+
+    def set_tunnel(self, host, port=None, headers=None):
+        # requests reads the proxy settings from the environment itself
+        self.host = host
+        self.port = port
+
+    def request(self, verb, url, body=None, headers=None):
+        netloc = self.host
+        if self.port:
+            netloc = '%s:%s' % (self.host, self.port)
+        # PyGithub sends a JSON null along with every GET
+        if verb in ('GET', 'HEAD') and body == 'null':
+            body = None
+        retries = 0
+        while True:
+            self.rate_limiter.wait()
+            self.response = self.session.request(
+                verb, '%s://%s%s' % (self.scheme, netloc, url), data=body,
+                headers=headers, timeout=self.timeout, allow_redirects=False,
+            )
+            status = self.response.status_code
+            self.rate_limiter.update(status, self.response.headers)
+            if self.meter:
+                self.meter.count_request(len(self.response.content))
+            if self.rate_limiter.is_rate_limited(status):
+                continue
+            retry_after = self.rate_limiter.retry_after(
+                status, self.response.headers, self.response.content
+            )
+            if retry_after is None or retries >= MAX_SECONDARY_RETRIES:
+                break
+            retries += 1
+            sys.stderr.write("Secondary rate limit hit, waiting %d seconds\n"
+                             % retry_after)
+            self.rate_limiter.pause(retry_after)
+
+    def getresponse(self):
+        response = self.response
+        return Response(response.status_code,
+                        list(response.headers.items()),
+                        response.content)
+
+    def close(self):
+        # The connection stays in the session's pool
+        self.response = None
+
+
+class CassetteError(Exception):
+    """Raised when a replayed request was not recorded"""
+
+
+class Cassette(object):
+    """Requests and responses of a run, stored as gzipped JSON.
+
+    Responses are kept per request in the order they were received. A
+    replay serves them in the same order and repeats the last one once a
+    request is made more often than during recording, so PRs whose
+    mergeable state is polled see the same sequence of answers.
+
+    Request headers, and with them the credentials, are not stored.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, base_url=None):
+        self.path = path
+        self.base_url = base_url
+        self.interactions = OrderedDict()
+        self.served = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """Reads a recorded cassette"""
+        with gzip.open(path, 'rb') as f:
+            data = json.loads(f.read().decode('utf-8'))
+        if data.get('version') != cls.VERSION:
+            raise CassetteError("%s: unsupported cassette version %s"
+                                % (path, data.get('version')))
+        cassette = cls(path, base_url=data['base_url'])
+        for interaction in data['interactions']:
+            cassette.interactions[interaction['request']] = \
+                interaction['responses']
+        return cassette
+
+    def save(self):
+        """Writes the cassette to disk"""
+        with self.lock:
+            data = {
+                'version': self.VERSION,
+                'base_url': self.base_url,
+                'interactions': [
+                    {'request': request, 'responses': responses}
+                    for request, responses in self.interactions.items()
+                ],
+            }
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + '.tmp'
+        with gzip.open(tmp_path, 'wb') as f:
+            f.write(json.dumps(data).encode('utf-8'))
+        os.rename(tmp_path, self.path)
+
+    def request_key(self, verb, url, body):
+        """Returns the key identifying a request"""
+        key = '%s %s' % (verb, url)
+        if body and body != 'null':
+            if not isinstance(body, bytes):
+                body = body.encode('utf-8')
+            key += ' ' + hashlib.sha1(body).hexdigest()[:12]
+        return key
+
+    def record(self, key, status, headers, body, elapsed):
+        with self.lock:
+            self.interactions.setdefault(key, []).append({
+                'status': status,
+                'headers': list(headers),
+                'body': (body.decode('utf-8') if isinstance(body, bytes)
+                         else body),
+                'elapsed': round(elapsed, 4),
+            })
+
+    def play(self, key):
+        """Returns the next recorded response to a request"""
+        with self.lock:
+            responses = self.interactions.get(key)
+            if not responses:
+                raise CassetteError("%s: request not recorded: %s"
+                                    % (self.path, key))
+            index = self.served.get(key, 0)
+            self.served[key] = index + 1
+            return responses[min(index, len(responses) - 1)]
+
+
+class RecordingConnection(object):
+    """httplib connection wrapper adding all traffic to a cassette"""
+
+    connection_class = None
+    cassette = None
+
+    def __init__(self, host, port=None, **kwargs):
+        self.connection = self.connection_class(host, port, **kwargs)
+        self.key = None
+        self.started_at = None
+
+    def request(self, verb, url, body=None, headers=None):
+        self.key = self.cassette.request_key(verb, url, body)
+        self.started_at = time.time()
+        self.connection.request(verb, url, body, headers)
+
+    def getresponse(self):
+        response = self.connection.getresponse()
+        headers = response.getheaders()
+        body = response.read()
+        self.cassette.record(self.key, response.status, headers, body,
+                             time.time() - self.started_at)
+        return Response(response.status, headers, body)
+
+    def close(self):
+        self.connection.close()
+
+    def set_tunnel(self, *args, **kwargs):
+        self.connection.set_tunnel(*args, **kwargs)
+
+
+class ReplayConnection(object):
+    """httplib style connection serving responses from a cassette.
+
+    Nothing is sent over the network. If latency is set, every response is
+    delayed by that many seconds to mimic a round trip to GitHub.
+    """
+
+    cassette = None
+    rate_limiter = None
+    meter = None
+    latency = None
+
+    def __init__(self, host, port=None, strict=None, timeout=None):
+        self.recorded = None
+
+    def set_tunnel(self, host, port=None, headers=None):
+        pass
+
+    def request(self, verb, url, body=None, headers=None):
+        self.recorded = self.cassette.play(
+            self.cassette.request_key(verb, url, body)
+        )
+
+    def getresponse(self):
+        if self.latency:
+            time.sleep(self.latency)
+        recorded = self.recorded
+        headers = [tuple(header) for header in recorded['headers']]
+        # The rate limiter sees the quota as it was during recording
+        self.rate_limiter.update(recorded['status'],
+                                 dict((k.lower(), v) for k, v in headers))
+        body = recorded['body']
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        if self.meter:
+            self.meter.count_request(len(body))
+        return Response(recorded['status'], headers, body)
+
+    def close(self):
+        self.recorded = None
+
+
+def install(session, rate_limiter, cache=None, cassette=None, replay=False,
+            replay_latency=None, meter=None):
+    """Routes all PyGithub requests through session and, if given, cache.
+    This applies to the whole process, replacing any earlier install().
+
+    With a cassette, the traffic is recorded into it, or with replay set,
+    served from it instead of the network. Requests actually made are
+    reported to meter, an instrument.Meter.
+    """
+    classes = []
+    for scheme in ('http', 'https'):
+        if replay:
+            classes.append(type('Replay%sConnection' % scheme.upper(),
+                                (ReplayConnection,),
+                                {'cassette': cassette,
+                                 'rate_limiter': rate_limiter,
+                                 'meter': meter,
+                                 'latency': replay_latency}))
+            continue
+        connection_class = type('Session%sConnection' % scheme.upper(),
+                                (SessionConnection,),
+                                {'session': session, 'scheme': scheme,
+                                 'rate_limiter': rate_limiter,
+                                 'meter': meter})
+        if cache:
+            connection_class = type(
+                'Caching%sConnection' % scheme.upper(), (CachingConnection,),
+                {'connection_class': connection_class, 'cache': cache}
+            )
+        if cassette:
+            # Records what PyGithub sees, so a replay does not depend on
+            # the state of the response cache
+            connection_class = type(
+                'Recording%sConnection' % scheme.upper(),
+                (RecordingConnection,),
+                {'connection_class': connection_class, 'cassette': cassette}
+            )
+        classes.append(connection_class)
+    github.Requester.Requester.injectConnectionClasses(*classes)
+
+
+class GithubClient(object):
+    """The connection to GitHub shared by every code path of a process.
+
+    It owns a requests session whose connection pool keeps up to pool_size
+    connections per host alive, the rate limiter scheduling all requests,
+    and the Github object built on top of it.
+
+    Given a Cassette, all traffic is recorded into it, or with replay set,
+    served from it. A replay uses the base URL of the recording, as PyGithub
+    follows the absolute pagination links in the recorded responses.
+
+    There can only be one client in use at a time: PyGithub takes its
+    connection classes process-wide, see install(), so creating a client
+    routes the traffic of all earlier ones through the session, cache and
+    cassette of the new one. The Triage of several repos share one client.
+    """
+
+    def __init__(self, login_or_token=None, password=None,
+                 base_url=DEFAULT_BASE_URL, pool_size=DEFAULT_POOL_SIZE,
+                 cache=None, budget=None, cassette=None, replay=False,
+                 replay_latency=None, meter=None):
+        if cassette and replay:
+            base_url = cassette.base_url
+            cache = None
+        elif cassette:
+            cassette.base_url = base_url
+        self.base_url = base_url
+        self.cache = cache
+        self.cassette = cassette
+        self.meter = meter
+        self.rate_limiter = RateLimiter(budget=budget)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4,
+                                                pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        install(self.session, self.rate_limiter, cache=cache,
+                cassette=cassette, replay=replay,
+                replay_latency=replay_latency, meter=meter)
+        self.github = Github(login_or_token=login_or_token,
+                             password=password, base_url=base_url)
+
+    @property
+    def requester(self):
+        """The Requester of the Github object, for the requests and
+        PyGithub objects made without it"""
+        return self.github._Github__requester
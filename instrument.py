@@ -0,0 +1,178 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""Timing and API call accounting of triage runs.
+
+A Meter keeps, per rule step and per PR, the wall time spent and the HTTP
+requests and bytes received. Steps nest: a step entered inside another is
+accounted under the path of both, e.g. 'comments/ansible_member', and its
+requests count for the enclosing step too. The HTTP layer reports every
+request with count_request() and it is attributed to whatever step and PR
+the requesting thread is in.
+"""
+
+from __future__ import print_function
+
+import functools
+import numbers
+import threading
+import time
+from contextlib import contextmanager
+
+# Rows of each table of the summary
+DEFAULT_TOP = 10
+
+
+class Totals(object):
+    __slots__ = ('seconds', 'calls', 'bytes', 'count')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.bytes = 0
+        self.count = 0
+
+
+class Meter(object):
+    """Accounts time, requests and bytes by step and by PR"""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.steps = {}
+        self.pull_requests = {}
+        self.calls = 0
+        self.bytes = 0
+        self.started_at = time.time()
+
+    def _context(self):
+        local = self.local
+        if not hasattr(local, 'steps'):
+            local.steps = []
+            local.pull_request = None
+        return local
+
+    def _totals(self, table, key):
+        totals = table.get(key)
+        if totals is None:
+            totals = table[key] = Totals()
+        return totals
+
+    def count_request(self, size):
+        """Takes note of an HTTP request answered with size bytes"""
+        context = self._context()
+        with self.lock:
+            self.calls += 1
+            self.bytes += size
+            for path in context.steps:
+                totals = self._totals(self.steps, path)
+                totals.calls += 1
+                totals.bytes += size
+            if context.pull_request is not None:
+                totals = self._totals(self.pull_requests,
+                                      context.pull_request)
+                totals.calls += 1
+                totals.bytes += size
+
+    @contextmanager
+    def step(self, name):
+        """Accounts everything done inside to the step name"""
+        context = self._context()
+        if context.steps:
+            path = context.steps[-1] + '/' + name
+        else:
+            path = name
+        context.steps.append(path)
+        start = time.time()
+        try:
+            yield
+        finally:
+            context.steps.pop()
+            elapsed = time.time() - start
+            with self.lock:
+                totals = self._totals(self.steps, path)
+                totals.seconds += elapsed
+                totals.count += 1
+
+    @contextmanager
+    def pull_request(self, number):
+        """Accounts everything done inside to the PR number"""
+        context = self._context()
+        previous = context.pull_request
+        context.pull_request = number
+        start = time.time()
+        try:
+            yield
+        finally:
+            context.pull_request = previous
+            elapsed = time.time() - start
+            with self.lock:
+                totals = self._totals(self.pull_requests, number)
+                totals.seconds += elapsed
+                totals.count += 1
+
+    def summary(self, top=DEFAULT_TOP):
+        """Returns the end of run summary as a list of lines"""
+        elapsed = time.time() - self.started_at
+        lines = [
+            "Run: %d PRs, %d API calls, %s received in %.1f s" % (
+                len(self.pull_requests), self.calls, format_bytes(self.bytes),
+                elapsed),
+            "Most expensive steps:",
+            "  %-36s %8s %6s %9s %9s" % ('step', 'seconds', 'calls',
+                                        'received', 'runs'),
+        ]
+        steps = sorted(self.steps.items(),
+                       key=lambda item: (item[1].seconds, item[1].calls),
+                       reverse=True)
+        for path, totals in steps[:top]:
+            lines.append("  %-36s %8.2f %6d %9s %9d" % (
+                path, totals.seconds, totals.calls,
+                format_bytes(totals.bytes), totals.count))
+        lines.append("Slowest PRs:")
+        pull_requests = sorted(self.pull_requests.items(),
+                               key=lambda item: item[1].seconds,
+                               reverse=True)
+        for key, totals in pull_requests[:top]:
+            # Numbers, or repo#number for PRs of several repos
+            if isinstance(key, numbers.Integral):
+                key = '#%s' % key
+            lines.append("  %-9s %8.2f s %6d calls %9s" % (
+                key, totals.seconds, totals.calls,
+                format_bytes(totals.bytes)))
+        return lines
+
+
+def format_bytes(size):
+    for unit in ('B', 'kB', 'MB'):
+        if size < 1024:
+            return '%d %s' % (size, unit)
+        size /= 1024.0
+    return '%.1f GB' % size
+
+
+def step(name):
+    """Decorator accounting a method to step name of the Meter found in
+    the meter attribute of its instance"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.meter is None:
+                return method(self, *args, **kwargs)
+            with self.meter.step(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
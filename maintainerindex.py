@@ -0,0 +1,146 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""Lookup of module maintainers from MAINTAINERS files.
+
+Every line of a MAINTAINERS file maps an owner namespace to the logins of
+its maintainers. An owner namespace ending in '/' is a directory, any other
+is a prefix of the names of the files it covers, usually a whole module
+path:
+
+    cloud/amazon/ec2_ami.py: jjshoe
+    cloud/openstack/: emonty shrews
+    monitoring/zabbix_: eikef
+
+The entries are compiled into a trie over path components, so the owners
+of a file are found by walking its path once. A file is maintained by the
+maintainers of every entry covering it, outer entries first, so a module
+with an entry of its own still pings the maintainers of its directory.
+"""
+
+import os
+
+
+class Node(object):
+    __slots__ = ('children', 'maintainers', 'prefixes')
+
+    def __init__(self):
+        self.children = {}
+        self.maintainers = None
+        # Maintainers by prefix of the names of the entries in the directory
+        self.prefixes = {}
+
+
+def split_path(path):
+    return [part for part in path.strip().split('/') if part]
+
+
+class MaintainersIndex(object):
+    """Path prefix trie of the entries of one MAINTAINERS file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.root = Node()
+        self.entries = 0
+        self.load()
+
+    def load(self):
+        """(Re)reads the MAINTAINERS file"""
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path) as f:
+            self.build(f)
+        self.mtime = mtime
+
+    def build(self, lines):
+        """Builds the trie from MAINTAINERS lines"""
+        self.root = Node()
+        self.entries = 0
+        # Equal maintainer lists share one tuple
+        maintainer_sets = {}
+        for line in lines:
+            if ': ' not in line:
+                continue
+            owner_space, maintainers_string = line.split(': ', 1)
+            maintainers = tuple(maintainers_string.split())
+            maintainers = maintainer_sets.setdefault(maintainers, maintainers)
+            parts = split_path(owner_space)
+            if not parts:
+                continue
+            prefix = None
+            if not owner_space.strip().endswith('/'):
+                prefix = parts.pop()
+            node = self.root
+            for part in parts:
+                node = node.children.setdefault(part, Node())
+            if prefix is None:
+                node.maintainers = maintainers
+            else:
+                node.prefixes[prefix] = maintainers
+            self.entries += 1
+
+    def reload_if_changed(self):
+        """Rereads the file if it was modified since it was loaded"""
+        if os.stat(self.path).st_mtime != self.mtime:
+            self.load()
+
+    def lookup(self, filename):
+        """Returns the maintainers of all entries covering filename, outer
+        entries first, without duplicates"""
+        matches = []
+        node = self.root
+        for part in split_path(filename):
+            if node.prefixes:
+                for end in range(1, len(part) + 1):
+                    prefix_maintainers = node.prefixes.get(part[:end])
+                    if prefix_maintainers is not None:
+                        matches.append(prefix_maintainers)
+            node = node.children.get(part)
+            if node is None:
+                break
+            if node.maintainers is not None:
+                matches.append(node.maintainers)
+        if len(matches) == 1:
+            return matches[0]
+        maintainers = []
+        for entry in matches:
+            for maintainer in entry:
+                if maintainer not in maintainers:
+                    maintainers.append(maintainer)
+        return tuple(maintainers)
+
+    def lookup_all(self, filenames):
+        """Returns the maintainers of all filenames, without duplicates"""
+        result = []
+        for filename in filenames:
+            for maintainer in self.lookup(filename):
+                if maintainer not in result:
+                    result.append(maintainer)
+        return result
+
+
+_indexes = {}
+
+
+def load(path):
+    """Returns the index of a MAINTAINERS file, rereading it only when the
+    file changed since the last call"""
+    index = _indexes.get(path)
+    if index is None:
+        index = _indexes[path] = MaintainersIndex(path)
+    else:
+        index.reload_if_changed()
+    return index
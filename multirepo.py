@@ -0,0 +1,131 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""Triage of several repositories in one process.
+
+The repositories are listed in a JSON file, see repos.json:
+
+    {"repos": [
+        {"name": "core", "repo": "ansible/ansible-modules-core",
+         "maintainers": "MAINTAINERS-CORE.txt", "weight": 2},
+        {"name": "extras", "repo": "ansible/ansible-modules-extras",
+         "maintainers": "MAINTAINERS-EXTRAS.txt",
+         "namespace_labels": {"cloud": "cloud"},
+         "static_labels": ["easyfix"]}
+    ]}
+
+name names the state files of a repo and defaults to the last part of
+repo. weight is the share of the process a repo gets, 1 by default.
+namespace_labels and static_labels are its label policy, by default
+MODULE_NAMESPACE_LABELS and IGNORE_LABELS of triage.py.
+
+The sweeps of all repos share one GitHub client, one membership cache and
+one comment command cache. They are interleaved a PR at a time by stride
+scheduling: the next PR is taken from the repo which used the least of its
+share so far. With the fair policy a PR uses the API calls it took, with
+round-robin every PR counts the same.
+"""
+
+import json
+import time
+
+POLICIES = ('fair', 'round-robin')
+DEFAULT_POLICY = 'fair'
+
+# Yielded by a sweep which has nothing to do but wait
+WAITING = object()
+
+# Seconds slept when every sweep is waiting
+IDLE_SLEEP = 0.5
+
+
+def load_config(path):
+    """Returns the repos listed in the JSON file path as dicts with all
+    keys set, raises ValueError if the file makes no sense"""
+    with open(path) as f:
+        config = json.load(f)
+    entries = config.get('repos') if isinstance(config, dict) else None
+    if not entries:
+        raise ValueError("%s: no repos listed" % path)
+    repos = []
+    names = set()
+    for entry in entries:
+        if '/' not in entry.get('repo', ''):
+            raise ValueError("%s: repo must be given as owner/name" % path)
+        name = entry.get('name') or entry['repo'].split('/')[-1]
+        if name in names:
+            raise ValueError("%s: repo name %s is used twice" % (path, name))
+        names.add(name)
+        if not entry.get('maintainers'):
+            raise ValueError("%s: %s: no maintainers file" % (path, name))
+        weight = entry.get('weight', 1)
+        if not isinstance(weight, (int, float)) or weight <= 0:
+            raise ValueError("%s: %s: weight must be a positive number" %
+                             (path, name))
+        repos.append({
+            'name': name,
+            'repo': entry['repo'],
+            'maintainers': entry['maintainers'],
+            'weight': float(weight),
+            'namespace_labels': entry.get('namespace_labels'),
+            'static_labels': entry.get('static_labels'),
+        })
+    return repos
+
+
+class Scheduler(object):
+    """Interleaves sweeps by stride scheduling.
+
+    A sweep is an iterator stepping through the PRs of a repo, yielding
+    WAITING when all it has left is waiting. cost is called around every
+    step, the difference being what the step used. Without it, every step
+    uses 1.
+    """
+
+    def __init__(self, cost=None):
+        self.cost = cost
+        # [used / weight, sequence, key, weight, steps]
+        self.sweeps = []
+
+    def add(self, key, weight, steps):
+        self.sweeps.append([0.0, len(self.sweeps), key, weight, steps])
+
+    def run(self):
+        """Runs the sweeps to their end, yielding the key of each as it
+        ends"""
+        active = list(self.sweeps)
+        # Sweeps which waited since the last step of any sweep
+        waiting = set()
+        while active:
+            ready = [sweep for sweep in active if sweep[1] not in waiting]
+            if not ready:
+                time.sleep(IDLE_SLEEP)
+                waiting.clear()
+                continue
+            sweep = min(ready)
+            before = self.cost() if self.cost else 0
+            try:
+                step = next(sweep[4])
+            except StopIteration:
+                active.remove(sweep)
+                yield sweep[2]
+                continue
+            if step is WAITING:
+                waiting.add(sweep[1])
+                continue
+            waiting.clear()
+            used = self.cost() - before if self.cost else 1
+            sweep[0] += max(used, 1) / sweep[3]
@@ -1,7 +1,7 @@
 #!/usr/bin/python
 
 # Very simple reporting script for status of new modules in Ansible extras. 
-# No auth, no args. Just pulling basic query data and parsing it for reporting
+# No auth, no args except --base-url. Just pulling basic query data and parsing it for reporting
 # to the Ansible community (ansible-project and ansible-devel mailing lists).
 #
 # Will use the new_issue_alert.j2 template.
@@ -11,42 +11,50 @@
 #  * In loop: Pick out oldest unreviewed PRs by issue['created_at'] (in community review)
 #  * Be sure to include individual URLs ['pull_request']['html_url']
 
-import os, requests, json, sys, argparse, time
+import os, json, sys, argparse, time, calendar
 
+import github.Issue
+import github.PaginatedList
 from jinja2 import Environment, FileSystemLoader
 
+import ghclient
+import instrument
+
 loader = FileSystemLoader(os.path.join(os.path.dirname(__file__), 'templates'))
 environment = Environment(loader=loader, trim_blocks=True)
 
-repo_url = 'https://api.github.com/repos/ansible/ansible-modules-extras/issues?labels=new_plugin'
-args = {'state':'open', 'page':1}
+parser = argparse.ArgumentParser(description="Report the status of new "
+                                             "module PRs")
+parser.add_argument("--base-url", type=str, default=ghclient.DEFAULT_BASE_URL,
+                    help="URL of the GitHub API")
+options = parser.parse_args()
 
-# Get number of pages 
-r = requests.get(repo_url, params=args)
-try:
-    lastpage = int(str(r.links['last']['url']).split('=')[-1])
-except:
-    lastpage = 1
+# Requests go through the rate limiter and meter of the client
+meter = instrument.Meter()
+client = ghclient.GithubClient(base_url=options.base_url, meter=meter)
+repo = client.github.get_repo('ansible/ansible-modules-extras')
+issues = github.PaginatedList.PaginatedList(
+    github.Issue.Issue,
+    client.requester,
+    repo.url + '/issues',
+    {'state':'open', 'labels':'new_plugin', 'per_page':100}
+)
 
 total_prs = 0
 latest_module_string = ''
 oldest_module_string = ''
 oldest_module_time = time.time()
 
-for page in range(1,lastpage):
-    pull_args = {'state':'open', 'page':page}
-    r = requests.get(repo_url, params=pull_args)
-
-    for issue in r.json():
-        total_prs += 1
-        issue_time = time.mktime((time.strptime(issue['created_at'], "%Y-%m-%dT%H:%M:%SZ")))
-        issue_age = int((time.time()-issue_time)/86400)
-        if issue_age < 7:
-            latest_module_string += issue['title'] + "\n"
-            latest_module_string += issue['html_url'] + "\n\n"
-        if issue_time < oldest_module_time:
-            oldest_module_time = issue_time
-            oldest_module_string = issue['title'] + " (" + str(issue_age) + " days old)\n" + issue['html_url']+ "\n\n"
+for issue in issues:
+    total_prs += 1
+    issue_time = calendar.timegm(issue.created_at.timetuple())
+    issue_age = int((time.time()-issue_time)/86400)
+    if issue_age < 7:
+        latest_module_string += issue.title + "\n"
+        latest_module_string += issue.html_url + "\n\n"
+    if issue_time < oldest_module_time:
+        oldest_module_time = issue_time
+        oldest_module_string = issue.title + " (" + str(issue_age) + " days old)\n" + issue.html_url+ "\n\n"
             
 
 # Final report
@@ -57,4 +65,6 @@ for page in range(1,lastpage):
 template = environment.get_template('new_issue_alert.j2')
 comment = template.render(total_prs=total_prs, latest_module_string=latest_module_string, oldest_module_string = oldest_module_string)
 print comment.encode('ascii','ignore')
+# API calls and time of the run
+print >>sys.stderr, meter.summary()[0]
 
@@ -0,0 +1,223 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""Pipelined triage run for non-interactive sweeps.
+
+A sweep is split into three stages connected by bounded queues:
+
+  fetch   a pool of worker threads loading all data of a PR
+  decide  the existing rules, run one PR at a time in listing order, PRs
+          waiting for their mergeable state are picked up once it is known
+  act     a single thread handing the actions to the writer threads of
+          Triage.action_queue and printing the output
+
+Output of every PR is buffered and printed by the act stage once the PR is
+done, so logs read exactly like those of a serial run.
+"""
+
+from __future__ import print_function
+
+import sys
+import threading
+
+try:
+    import Queue as queue
+    from StringIO import StringIO
+except ImportError:
+    import queue
+    from io import StringIO
+
+DEFAULT_WORKERS = 4
+
+# Sentinel closing a queue
+DONE = object()
+
+
+class ThreadOutput(object):
+    """sys.stdout replacement letting a thread divert its output"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self, buffer):
+        self.local.buffer = buffer
+
+    def release(self):
+        self.local.buffer = None
+
+    def write(self, data):
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is not None:
+            buffer.write(data)
+        else:
+            self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class WorkItem(object):
+    """A PR travelling through the pipeline"""
+
+    def __init__(self, seq, pull):
+        self.seq = seq
+        self.pull = pull
+        self.pull_request = None
+        self.actions = None
+        self.output = StringIO()
+        self.error = None
+        self.fetched = threading.Event()
+
+
+class Pipeline(object):
+    """Runs Triage over a list of pulls with concurrent fetching"""
+
+    def __init__(self, triage, make_pull_request, workers=DEFAULT_WORKERS,
+                 queue_size=None):
+        self.triage = triage
+        self.make_pull_request = make_pull_request
+        self.workers = workers
+        self.queue_size = queue_size or workers * 2
+
+        # Bounds the number of PRs between listing and the decide stage
+        self.in_flight = threading.Semaphore(self.queue_size)
+        self.fetch_queue = queue.Queue(maxsize=self.queue_size)
+        self.decide_queue = queue.Queue(maxsize=self.queue_size)
+        self.act_queue = queue.Queue(maxsize=self.queue_size)
+        self.error = None
+
+    def list_pulls(self, pulls):
+        """Feeds the fetch and decide stages in listing order"""
+        try:
+            for seq, pull in enumerate(pulls):
+                if self.error:
+                    break
+                self.in_flight.acquire()
+                item = WorkItem(seq, pull)
+                self.decide_queue.put(item)
+                self.fetch_queue.put(item)
+        except Exception as e:
+            self.error = e
+        finally:
+            for _ in range(self.workers):
+                self.fetch_queue.put(DONE)
+            self.decide_queue.put(DONE)
+
+    def fetch(self):
+        """Fetch stage worker"""
+        while True:
+            item = self.fetch_queue.get()
+            if item is DONE:
+                return
+            self.output.capture(item.output)
+            try:
+                with self.triage.meter.pull_request(
+                        self.triage.meter_key(item.pull.number)):
+                    item.pull_request = self.make_pull_request(item.pull)
+                    item.pull_request.prefetch(
+                        skip_optional=self.triage.should_defer_fetches(
+                            item.pull_request
+                        )
+                    )
+            except Exception as e:
+                item.error = e
+            finally:
+                self.output.release()
+                item.fetched.set()
+
+    def act(self):
+        """Action stage, queues actions for writing and prints output in
+        order"""
+        while True:
+            item = self.act_queue.get()
+            if item is DONE:
+                return
+            if item.actions and not self.error:
+                self.triage.queue_actions(item.pull_request, item.actions)
+            self.output.stream.write(item.output.getvalue())
+            self.output.flush()
+
+    def decide_item(self, item):
+        """Runs the rules on one PR and hands it to the act stage"""
+        self.triage.pull_request = item.pull_request
+        self.triage.deferred_actions = None
+        self.output.capture(item.output)
+        try:
+            self.triage.triage_pull_request()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.output.release()
+        item.actions = self.triage.deferred_actions
+        self.act_queue.put(item)
+
+    def decide_deferred(self, wait=False):
+        """Runs the rules on PRs which were waiting for their mergeable
+        state, see Triage.due_deferred()"""
+        try:
+            for pull_request in self.triage.due_deferred(wait=wait):
+                if self.error:
+                    break
+                item = WorkItem(None, None)
+                item.pull_request = pull_request
+                self.decide_item(item)
+        except Exception as e:
+            self.error = e
+
+    def decide(self):
+        """Decide stage, runs the rules on fetched PRs in listing order"""
+        while True:
+            item = self.decide_queue.get()
+            if item is DONE:
+                break
+            item.fetched.wait()
+            self.in_flight.release()
+            if self.error:
+                continue
+            if item.error:
+                self.error = item.error
+                continue
+            self.decide_item(item)
+            self.decide_deferred()
+        if not self.error:
+            self.decide_deferred(wait=True)
+
+    def run(self, pulls):
+        """Runs the pipeline until all pulls are processed"""
+        self.output = ThreadOutput(sys.stdout)
+        sys.stdout = self.output
+        self.triage.defer_actions = True
+
+        threads = [threading.Thread(target=self.list_pulls, args=(pulls,))]
+        threads.extend(threading.Thread(target=self.fetch)
+                       for _ in range(self.workers))
+        actor = threading.Thread(target=self.act)
+        threads.append(actor)
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            self.decide()
+        finally:
+            self.act_queue.put(DONE)
+            actor.join()
+            sys.stdout = self.output.stream
+            self.triage.defer_actions = False
+
+        if self.error:
+            raise self.error
@@ -13,6 +13,8 @@
 
 import requests, json, yaml, sys, argparse, time, signal
 
+import maintainerindex
+
 # Here's a nasty hack to get around the occasional ssl handshake
 # timeout.  Thanks, ssl!
 
@@ -174,18 +176,11 @@ def triage(urlstring):
     # Look up the files in the local DB to see who maintains them.
     # (Warn if there's more than one; we can't handle that case yet.)
     #----------------------------------------------------------------------------
-    pr_maintainers_list = []
     if ghrepo == "core":
-        f = open('MAINTAINERS-CORE.txt')
+        index = maintainerindex.load('MAINTAINERS-CORE.txt')
     elif ghrepo == "extras":
-        f = open('MAINTAINERS-EXTRAS.txt')
-    for line in f:
-        owner_space = (line.split(': ')[0]).strip()
-        if owner_space in pr_filename:
-            maintainers_string = (line.split(': ')[-1]).strip()
-            for maintainer in maintainers_string.split(' '):
-                pr_maintainers_list.append(maintainer)
-    f.close()
+        index = maintainerindex.load('MAINTAINERS-EXTRAS.txt')
+    pr_maintainers_list = index.lookup_all([pr_filename])
 
     pr_maintainers = ' '.join(pr_maintainers_list)
 
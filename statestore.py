@@ -0,0 +1,387 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""Small on-disk stores for state kept between triage runs."""
+
+import bisect
+import json
+import os
+import threading
+import time
+
+DEFAULT_STATE_DIR = os.path.expanduser("~/.ansibullbot/state")
+
+# Seconds an organization membership answer is trusted
+DEFAULT_MEMBERSHIP_TTL = 24 * 3600
+
+# Head and base commit pairs whose states are remembered
+DEFAULT_MAX_COMMIT_STATES = 20000
+
+# Seconds after its start an interrupted sweep is still resumed
+DEFAULT_JOURNAL_MAX_AGE = 24 * 3600
+
+# Seconds covered by one slot of a TimerWheel
+DEFAULT_TIMER_SLOT = 3600
+
+
+class JsonStore(object):
+    """A dict persisted as a JSON file.
+
+    Keys are always strings, as JSON does not know anything else. The file
+    is only written on save(), and atomically, so an interrupted run leaves
+    the previous state intact.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        self.load()
+
+    def load(self):
+        """(Re)reads the store from disk"""
+        try:
+            with open(self.path) as f:
+                self.data = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.data = {}
+
+    def save(self):
+        """Writes the store to disk"""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def get(self, key, default=None):
+        return self.data.get(str(key), default)
+
+    def set(self, key, value):
+        self.data[str(key)] = value
+
+    def delete(self, key):
+        self.data.pop(str(key), None)
+
+    def keys(self):
+        return self.data.keys()
+
+    def __contains__(self, key):
+        return str(key) in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class MembershipCache(object):
+    """Organization membership of users, remembered for ttl seconds.
+
+    Besides answers for single users, it remembers when the complete member
+    list was last loaded. While that listing is fresh, anybody not on it is
+    known not to be a member without asking the API.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_MEMBERSHIP_TTL):
+        self.store = JsonStore(path)
+        self.ttl = ttl
+
+    def is_fresh(self, timestamp):
+        return timestamp is not None and time.time() - timestamp < self.ttl
+
+    def listing_is_fresh(self):
+        """Returns True if the member listing is younger than the TTL"""
+        return self.is_fresh(self.store.get('_listed_at'))
+
+    def get(self, login):
+        """Returns True or False if membership of login is known, else None"""
+        entry = self.store.get('user:' + login.lower())
+        if entry and self.is_fresh(entry['checked_at']):
+            return entry['member']
+        if self.listing_is_fresh():
+            return False
+        return None
+
+    def set(self, login, member):
+        self.store.set('user:' + login.lower(), {
+            'member': member,
+            'checked_at': time.time(),
+        })
+
+    def set_members(self, logins):
+        """Replaces the cache with a complete member listing"""
+        self.store.data = {}
+        for login in logins:
+            self.set(login, True)
+        self.store.set('_listed_at', time.time())
+
+    def save(self):
+        self.store.save()
+
+
+class CommitStateCache(object):
+    """States GitHub computes for a PR's head and base commits.
+
+    The build state of a head commit and the mergeable state of a head and
+    base pair do not change once they are settled, so they are remembered
+    by (head SHA, base SHA) and not asked for again while neither moves.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_COMMIT_STATES):
+        self.store = JsonStore(path)
+        self.max_entries = max_entries
+
+    def key(self, head_sha, base_sha):
+        return '%s:%s' % (head_sha, base_sha)
+
+    def get(self, head_sha, base_sha):
+        """Returns the known states of a commit pair as a dict"""
+        entry = self.store.get(self.key(head_sha, base_sha))
+        if not entry:
+            return {}
+        return entry['states']
+
+    def update(self, head_sha, base_sha, **states):
+        """Remembers settled states of a commit pair"""
+        key = self.key(head_sha, base_sha)
+        entry = self.store.get(key) or {'states': {}}
+        entry['states'].update(states)
+        entry['stored_at'] = time.time()
+        self.store.set(key, entry)
+
+    def save(self):
+        """Drops the oldest entries beyond max_entries and writes the cache"""
+        if len(self.store) > self.max_entries:
+            newest = sorted(self.store.data.items(),
+                            key=lambda item: item[1]['stored_at'])
+            self.store.data = dict(newest[-self.max_entries:])
+        self.store.save()
+
+
+class TimerWheel(object):
+    """One timer per PR, persisted as a JSON file of due times.
+
+    Timers are kept in slots of slot seconds by their due time, so the due
+    ones are found without looking at the others, however many PRs have a
+    timer. Times are seconds since the epoch.
+    """
+
+    def __init__(self, path, slot=DEFAULT_TIMER_SLOT):
+        self.store = JsonStore(path)
+        self.slot = slot
+        # Slot index -> {number: due}, and the indexes in use, sorted
+        self.slots = {}
+        self.indexes = []
+        for number, due in self.store.data.items():
+            self.add(int(number), due)
+
+    def add(self, number, due):
+        index = int(due // self.slot)
+        slot = self.slots.get(index)
+        if slot is None:
+            slot = self.slots[index] = {}
+            bisect.insort(self.indexes, index)
+        slot[number] = due
+
+    def schedule(self, number, due):
+        """Sets the timer of the PR number to due, replacing any other"""
+        self.cancel(number)
+        self.store.set(number, due)
+        self.add(number, due)
+
+    def cancel(self, number):
+        """Drops the timer of the PR number, if any"""
+        due = self.store.get(number)
+        if due is None:
+            return
+        self.store.delete(number)
+        index = int(due // self.slot)
+        slot = self.slots[index]
+        del slot[number]
+        if not slot:
+            del self.slots[index]
+            self.indexes.remove(index)
+
+    def due(self, now=None):
+        """Returns the PRs whose timer is due as (number, due), earliest
+        first"""
+        if now is None:
+            now = time.time()
+        timers = []
+        for index in self.indexes:
+            if index * self.slot > now:
+                break
+            timers.extend(item for item in self.slots[index].items()
+                          if item[1] <= now)
+        return sorted(timers, key=lambda item: item[1])
+
+    def pop_due(self, now=None):
+        """Returns the due timers like due() and drops them"""
+        timers = self.due(now)
+        for number, _ in timers:
+            self.cancel(number)
+        return timers
+
+    def save(self):
+        self.store.save()
+
+
+class ActionJournal(object):
+    """Write-ahead log of a sweep, one JSON object per line.
+
+    The writes planned for a PR are logged before any of them is sent, and
+    every write once it went through. A PR is logged as finished once it
+    needs nothing more in this sweep, which makes the finished PRs the
+    cursor of the sweep. Every line is flushed to disk before returning.
+
+    A sweep that did not end, because the run died or was aborted, is
+    resumed by the next run: unfinished holds the plans of the PRs whose
+    writes were not all sent and finished the PRs that are done, with the
+    time they were done. A sweep older than max_age is not resumed. The
+    journal is removed once a sweep ends.
+    """
+
+    def __init__(self, path, max_age=DEFAULT_JOURNAL_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.file = None
+        self.reset()
+        self.load()
+
+    def reset(self):
+        # Start of the sweep, None when no sweep is going on
+        self.started_at = None
+        # Number -> {'writes': [...], 'written': set of indexes, 'at': time}
+        self.unfinished = {}
+        # Number -> time the PR was finished
+        self.finished = {}
+
+    def load(self):
+        """Reads the sweep the journal was left with"""
+        self.reset()
+        try:
+            with open(self.path, 'rb') as f:
+                lines = f.readlines()
+        except (IOError, OSError):
+            return
+        # Length of the lines read in one piece
+        intact = 0
+        for line in lines:
+            try:
+                entry = json.loads(line.decode('utf-8'))
+            except ValueError:
+                entry = None
+            # Only the last line, cut off by a crash, can be broken
+            if entry is None or not line.endswith(b"\n"):
+                break
+            self.replay(entry)
+            intact += len(line)
+        if intact < sum(len(line) for line in lines):
+            # The lines appended next would continue the broken one
+            with open(self.path, 'r+b') as f:
+                f.truncate(intact)
+        if (self.started_at is not None and
+                time.time() - self.started_at > self.max_age):
+            self.reset()
+
+    def replay(self, entry):
+        event = entry['event']
+        number = entry.get('pr')
+        if event == 'start':
+            self.reset()
+            self.started_at = entry['at']
+        elif event == 'end':
+            self.reset()
+        elif event == 'planned':
+            self.unfinished[number] = {
+                'writes': entry['writes'],
+                'written': set(),
+                'at': entry['at'],
+            }
+        elif event == 'written':
+            if number in self.unfinished:
+                self.unfinished[number]['written'].add(entry['index'])
+        elif event == 'failed':
+            self.unfinished.pop(number, None)
+        elif event == 'finished':
+            self.unfinished.pop(number, None)
+            self.finished[number] = entry['at']
+
+    def is_resuming(self):
+        """Returns True if an interrupted sweep is continued"""
+        return self.started_at is not None
+
+    def append(self, event, **fields):
+        if self.started_at is None:
+            # Outside of sweeps nothing is logged
+            return
+        fields['event'] = event
+        fields['at'] = time.time()
+        line = json.dumps(fields, sort_keys=True) + "\n"
+        with self.lock:
+            self.replay(fields)
+            if self.file is None:
+                self.file = open(self.path, 'a')
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def start(self):
+        """Starts a sweep, unless an interrupted one is resumed"""
+        if self.started_at is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path, 'w'):
+            pass
+        self.started_at = time.time()
+        self.append('start')
+
+    def planned(self, number, writes):
+        self.append('planned', pr=number, writes=writes)
+
+    def written(self, number, index):
+        self.append('written', pr=number, index=index)
+
+    def failed(self, number):
+        """Gives up the plan of a PR, the PR is triaged again instead"""
+        self.append('failed', pr=number)
+
+    def finish(self, number):
+        self.append('finished', pr=number)
+
+    def is_finished(self, number, updated_at):
+        """Returns True if the PR was finished in this sweep and has not
+        been updated since, updated_at being seconds since the epoch"""
+        finished_at = self.finished.get(number)
+        return finished_at is not None and updated_at <= finished_at
+
+    def end(self):
+        """Ends the sweep and drops the journal"""
+        self.close()
+        self.reset()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,145 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import github
+
+import actionqueue
+
+
+def make_actions(newlabel=(), unlabel=(), comments=()):
+    return {
+        'newlabel': list(newlabel),
+        'unlabel': list(unlabel),
+        'comments': list(comments),
+    }
+
+
+class Requester(object):
+    """Answers the writes sent with the statuses given, 200 after them"""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.calls = []
+
+    def requestJsonAndCheck(self, verb, url, input=None):
+        self.calls.append((verb, url, input))
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status != 200:
+            raise github.GithubException(status, {'message': 'error'})
+        return {}, None
+
+
+class PlanWritesTest(unittest.TestCase):
+
+    def test_no_actions(self):
+        self.assertEqual(actionqueue.plan_writes(make_actions()), [])
+
+    def test_new_labels_in_one_call(self):
+        self.assertEqual(
+            actionqueue.plan_writes(make_actions(newlabel=['cloud',
+                                                           'shipit'])),
+            [('POST', '/labels', ['cloud', 'shipit'])])
+
+    def test_removed_labels_one_by_one(self):
+        self.assertEqual(
+            actionqueue.plan_writes(make_actions(
+                unlabel=['needs_info', 'community review'])),
+            [('DELETE', '/labels/needs_info', None),
+             ('DELETE', '/labels/community%20review', None)])
+
+    def test_comments_in_one_call(self):
+        self.assertEqual(
+            actionqueue.plan_writes(make_actions(comments=['a', 'b'])),
+            [('POST', '/comments', {'body': 'a\n\nb'})])
+
+    def test_order(self):
+        writes = actionqueue.plan_writes(make_actions(
+            newlabel=['shipit'], unlabel=['needs_info'], comments=['a']))
+        self.assertEqual([(verb, path) for verb, path, _ in writes],
+                         [('DELETE', '/labels/needs_info'),
+                          ('POST', '/labels'),
+                          ('POST', '/comments')])
+
+    def test_labels_not_replaced(self):
+        writes = actionqueue.plan_writes(make_actions(
+            newlabel=['shipit'], unlabel=['needs_info']))
+        self.assertNotIn('PUT', [verb for verb, _, _ in writes])
+
+
+class SendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.retry_delay = actionqueue.RETRY_DELAY
+        actionqueue.RETRY_DELAY = 0
+
+    def tearDown(self):
+        actionqueue.RETRY_DELAY = self.retry_delay
+
+    def test_label_write_retried(self):
+        requester = Requester(502, 503)
+        actionqueue.send(requester, 'POST', '/issues/1/labels', ['x'])
+        self.assertEqual(len(requester.calls), 3)
+
+    def test_label_write_given_up(self):
+        requester = Requester(502, 502, 502)
+        self.assertRaises(github.GithubException, actionqueue.send,
+                          requester, 'POST', '/issues/1/labels', ['x'])
+        self.assertEqual(len(requester.calls), actionqueue.MAX_ATTEMPTS)
+
+    def test_comment_not_retried(self):
+        requester = Requester(502)
+        self.assertRaises(github.GithubException, actionqueue.send,
+                          requester, 'POST', '/issues/1/comments',
+                          {'body': 'a'})
+        self.assertEqual(len(requester.calls), 1)
+
+    def test_deleting_missing_label(self):
+        requester = Requester(404)
+        self.assertIsNone(actionqueue.send(
+            requester, 'DELETE', '/issues/1/labels/x', None))
+
+    def test_client_error_not_retried(self):
+        requester = Requester(422)
+        self.assertRaises(github.GithubException, actionqueue.send,
+                          requester, 'POST', '/issues/1/labels', ['x'])
+        self.assertEqual(len(requester.calls), 1)
+
+
+class ActionQueueTest(unittest.TestCase):
+
+    def test_failures_handed_back(self):
+        applied = []
+
+        def apply(pull_request, writes):
+            if pull_request == 2:
+                raise ValueError("failed")
+            applied.append(pull_request)
+
+        action_queue = actionqueue.ActionQueue(apply, writers=2)
+        for number in (1, 2, 3):
+            action_queue.submit(number, [])
+        failures = action_queue.flush()
+        action_queue.close()
+        self.assertEqual(sorted(applied), [1, 3])
+        self.assertEqual([(pr, writes) for pr, writes, _ in failures],
+                         [(2, [])])
+        self.assertEqual(action_queue.flush(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
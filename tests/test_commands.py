@@ -0,0 +1,130 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import commands
+import statestore
+
+
+class Comment(object):
+
+    def __init__(self, id, body, updated_at='2016-05-01 12:00:00'):
+        self.id = id
+        self.body = body
+        self.updated_at = updated_at
+
+
+class ScanTest(unittest.TestCase):
+
+    def test_commands(self):
+        self.assertEqual(commands.scan("shipit"), set(["shipit"]))
+        self.assertEqual(commands.scan("LGTM, +1 from me"),
+                         set(["LGTM", "+1"]))
+        self.assertEqual(commands.scan("needs_info: which version?"),
+                         set(["needs_info"]))
+
+    def test_punctuation_around_command(self):
+        self.assertEqual(commands.scan("shipit."), set(["shipit"]))
+        self.assertEqual(commands.scan("'shipit'"), set(["shipit"]))
+        self.assertEqual(commands.scan("(+1)"), set(["+1"]))
+
+    def test_command_inside_word(self):
+        self.assertEqual(commands.scan("shipitnow"), set())
+        self.assertEqual(commands.scan("not_shipit"), set())
+        self.assertEqual(commands.scan("pending_action"), set())
+
+    def test_plus_one_inside_url(self):
+        self.assertEqual(
+            commands.scan("See https://github.com/ansible/ansible/pull/1+1"),
+            set())
+        self.assertEqual(commands.scan("http://example.com/?q=+1"), set())
+        self.assertEqual(commands.scan("http://example.com/+1/x"), set())
+
+    def test_plus_one_inside_number(self):
+        self.assertEqual(commands.scan("line +10 fails"), set())
+        self.assertEqual(commands.scan("1+1=2"), set())
+
+    def test_fenced_block(self):
+        body = ("Log:\n"
+                "```\n"
+                "TASK [shipit] needs_revision\n"
+                "```\n")
+        self.assertEqual(commands.scan(body), set())
+
+    def test_command_outside_fenced_block(self):
+        body = ("```yaml\n"
+                "- name: shipit\n"
+                "```\n"
+                "needs_revision\n"
+                "```\n"
+                "+1\n"
+                "```\n")
+        self.assertEqual(commands.scan(body), set(["needs_revision"]))
+
+    def test_empty(self):
+        self.assertEqual(commands.scan(""), set())
+        self.assertEqual(commands.scan(None), set())
+
+
+class CommandScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "commands.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_scans_once(self):
+        scanner = commands.CommandScanner()
+        comment = Comment(1, "shipit")
+        self.assertEqual(scanner.scan_comment(comment), set(["shipit"]))
+        comment.body = "needs_info"
+        self.assertEqual(scanner.scan_comment(comment), set(["shipit"]))
+        self.assertEqual(scanner.stats, {'scanned': 1, 'cached': 1})
+
+    def test_scans_edited_comment_again(self):
+        scanner = commands.CommandScanner()
+        scanner.scan_comment(Comment(1, "shipit"))
+        edited = Comment(1, "needs_info", updated_at='2016-05-02 12:00:00')
+        self.assertEqual(scanner.scan_comment(edited), set(["needs_info"]))
+        self.assertEqual(scanner.stats, {'scanned': 2, 'cached': 0})
+
+    def test_results_kept_between_runs(self):
+        scanner = commands.CommandScanner(statestore.JsonStore(self.path))
+        scanner.scan_comment(Comment(1, "shipit"))
+        scanner.save()
+        scanner = commands.CommandScanner(statestore.JsonStore(self.path))
+        self.assertEqual(scanner.scan_comment(Comment(1, "")),
+                         set(["shipit"]))
+        self.assertEqual(scanner.stats, {'scanned': 0, 'cached': 1})
+
+    def test_save_keeps_newest(self):
+        scanner = commands.CommandScanner(statestore.JsonStore(self.path),
+                                          max_cached=2)
+        for comment_id in (9, 10, 11):
+            scanner.scan_comment(Comment(comment_id, "+1"))
+        scanner.save()
+        self.assertEqual(sorted(statestore.JsonStore(self.path).keys()),
+                         ['10', '11'])
+
+
+if __name__ == '__main__':
+    unittest.main()
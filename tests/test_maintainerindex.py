@@ -0,0 +1,98 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+
+import maintainerindex
+
+MAINTAINERS = """\
+cloud/openstack/_nova_keypair.py: DEPRECATED
+cloud/openstack/: emonty shrews
+monitoring/zabbix_: eikef
+monitoring/zabbix_host.py: harrisongu eikef
+network/f5/: mhite
+network/f5/bigip_: caphrim007
+network/f5/bigip_pool.py: mhite
+packaging/: ansible
+"""
+
+
+class MaintainersIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w') as f:
+            f.write(MAINTAINERS)
+        self.index = maintainerindex.MaintainersIndex(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_directory_entry(self):
+        self.assertEqual(self.index.lookup('cloud/openstack/os_server.py'),
+                         ('emonty', 'shrews'))
+        self.assertEqual(self.index.lookup('packaging/os/apt.py'),
+                         ('ansible',))
+
+    def test_directory_entry_needs_whole_component(self):
+        self.assertEqual(self.index.lookup('cloud/openstackx/a.py'), ())
+        self.assertEqual(self.index.lookup('packaging.py'), ())
+
+    def test_prefix_entry(self):
+        self.assertEqual(self.index.lookup('monitoring/zabbix_group.py'),
+                         ('eikef',))
+        self.assertEqual(self.index.lookup('monitoring/zabbix.py'), ())
+
+    def test_file_entry_adds_to_directory_entry(self):
+        self.assertEqual(
+            self.index.lookup('cloud/openstack/_nova_keypair.py'),
+            ('emonty', 'shrews', 'DEPRECATED'))
+
+    def test_prefix_and_file_entry(self):
+        self.assertEqual(self.index.lookup('monitoring/zabbix_host.py'),
+                         ('eikef', 'harrisongu'))
+
+    def test_directory_prefix_and_file_entry(self):
+        self.assertEqual(self.index.lookup('network/f5/bigip_pool.py'),
+                         ('mhite', 'caphrim007'))
+        self.assertEqual(self.index.lookup('network/f5/bigip_node.py'),
+                         ('mhite', 'caphrim007'))
+
+    def test_uncovered(self):
+        self.assertEqual(self.index.lookup('files/copy.py'), ())
+        self.assertEqual(self.index.lookup(''), ())
+
+    def test_lookup_all(self):
+        self.assertEqual(
+            self.index.lookup_all(['packaging/os/apt.py',
+                                   'monitoring/zabbix_host.py',
+                                   'monitoring/zabbix_group.py']),
+            ['ansible', 'eikef', 'harrisongu'])
+
+    def test_reload_if_changed(self):
+        with open(self.path, 'a') as f:
+            f.write("files/: bcoca\n")
+        mtime = os.stat(self.path).st_mtime
+        os.utime(self.path, (mtime + 10, mtime + 10))
+        self.index.reload_if_changed()
+        self.assertEqual(self.index.lookup('files/copy.py'), ('bcoca',))
+        self.assertEqual(self.index.entries, 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import statestore
+
+WRITES = [
+    ['DELETE', '/labels/needs_info', None],
+    ['POST', '/labels', ['shipit']],
+]
+
+
+class ActionJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "journal.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def interrupted_sweep(self):
+        journal = statestore.ActionJournal(self.path)
+        journal.start()
+        journal.planned(1, WRITES)
+        journal.written(1, 0)
+        journal.finish(2)
+        journal.close()
+
+    def test_nothing_to_resume(self):
+        journal = statestore.ActionJournal(self.path)
+        self.assertFalse(journal.is_resuming())
+        journal.finish(1)
+        journal.close()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_resume(self):
+        self.interrupted_sweep()
+        journal = statestore.ActionJournal(self.path)
+        self.assertTrue(journal.is_resuming())
+        self.assertEqual(journal.unfinished[1]['writes'], WRITES)
+        self.assertEqual(journal.unfinished[1]['written'], set([0]))
+        self.assertTrue(journal.is_finished(2, time.time() - 60))
+        self.assertFalse(journal.is_finished(2, time.time() + 60))
+
+    def test_replay_after_truncated_line(self):
+        self.interrupted_sweep()
+        with open(self.path, 'a') as f:
+            f.write('{"at": 1, "event": "writ')
+        journal = statestore.ActionJournal(self.path)
+        self.assertEqual(journal.unfinished[1]['written'], set([0]))
+        self.assertEqual(list(journal.finished), [2])
+        journal.start()
+        journal.written(1, 1)
+        journal.finish(1)
+        journal.close()
+
+        journal = statestore.ActionJournal(self.path)
+        self.assertEqual(journal.unfinished, {})
+        self.assertEqual(sorted(journal.finished), [1, 2])
+
+    def test_line_without_line_break(self):
+        self.interrupted_sweep()
+        with open(self.path, 'a') as f:
+            f.write('{"at": 1, "event": "failed", "pr": 1}')
+        journal = statestore.ActionJournal(self.path)
+        self.assertIn(1, journal.unfinished)
+        journal.finish(3)
+        journal.close()
+        journal = statestore.ActionJournal(self.path)
+        self.assertEqual(sorted(journal.finished), [2, 3])
+
+    def test_failed_plan_dropped(self):
+        self.interrupted_sweep()
+        journal = statestore.ActionJournal(self.path)
+        journal.failed(1)
+        journal.close()
+        self.assertEqual(statestore.ActionJournal(self.path).unfinished, {})
+
+    def test_old_sweep_not_resumed(self):
+        self.interrupted_sweep()
+        journal = statestore.ActionJournal(self.path, max_age=-1)
+        self.assertFalse(journal.is_resuming())
+        self.assertEqual(journal.unfinished, {})
+
+    def test_end(self):
+        self.interrupted_sweep()
+        journal = statestore.ActionJournal(self.path)
+        journal.end()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(statestore.ActionJournal(self.path).is_resuming())
+
+
+class TimerWheelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "timers.json")
+        self.timers = statestore.TimerWheel(self.path, slot=100)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_due(self):
+        self.timers.schedule(1, 1050)
+        self.timers.schedule(2, 1020)
+        self.timers.schedule(3, 1210)
+        self.assertEqual(self.timers.due(now=1000), [])
+        self.assertEqual(self.timers.due(now=1030), [(2, 1020)])
+        self.assertEqual(self.timers.due(now=1050), [(2, 1020), (1, 1050)])
+        self.assertEqual(self.timers.due(now=2000),
+                         [(2, 1020), (1, 1050), (3, 1210)])
+
+    def test_schedule_replaces(self):
+        self.timers.schedule(1, 1050)
+        self.timers.schedule(1, 1450)
+        self.assertEqual(self.timers.due(now=1100), [])
+        self.assertEqual(self.timers.due(now=1500), [(1, 1450)])
+        self.assertEqual(self.timers.indexes, [14])
+
+    def test_cancel(self):
+        self.timers.schedule(1, 1050)
+        self.timers.schedule(2, 1060)
+        self.timers.cancel(1)
+        self.timers.cancel(3)
+        self.assertEqual(self.timers.due(now=2000), [(2, 1060)])
+        self.timers.cancel(2)
+        self.assertEqual(self.timers.due(now=2000), [])
+        self.assertEqual(self.timers.slots, {})
+        self.assertEqual(self.timers.indexes, [])
+
+    def test_pop_due(self):
+        self.timers.schedule(1, 1050)
+        self.timers.schedule(2, 1150)
+        self.assertEqual(self.timers.pop_due(now=1100), [(1, 1050)])
+        self.assertEqual(self.timers.due(now=2000), [(2, 1150)])
+
+    def test_persisted(self):
+        self.timers.schedule(1, 1050)
+        self.timers.schedule(2, 1150)
+        self.timers.cancel(2)
+        self.timers.save()
+        timers = statestore.TimerWheel(self.path, slot=100)
+        self.assertEqual(timers.due(now=2000), [(1, 1050)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+import shutil
+import tempfile
+import time
+import unittest
+
+import triage
+
+FINGERPRINT = {
+    'updated_at': '2016-05-01 12:00:00',
+    'head_sha': 'abc',
+    'labels': ['shipit'],
+    'comments': 3,
+}
+
+
+class PullRequest(object):
+    """What needs_triage() looks at of a PullRequest"""
+
+    def __init__(self, pr_number, fingerprint=FINGERPRINT):
+        self.pr_number = pr_number
+        self.fingerprint = dict(fingerprint)
+
+    def get_fingerprint(self):
+        return self.fingerprint
+
+
+class NeedsTriageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.triage = triage.Triage('core',
+                                    triage.Options(state_dir=self.dir))
+        self.triage.pull_request = PullRequest(5)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def record(self, **state):
+        record = {
+            'fingerprint': FINGERPRINT,
+            'actions': {},
+            'actions_pending': False,
+            'deferred_fetches': [],
+        }
+        record.update(state)
+        self.triage.pr_state.set(5, record)
+
+    def test_new_pr(self):
+        self.assertTrue(self.triage.needs_triage())
+
+    def test_unchanged_pr(self):
+        self.record()
+        self.assertFalse(self.triage.needs_triage())
+
+    def test_changed_pr(self):
+        self.record()
+        self.triage.pull_request.fingerprint['comments'] = 4
+        self.assertTrue(self.triage.needs_triage())
+
+    def test_actions_pending(self):
+        self.record(actions_pending=True)
+        self.assertTrue(self.triage.needs_triage())
+
+    def test_deferred_fetches(self):
+        self.record(deferred_fetches=['build_state'])
+        self.assertTrue(self.triage.needs_triage())
+
+    def test_warning_due(self):
+        self.record()
+        self.triage.warning_timers.schedule(5, time.time() + 3600)
+        self.assertFalse(self.triage.needs_triage())
+        self.triage.warning_timers.schedule(5, time.time() - 1)
+        self.assertTrue(self.triage.needs_triage())
+
+    def test_warning_due_of_other_pr(self):
+        self.record()
+        self.triage.warning_timers.schedule(6, time.time() - 1)
+        self.assertFalse(self.triage.needs_triage())
+
+
+if __name__ == '__main__':
+    unittest.main()
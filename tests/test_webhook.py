@@ -0,0 +1,305 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import hmac
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+    from urllib2 import HTTPError, Request, urlopen
+except ImportError:
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+
+import fakegithub
+import triage
+import webhook
+
+FULL_NAME = 'ansible/ansible-modules-core'
+REPOSITORY = {'full_name': FULL_NAME}
+SECRET = 's3cret'
+
+
+class Triage(object):
+    """What Daemon.receive() looks at of a Triage"""
+    full_name = FULL_NAME
+
+
+def pull_request_event(number, sha='a' * 40, state='open', sender='user1',
+                       action='synchronize'):
+    return {
+        'action': action,
+        'pull_request': {'number': number, 'state': state,
+                         'head': {'sha': sha}},
+        'repository': REPOSITORY,
+        'sender': {'login': sender},
+    }
+
+
+def issue_comment_event(number, pull_request=True, sender='user1'):
+    issue = {'number': number, 'state': 'open'}
+    if pull_request:
+        issue['pull_request'] = {}
+    return {
+        'action': 'created',
+        'issue': issue,
+        'repository': REPOSITORY,
+        'sender': {'login': sender},
+    }
+
+
+def status_event(sha):
+    return {
+        'sha': sha,
+        'state': 'success',
+        'repository': REPOSITORY,
+        'sender': {'login': 'ci'},
+    }
+
+
+class DebouncerTest(unittest.TestCase):
+
+    def test_due_after_delay(self):
+        debouncer = webhook.Debouncer(delay=0.1, max_delay=10)
+        debouncer.add(1, time.time())
+        self.assertIsNone(debouncer.take(0))
+        number, _, events = debouncer.take(1)
+        self.assertEqual((number, events), (1, 1))
+        self.assertEqual(len(debouncer), 0)
+
+    def test_events_merged(self):
+        debouncer = webhook.Debouncer(delay=10, max_delay=60)
+        now = time.time()
+        debouncer.add(1, now - 30)
+        debouncer.add(2, now - 20)
+        debouncer.add(1, now - 11)
+        self.assertEqual(len(debouncer), 2)
+        # 1 is due 10 seconds after its last event, 2 was due earlier
+        self.assertEqual(debouncer.take(0), (2, now - 20, 1))
+        self.assertEqual(debouncer.take(0), (1, now - 30, 2))
+
+    def test_new_event_delays(self):
+        debouncer = webhook.Debouncer(delay=10, max_delay=60)
+        now = time.time()
+        debouncer.add(1, now - 15)
+        debouncer.add(1, now - 5)
+        self.assertIsNone(debouncer.take(0))
+
+    def test_max_delay(self):
+        debouncer = webhook.Debouncer(delay=10, max_delay=60)
+        now = time.time()
+        for age in range(65, 0, -5):
+            debouncer.add(1, now - age)
+        self.assertEqual(debouncer.take(0), (1, now - 65, 13))
+
+    def test_max_delay_wakes_up_waiting_take(self):
+        debouncer = webhook.Debouncer(delay=10, max_delay=0.2)
+        started = time.time()
+        debouncer.add(1, started)
+        self.assertEqual(debouncer.take(5)[0], 1)
+        self.assertLess(time.time() - started, 2)
+
+    def test_not_before(self):
+        debouncer = webhook.Debouncer(delay=0, max_delay=0)
+        now = time.time()
+        debouncer.add(1, now - 100, not_before=now + 60)
+        debouncer.add(1, now)
+        self.assertIsNone(debouncer.take(0))
+        debouncer.add(2, now)
+        self.assertEqual(debouncer.take(0)[0], 2)
+
+    def test_add_wakes_up_waiting_take(self):
+        debouncer = webhook.Debouncer(delay=0, max_delay=0)
+        timer = threading.Timer(0.1, debouncer.add, (1, time.time()))
+        timer.start()
+        self.assertEqual(debouncer.take(5)[0], 1)
+        timer.join()
+
+
+class HandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = webhook.Daemon(Triage(), None, bots=['ansibot'],
+                                     secret=SECRET, debounce=60)
+        self.server = webhook.Server(('127.0.0.1', 0), self.daemon)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://%s:%d/' % self.server.server_address
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, event, payload, secret=SECRET):
+        body = json.dumps(payload).encode('utf-8')
+        request = Request(self.url, body, {'X-GitHub-Event': event})
+        if secret:
+            request.add_header('X-Hub-Signature', 'sha1=' + hmac.new(
+                secret.encode('utf-8'), body, hashlib.sha1).hexdigest())
+        try:
+            response = urlopen(request)
+        except HTTPError as e:
+            return e.code, e.read().decode('utf-8').strip()
+        return response.getcode(), response.read().decode('utf-8').strip()
+
+    def test_pull_request(self):
+        self.assertEqual(self.post('pull_request', pull_request_event(5)),
+                         (202, "Queued PR #5"))
+        self.assertEqual(list(self.daemon.debouncer.pending), [5])
+
+    def test_closed_pull_request(self):
+        self.assertEqual(
+            self.post('pull_request', pull_request_event(5, state='closed',
+                                                         action='closed')),
+            (200, "Ignored"))
+        self.assertEqual(len(self.daemon.debouncer), 0)
+
+    def test_issue_comment(self):
+        for _ in range(3):
+            self.assertEqual(self.post('issue_comment',
+                                       issue_comment_event(7)),
+                             (202, "Queued PR #7"))
+        self.assertEqual(self.daemon.debouncer.pending[7][2], 3)
+
+    def test_comment_on_issue(self):
+        self.assertEqual(
+            self.post('issue_comment',
+                      issue_comment_event(7, pull_request=False)),
+            (200, "Ignored"))
+
+    def test_ignored_events(self):
+        self.assertEqual(
+            self.post('issue_comment',
+                      issue_comment_event(7, sender='ansibot')),
+            (200, "Ignored"))
+        payload = issue_comment_event(7)
+        payload['repository'] = {'full_name': 'other/repo'}
+        self.assertEqual(self.post('issue_comment', payload),
+                         (200, "Ignored"))
+        self.assertEqual(
+            self.post('label', {'action': 'created', 'label': {'name': 'x'},
+                                'repository': REPOSITORY,
+                                'sender': {'login': 'user1'}}),
+            (200, "Ignored"))
+        self.assertEqual(len(self.daemon.debouncer), 0)
+        self.assertEqual(self.daemon.metrics.ignored, 3)
+
+    def test_status_of_known_head(self):
+        self.post('pull_request', pull_request_event(5, sha='b' * 40))
+        self.assertEqual(self.post('status', status_event('b' * 40)),
+                         (202, "Queued PR #5"))
+        self.assertEqual(self.daemon.debouncer.pending[5][2], 2)
+
+    def test_status_of_unknown_head(self):
+        self.assertEqual(self.post('status', status_event('c' * 40)),
+                         (202, "Queued status of ccccccc"))
+        self.assertEqual(list(self.daemon.statuses), ['c' * 40])
+        self.assertEqual(len(self.daemon.debouncer), 0)
+
+    def test_bad_signature(self):
+        self.assertEqual(self.post('pull_request', pull_request_event(5),
+                                   secret='wrong'),
+                         (403, "Bad signature"))
+        self.assertEqual(self.post('pull_request', pull_request_event(5),
+                                   secret=None),
+                         (403, "Bad signature"))
+        self.assertEqual(len(self.daemon.debouncer), 0)
+
+    def test_bad_payload(self):
+        self.assertEqual(self.post('issue_comment',
+                                   {'repository': REPOSITORY}),
+                         (400, "Payload does not fit the event"))
+        request = Request(self.url, b"{", {'X-GitHub-Event': 'status'})
+        self.daemon.secret = None
+        try:
+            urlopen(request)
+        except HTTPError as e:
+            self.assertEqual(e.code, 400)
+        else:
+            self.fail("Accepted a payload which is not JSON")
+
+    def test_metrics(self):
+        self.post('pull_request', pull_request_event(5))
+        self.post('issue_comment', issue_comment_event(7, sender='ansibot'))
+        metrics = urlopen(self.url + 'metrics').read().decode('utf-8')
+        self.assertIn("triage_webhook_events_total 2\n", metrics)
+        self.assertIn("triage_webhook_events_ignored_total 1\n", metrics)
+
+
+class ResolveStatusesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = fakegithub.Repository('ansible', 'ansible-modules-core',
+                                          prs=5)
+        self.api = fakegithub.FakeGithub([self.repo])
+        self.server = fakegithub.Server(('127.0.0.1', 0), self.api)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        self.dir = tempfile.mkdtemp()
+        self.triage = triage.Triage('core', triage.Options(
+            state_dir=self.dir, base_url=self.server.base_url))
+        repo = self.triage._connect().get_repo(FULL_NAME)
+        self.daemon = webhook.Daemon(self.triage, repo)
+
+    def tearDown(self):
+        self.triage.client.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def head(self, number):
+        return self.repo.pulls[number]['commits'][-1]
+
+    def test_resolve(self):
+        self.daemon.receive('status', status_event(self.head(3)))
+        self.daemon.receive('status', status_event('d' * 40))
+        self.assertEqual(len(self.daemon.statuses), 2)
+        time.sleep(0.01)
+        self.daemon.resolve_statuses()
+        self.assertEqual(list(self.daemon.debouncer.pending), [3])
+        self.assertEqual(self.daemon.statuses, {})
+        self.assertEqual(self.daemon.metrics.ignored, 1)
+        self.assertEqual(self.daemon.heads[self.head(5)], 5)
+
+    def test_listed_at_most_every_interval(self):
+        self.daemon.receive('status', status_event('d' * 40))
+        time.sleep(0.01)
+        self.daemon.resolve_statuses()
+        requests = self.api.requests
+        self.daemon.receive('status', status_event('e' * 40))
+        self.daemon.receive('status', status_event(self.head(2)))
+        self.daemon.resolve_statuses()
+        self.assertEqual(self.api.requests, requests)
+        self.assertEqual(list(self.daemon.debouncer.pending), [2])
+        self.assertEqual(list(self.daemon.statuses), ['e' * 40])
+
+    def test_nothing_to_resolve(self):
+        requests = self.api.requests
+        self.daemon.resolve_statuses()
+        self.assertEqual(self.api.requests, requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import workqueue
+
+REPO = 'core'
+
+
+class WorkQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "queue.db")
+        self.queue = workqueue.WorkQueue(self.path, shards=2,
+                                         max_attempts=2)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.dir)
+
+    def test_put(self):
+        self.assertEqual(self.queue.put(REPO, [1, 2, 3]), 3)
+        self.assertEqual(self.queue.put(REPO, [3, 4]), 1)
+        self.assertEqual(self.queue.counts(REPO), {'queued': 4})
+        self.assertEqual(self.queue.pending(REPO), 4)
+        self.assertEqual(self.queue.pending('extras'), 0)
+
+    def test_shard_count_fixed(self):
+        queue = workqueue.WorkQueue(self.path, shards=8)
+        self.assertEqual(queue.shards, 2)
+        queue.close()
+
+    def test_take_and_ack(self):
+        self.queue.put(REPO, [1, 2, 3, 4])
+        shard = self.queue.claim_shard('a', REPO)
+        numbers = self.queue.take('a', REPO, shard)
+        self.assertEqual(sorted(numbers), [n for n in (1, 2, 3, 4)
+                                           if n % 2 == shard])
+        for number in numbers:
+            self.queue.ack('a', REPO, number)
+        self.assertEqual(self.queue.take('a', REPO, shard), [])
+        self.assertEqual(self.queue.counts(REPO), {'done': 2, 'queued': 2})
+
+    def test_shard_held_by_one_worker(self):
+        self.queue.put(REPO, [1])
+        self.assertEqual(self.queue.claim_shard('a', REPO), 1)
+        self.assertIsNone(self.queue.claim_shard('b', REPO))
+        self.queue.release_shard('a', REPO, 1)
+        self.assertEqual(self.queue.claim_shard('b', REPO), 1)
+
+    def test_lease_expiry(self):
+        self.queue.put(REPO, [1, 3])
+        shard = self.queue.claim_shard('a', REPO, lease=0.01)
+        self.assertEqual(self.queue.take('a', REPO, shard, limit=1), [3])
+        time.sleep(0.05)
+        self.assertFalse(self.queue.renew('b', REPO, shard))
+        self.assertEqual(self.queue.claim_shard('b', REPO), shard)
+        # PR 3 was taken by a but not acknowledged
+        self.assertEqual(self.queue.take('b', REPO, shard), [3, 1])
+        self.assertFalse(self.queue.renew('a', REPO, shard))
+        self.queue.ack('a', REPO, 3)
+        self.assertEqual(self.queue.counts(REPO), {'leased': 2})
+
+    def test_renew(self):
+        self.queue.put(REPO, [1])
+        shard = self.queue.claim_shard('a', REPO, lease=0.01)
+        self.assertTrue(self.queue.renew('a', REPO, shard, lease=60))
+        time.sleep(0.05)
+        self.assertIsNone(self.queue.claim_shard('b', REPO))
+
+    def test_put_while_leased(self):
+        self.queue.put(REPO, [1])
+        shard = self.queue.claim_shard('a', REPO)
+        self.queue.take('a', REPO, shard)
+        self.assertEqual(self.queue.put(REPO, [1]), 1)
+        self.queue.ack('a', REPO, 1)
+        self.assertEqual(self.queue.counts(REPO), {'queued': 1})
+
+    def test_fail(self):
+        self.queue.put(REPO, [1])
+        shard = self.queue.claim_shard('a', REPO)
+        self.queue.take('a', REPO, shard)
+        self.queue.fail('a', REPO, 1, "timeout")
+        self.assertEqual(self.queue.counts(REPO), {'queued': 1})
+        self.queue.take('a', REPO, shard)
+        self.queue.fail('a', REPO, 1, "timeout")
+        self.assertEqual(self.queue.counts(REPO), {'failed': 1})
+        self.assertEqual(self.queue.pending(REPO), 0)
+
+    def test_taken_too_often(self):
+        self.queue.put(REPO, [1])
+        for worker in ('a', 'b'):
+            shard = self.queue.claim_shard(worker, REPO)
+            self.assertEqual(self.queue.take(worker, REPO, shard), [1])
+            self.queue.release_shard(worker, REPO, shard)
+        shard = self.queue.claim_shard('c', REPO)
+        self.assertEqual(self.queue.take('c', REPO, shard), [])
+        self.assertEqual(self.queue.counts(REPO), {'failed': 1})
+
+    def test_requeue_failed(self):
+        self.queue.put(REPO, [1, 2])
+        for _ in range(2):
+            shard = self.queue.claim_shard('a', REPO)
+            numbers = self.queue.take('a', REPO, shard)
+            while numbers:
+                self.queue.fail('a', REPO, numbers[0], "error")
+                numbers = self.queue.take('a', REPO, shard)
+            self.queue.release_shard('a', REPO, shard)
+        self.assertEqual(self.queue.counts(REPO), {'failed': 2})
+        self.assertEqual(self.queue.requeue_failed(REPO), 2)
+        self.assertEqual(self.queue.requeue_failed(REPO), 0)
+        self.assertEqual(self.queue.counts(REPO), {'queued': 2})
+        shard = self.queue.claim_shard('b', REPO)
+        self.assertEqual(len(self.queue.take('b', REPO, shard)), 1)
+
+
+class HeartbeatTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "queue.db")
+        self.queue = workqueue.WorkQueue(self.path, shards=1)
+        self.queue.put(REPO, [1])
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.dir)
+
+    def test_renews_lease(self):
+        self.queue.claim_shard('a', REPO, lease=0.3)
+        heartbeat = workqueue.Heartbeat(self.path, 'a', REPO, 0, lease=0.3)
+        heartbeat.start()
+        time.sleep(0.5)
+        self.assertIsNone(self.queue.claim_shard('b', REPO))
+        self.assertFalse(heartbeat.lost.is_set())
+        heartbeat.stop()
+
+    def test_lease_lost(self):
+        self.queue.claim_shard('a', REPO, lease=0.03)
+        heartbeat = workqueue.Heartbeat(self.path, 'b', REPO, 0, lease=0.03)
+        heartbeat.start()
+        self.assertTrue(heartbeat.lost.wait(1))
+        heartbeat.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
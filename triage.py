@@ -18,15 +18,34 @@
 from __future__ import print_function
 
 import argparse
+import calendar
+import cProfile
+import heapq
+import itertools
 import os
+import socket
 import sys
 import time
-from datetime import datetime
-
-from github import Github
+from datetime import datetime, timedelta
 
+import github.CommitStatus
+import github.File
+import github.Issue
+import github.PullRequest
+import github.PaginatedList
 from jinja2 import Environment, FileSystemLoader
 
+import actionqueue
+import commands
+import ghclient
+import instrument
+import maintainerindex
+import multirepo
+import pipeline
+import statestore
+import webhook
+import workqueue
+
 loader = FileSystemLoader(os.path.join(os.path.dirname(__file__), 'templates'))
 environment = Environment(loader=loader, trim_blocks=True)
 
@@ -95,57 +114,291 @@ BOTLIST = [
     'robynbergeron',
 ]
 
+# Days after the last bot comment before a warning is due
+BOT_COMMENT_TIMEOUT_DAYS = 14
+
+# Organization whose members may decide on any PR
+ANSIBLE_ORG = "ansible"
+
+# Page size of the issue listing snapshot_issues() makes, the most GitHub
+# allows
+ISSUES_PER_PAGE = 100
+
+# Comments per page when paging through threads
+COMMENTS_PER_PAGE = 100
+
+# Newest comments of a PR remembered between sweeps
+MAX_CURSOR_COMMENTS = 100
+
+# Build states which do not change anymore for a commit
+SETTLED_BUILD_STATES = ("success", "failure", "error")
+
+# Seconds before the first recheck of a PR with unknown mergeable state,
+# doubled with every further attempt up to the maximum
+MERGEABLE_RETRY_DELAY = 1
+MERGEABLE_MAX_RETRY_DELAY = 16
+# Seconds after which a PR is triaged without its mergeable state
+DEFAULT_MERGEABLE_DEADLINE = 120
+
+
+def parse_timestamp(value):
+    """Returns the datetime of an ISO 8601 UTC timestamp as used by the
+    GitHub API, e.g. 2016-05-01T12:00:00Z, or of a date"""
+    for fmt in ("%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError("not a timestamp: %r" % value)
+
+
+def format_timestamp(value):
+    """Returns a datetime as ISO 8601 UTC timestamp"""
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class IssueSnapshot(object):
+    """The fields of an issue the triage reads, from the issue listing"""
+
+    __slots__ = ('number', 'url', 'title', 'body', 'user', 'state',
+                 'labels', 'comments', 'updated_at')
+
+    def __init__(self, issue):
+        self.number = issue.number
+        self.url = issue.url
+        self.title = issue.title
+        self.body = issue.body
+        self.user = issue.user.login
+        self.state = issue.state
+        self.labels = tuple(label.name for label in issue.labels)
+        self.comments = issue.comments
+        self.updated_at = issue.updated_at
+
+
+class CommentRecord(object):
+    """The fields of an issue comment the triage rules look at. The body
+    is only kept if it has commands in it. commands is the set of them, or
+    None if the comment was not scanned yet."""
+
+    __slots__ = ('id', 'login', 'body', 'created_at', 'updated_at',
+                 'commands')
+
+    def __init__(self, comment_id, login, body, created_at, updated_at,
+                 found=None):
+        self.id = comment_id
+        self.login = login
+        self.body = body
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.commands = found
+
+    @classmethod
+    def from_json(cls, data, scanner=None):
+        """Returns the record of a comment scanned by scanner, a
+        CommandScanner, if one is given"""
+        comment = cls(data['id'], data['user']['login'],
+                      data.get('body') or '',
+                      parse_timestamp(data['created_at']),
+                      parse_timestamp(data['updated_at']))
+        comment.commands = (scanner.scan_comment(comment) if scanner
+                            else commands.scan(comment.body))
+        if not comment.commands:
+            comment.body = ''
+        return comment
+
+    @classmethod
+    def from_stored(cls, row):
+        comment_id, login, body, created_at, updated_at = row
+        return cls(comment_id, login, body, parse_timestamp(created_at),
+                   parse_timestamp(updated_at))
+
+    def to_stored(self):
+        return [self.id, self.login, self.body,
+                format_timestamp(self.created_at),
+                format_timestamp(self.updated_at)]
+
+
+class CommentStream(object):
+    """Comments fetched only as far as they are iterated. Iterating again
+    goes over the comments fetched so far first."""
+
+    def __init__(self, source):
+        self.source = iter(source)
+        self.fetched = []
+
+    def __iter__(self):
+        index = 0
+        while True:
+            if index == len(self.fetched):
+                try:
+                    self.fetched.append(next(self.source))
+                except StopIteration:
+                    return
+            yield self.fetched[index]
+            index += 1
+
+
+class PullSnapshot(object):
+    """What the triage rules read of a PR, each part loaded at most once.
+
+    A field is unset until it is loaded, so a PR without labels, files or
+    comments is told apart from one whose labels, files or comments were
+    not fetched yet. A field once set can not be changed; refreshing the
+    PR makes a new snapshot.
+    """
+
+    __slots__ = ('number', 'title', 'body', 'user', 'state', 'created_at',
+                 'updated_at', 'head_sha', 'base_sha', 'base_ref',
+                 'mergeable_state', 'labels', 'files', 'comments')
+
+    # Loaded separately from the PR itself
+    LOADED_LATER = ('labels', 'files', 'comments')
+
+    def __init__(self, pull, full=False, previous=None):
+        self.number = pull.number
+        self.title = pull.title
+        self.body = pull.body
+        self.user = pull.user.login
+        self.state = pull.state
+        self.created_at = pull.created_at
+        self.updated_at = pull.updated_at
+        self.head_sha = pull.head.sha
+        self.base_sha = pull.base.sha
+        self.base_ref = pull.base.ref
+        # PRs from a listing have no mergeable state
+        if full:
+            self.mergeable_state = pull.mergeable_state
+        if previous is not None:
+            for name in self.LOADED_LATER:
+                if previous.is_loaded(name):
+                    setattr(self, name, getattr(previous, name))
+
+    def __setattr__(self, name, value):
+        if self.is_loaded(name):
+            raise AttributeError("%s of PR #%s is already loaded" %
+                                 (name, self.number))
+        object.__setattr__(self, name, value)
+
+    def is_loaded(self, name):
+        return hasattr(self, name)
+
 
 class PullRequest:
 
-    def __init__(self, repo, pr_number=None, pr=None):
+    def __init__(self, repo, pr_number=None, pr=None, meter=None,
+                 commit_states=None, issue_snapshot=None,
+                 comment_cursor=None, command_scanner=None, requester=None):
         self.repo = repo
-
+        # Sends the requests not made through repo, see GithubClient
+        self.requester = requester
+        # Comments read by the last sweep, see get_comment_cursor()
+        self.comment_cursor = comment_cursor
+        self.comments_fetched_at = None
+        self.comments_counted = None
+        self.meter = meter
+        self.commit_states = commit_states
+        # Scans the comments as they are fetched
+        self.command_scanner = command_scanner
+        # IssueSnapshot of the PR from the bulk listing, if there is one
+        self.issue_snapshot = issue_snapshot
+
+        # The PyGithub object of the PR is not kept, only its snapshot
         if not pr:
-            self.instance = self.repo.get_pull(pr_number)
+            self.snapshot = PullSnapshot(self.repo.get_pull(pr_number),
+                                         full=True)
         else:
-            self.instance = pr
+            self.snapshot = PullSnapshot(pr)
 
-        self.pr_number = self.instance.number
+        self.pr_number = self.snapshot.number
 
         self.issue = None
-        self.pr_filenames = []
-        self.current_pr_labels = []
+        self.build_state = None
+        self.build_state_fetched = False
         self.desired_pr_labels = []
-
-        self.current_comments = []
         self.desired_comments = []
 
+        # Creation time of the bot comment process_comments() stopped at
+        self.last_bot_comment_at = None
+        # Data skipped to save API calls
+        self.deferred_fetches = []
+        # Set once the PR left the queue waiting for its mergeable state
+        self.mergeable_wait_over = False
+
+    @instrument.step("files")
+    def get_pr_files(self):
+        """Returns (filename, status) of all files of this PR"""
+        if not self.snapshot.is_loaded('files'):
+            files = github.PaginatedList.PaginatedList(
+                github.File.File,
+                self.requester,
+                "%s/pulls/%s/files" % (self.repo.url, self.pr_number),
+                None
+            )
+            self.snapshot.files = tuple((pr_file.filename, pr_file.status)
+                                        for pr_file in files)
+        return self.snapshot.files
+
     def get_pr_filenames(self):
         """Returns all files related to this PR"""
-        if not self.pr_filenames:
-            for pr_file in self.instance.get_files():
-                self.pr_filenames.append(pr_file.filename)
-        return self.pr_filenames
-
-    def get_last_commit(self):
-        """Returns last commit"""
-        commits = self.instance.get_commits().reversed
-        for commit in commits:
-            return commit
-
-    def get_build_status(self):
-        """Return build status object"""
-        last_commit = self.get_last_commit()
-        if last_commit:
-            build_statuses = last_commit.get_statuses()
-            for build_status in build_statuses:
-                return build_status
-        return None
+        return [filename for filename, status in self.get_pr_files()]
+
+    @instrument.step("statuses")
+    def get_head_statuses(self):
+        """Returns the statuses of the head commit, newest first"""
+        return github.PaginatedList.PaginatedList(
+            github.CommitStatus.CommitStatus,
+            self.requester,
+            "%s/statuses/%s" % (self.repo.url, self.get_head_sha()),
+            None
+        )
+
+    def get_commit_states(self):
+        """Returns the remembered states of the head and base commits"""
+        if self.commit_states is None:
+            return {}
+        return self.commit_states.get(self.get_head_sha(),
+                                      self.get_base_sha())
+
+    def remember_commit_state(self, **states):
+        if self.commit_states is not None:
+            self.commit_states.update(self.get_head_sha(),
+                                      self.get_base_sha(), **states)
+
+    def get_build_state(self):
+        """Returns the state of the latest build status of the head commit,
+        None if there is none"""
+        if not self.build_state_fetched:
+            self.build_state_fetched = True
+            states = self.get_commit_states()
+            if 'build_state' in states:
+                self.build_state = states['build_state']
+            else:
+                for build_status in self.get_head_statuses():
+                    self.build_state = build_status.state
+                    break
+                if self.build_state in SETTLED_BUILD_STATES:
+                    self.remember_commit_state(build_state=self.build_state)
+        return self.build_state
+
+    def fetch_cost(self, name):
+        """Returns the API calls getting the mergeable_state or build_state
+        of the PR takes, 0 if it is known already"""
+        if name == 'mergeable_state':
+            known = self.snapshot.is_loaded('mergeable_state')
+        else:
+            known = self.build_state_fetched
+        if not known:
+            known = name in self.get_commit_states()
+        return 0 if known else 1
 
     def get_pr_submitter(self):
         """Returns the PR submitter"""
-        return self.instance.user.login
+        return self.snapshot.user
 
     def pr_contains_new_file(self):
         """Return True if PR contains new files"""
-        for pr_file in self.instance.get_files():
-            if pr_file.status == "added":
+        for filename, status in self.get_pr_files():
+            if status == "added":
                 return True
         return False
 
@@ -156,46 +409,208 @@ class PullRequest:
                 return True
         return False
 
+    def get_mergeable_state(self):
+        """Returns the mergeable state, remembered for the head and base
+        commits once GitHub computed it"""
+        states = self.get_commit_states()
+        if not self.snapshot.is_loaded('mergeable_state'):
+            if 'mergeable_state' in states:
+                self.snapshot.mergeable_state = states['mergeable_state']
+            else:
+                self.snapshot.mergeable_state = self.repo.get_pull(
+                    self.pr_number
+                ).mergeable_state
+        mergeable_state = self.snapshot.mergeable_state
+        if mergeable_state != "unknown" and 'mergeable_state' not in states:
+            self.remember_commit_state(mergeable_state=mergeable_state)
+        return mergeable_state
+
     def is_mergeable(self):
-        """Return True if PR is mergeable"""
-        while self.instance.mergeable_state == "unknown":
-            print("Mergeable state is unknown, trying again...")
-            time.sleep(1)
-            self.instance = self.repo.get_pull(self.pr_number)
-            time.sleep(1)
-        return self.instance.mergeable_state != "dirty"
+        """Return True if PR is mergeable, None while GitHub did not
+        compute the mergeable state yet"""
+        mergeable_state = self.get_mergeable_state()
+        if mergeable_state == "unknown":
+            return None
+        return mergeable_state != "dirty"
+
+    @instrument.step("refresh")
+    def refresh(self):
+        """Reloads the PR itself from the API"""
+        self.snapshot = PullSnapshot(self.repo.get_pull(self.pr_number),
+                                     full=True, previous=self.snapshot)
 
     def is_a_wip(self):
         """Return True if PR start with [WIP] in title"""
-        return (self.instance.title.startswith("[WIP]")
-                or self.instance.title.startswith("WIP:")
-                or self.instance.title.startswith("WIP "))
+        return (self.snapshot.title.startswith("[WIP]")
+                or self.snapshot.title.startswith("WIP:")
+                or self.snapshot.title.startswith("WIP "))
 
     def get_base_ref(self):
         """Returns base ref of PR"""
-        return self.instance.base.ref
+        return self.snapshot.base_ref
+
+    def get_head_sha(self):
+        """Returns the SHA of the head commit of the PR"""
+        return self.snapshot.head_sha
+
+    def get_base_sha(self):
+        """Returns the SHA of the base commit of the PR"""
+        return self.snapshot.base_sha
+
+    def get_fingerprint(self):
+        """Returns the inputs the triage of this PR depends on"""
+        return {
+            'updated_at': str(self.snapshot.updated_at),
+            'head_sha': self.get_head_sha(),
+            'labels': sorted(self.get_current_labels()),
+            'comments': self.get_comment_count(),
+        }
 
+    def get_warning_due(self):
+        """Returns when the last bot comment crosses the warning timeout, or
+        None if it already has or there is no bot comment"""
+        if not self.last_bot_comment_at:
+            return None
+        due = (self.last_bot_comment_at +
+               timedelta(days=BOT_COMMENT_TIMEOUT_DAYS + 1))
+        if due <= datetime.today():
+            return None
+        return due
+
+    @instrument.step("issue")
     def get_issue(self):
-        """Gets the issue from the GitHub API"""
+        """Gets the issue from the GitHub API. With a snapshot of the issue
+        only a reference to it is made, enough to write to it."""
         if not self.issue:
-            self.issue = self.repo.get_issue(self.pr_number)
+            if self.issue_snapshot:
+                self.issue = github.Issue.Issue(
+                    self.requester, {},
+                    {'number': self.pr_number,
+                     'url': self.issue_snapshot.url},
+                    completed=False
+                )
+            else:
+                self.issue = self.repo.get_issue(self.pr_number)
         return self.issue
 
     def get_current_labels(self):
-        """Pull the list of labels on this PR and shove them into
-        pr_labels.
-        """
-        if not self.current_pr_labels:
-            labels = self.get_issue().labels
-            for label in labels:
-                self.current_pr_labels.append(label.name)
-        return self.current_pr_labels
+        """Returns the names of the labels on this PR"""
+        if not self.snapshot.is_loaded('labels'):
+            if self.issue_snapshot:
+                self.snapshot.labels = self.issue_snapshot.labels
+            else:
+                self.snapshot.labels = tuple(
+                    label.name for label in self.get_issue().labels
+                )
+        return self.snapshot.labels
+
+    def get_comment_count(self):
+        """Returns the number of comments on the PR"""
+        if self.issue_snapshot:
+            return self.issue_snapshot.comments
+        return self.get_issue().comments
+
+    def get_comments_url(self):
+        return "%s/issues/%s/comments" % (self.repo.url, self.pr_number)
+
+    def get_comment_page(self, page, **params):
+        """Returns one page of comments as CommentRecords"""
+        params.update(page=page, per_page=COMMENTS_PER_PAGE)
+        headers, data = self.requester.requestJsonAndCheck(
+            "GET", self.get_comments_url(), parameters=params
+        )
+        return [CommentRecord.from_json(item, self.command_scanner)
+                for item in data]
+
+    def older_comments(self, end):
+        """Yields the comments before position end of the thread, newest
+        first, fetching a page only when iteration gets to it"""
+        page = (end + COMMENTS_PER_PAGE - 1) // COMMENTS_PER_PAGE
+        while page > 0:
+            comments = self.get_comment_page(page)
+            for comment in reversed(
+                    comments[:end - (page - 1) * COMMENTS_PER_PAGE]):
+                yield comment
+            page -= 1
+
+    def comments_since(self, since):
+        """Returns the comments made or edited since a timestamp"""
+        comments = []
+        for page in itertools.count(1):
+            records = self.get_comment_page(page, since=since)
+            comments.extend(records)
+            if len(records) < COMMENTS_PER_PAGE:
+                return comments
+
+    def iter_comments(self):
+        """Yields the comments of the PR as CommentRecords, newest first.
+        Comments remembered in the cursor of the last sweep are not fetched
+        again, unless some were deleted since."""
+        self.comments_fetched_at = datetime.utcnow()
+        self.comments_counted = self.get_comment_count()
+        cursor = self.comment_cursor
+        if cursor:
+            new = []
+            edited = {}
+            # Comments made or edited since would have updated the PR
+            unchanged = (cursor['count'] == self.comments_counted and
+                         format_timestamp(self.snapshot.updated_at) <
+                         cursor['fetched_at'])
+            for comment in ([] if unchanged else
+                            self.comments_since(cursor['fetched_at'])):
+                if comment.id > cursor['last_id']:
+                    new.append(comment)
+                else:
+                    edited[comment.id] = comment
+            if cursor['count'] + len(new) == self.comments_counted:
+                for comment in reversed(new):
+                    yield comment
+                for row in cursor['comments']:
+                    comment = CommentRecord.from_stored(row)
+                    yield edited.get(comment.id, comment)
+                for comment in self.older_comments(
+                        cursor['count'] - len(cursor['comments'])):
+                    yield comment
+                return
+            self.comment_cursor = None
+        for comment in self.older_comments(self.comments_counted):
+            yield comment
+
+    def get_comment_cursor(self):
+        """Returns what the next sweep needs to know of the comments read
+        in this one"""
+        if self.comments_counted is None:
+            return self.comment_cursor
+        fetched = self.snapshot.comments.fetched
+        return {
+            'last_id': fetched[0].id if fetched else 0,
+            'count': self.comments_counted,
+            'fetched_at': format_timestamp(self.comments_fetched_at),
+            'comments': [comment.to_stored()
+                         for comment in fetched[:MAX_CURSOR_COMMENTS]],
+        }
 
     def get_comments(self):
-        """Returns all current comments of the PR"""
-        if not self.current_comments:
-            self.current_comments = self.instance.get_issue_comments().reversed
-        return self.current_comments
+        """Returns all current comments of the PR, newest first"""
+        if not self.snapshot.is_loaded('comments'):
+            self.snapshot.comments = CommentStream(self.iter_comments())
+        return self.snapshot.comments
+
+    @instrument.step("prefetch")
+    def prefetch(self, skip_optional=False):
+        """Loads all data the triage rules may need from the API"""
+        self.get_pr_files()
+        self.get_current_labels()
+        # Comment processing stops at the newest bot comment
+        for comment in self.get_comments():
+            if comment.login in BOTLIST:
+                break
+        if not skip_optional and not self.is_a_wip():
+            self.is_mergeable()
+            # A failed build would mostly label needs_revision again, see
+            # Triage.run_revision_checks()
+            if "needs_revision" not in self.get_current_labels():
+                self.get_build_state()
 
     def resolve_desired_pr_labels(self, desired_pr_label):
         """Resolves boilerplate the key labels to labels using an
@@ -225,35 +640,173 @@ class PullRequest:
         if boilerplate and boilerplate not in self.desired_comments:
             self.desired_comments.append(boilerplate)
 
-    def add_label(self, label=None):
-        """Adds a label to the PR using the GitHub API"""
-        self.get_issue().add_to_labels(label)
-
-    def remove_label(self, label=None):
-        """Removes a label from the PR using the GitHub API"""
-        self.get_issue().remove_from_labels(label)
-
-    def add_comment(self, comment=None):
-        """ Adds a comment to the PR using the GitHub API"""
-        self.get_issue().create_comment(comment)
+    def write(self, verb, path, data):
+        """Sends a write to the issue of the PR, path is relative to the
+        URL of the issue"""
+        actionqueue.send(self.requester, verb,
+                         "%s/issues/%s%s" % (self.repo.url, self.pr_number,
+                                             path),
+                         data)
+
+
+class Options(object):
+    """Settings of a run, as given on the command line. Any not given
+    keep their value in DEFAULTS."""
+
+    DEFAULTS = {
+        'verbose': None,
+        'github_user': None,
+        'github_pass': None,
+        'github_token': None,
+        'pr_number': None,
+        'start_at_pr': None,
+        'always_pause': False,
+        'force': False,
+        'cache_dir': None,
+        'state_dir': None,
+        'incremental': False,
+        'workers': None,
+        'pool_size': None,
+        'budget': None,
+        'mergeable_deadline': DEFAULT_MERGEABLE_DEADLINE,
+        'record': None,
+        'replay': None,
+        'replay_latency': None,
+        'base_url': ghclient.DEFAULT_BASE_URL,
+        'profile': None,
+        'since': None,
+        'since_last_run': False,
+        'writers': actionqueue.DEFAULT_WRITERS,
+    }
+
+    def __init__(self, **settings):
+        unknown = set(settings) - set(self.DEFAULTS)
+        if unknown:
+            raise TypeError("Unknown options: %s" %
+                            ", ".join(sorted(unknown)))
+        self.__dict__.update(self.DEFAULTS)
+        self.__dict__.update(settings)
+
+    def replace(self, **settings):
+        """Returns a copy with settings changed"""
+        copy = dict(self.__dict__)
+        copy.update(settings)
+        return Options(**copy)
 
 
 class Triage:
-    def __init__(self, verbose=None, github_user=None, github_pass=None,
-                 github_token=None, github_repo=None, pr_number=None,
-                 start_at_pr=None, always_pause=False, force=False):
-        self.verbose = verbose
-        self.github_user = github_user
-        self.github_pass = github_pass
-        self.github_token = github_token
+    """Triage of the PRs of the repo github_repo. options are the Options
+    of the run, the other arguments set repos apart when several are
+    triaged in one process."""
+
+    def __init__(self, github_repo, options=None, full_name=None,
+                 maintainers_file=None, namespace_labels=None,
+                 static_labels=None, shared=False, client=None,
+                 ansible_members=None, command_scanner=None):
+        options = options or Options()
+        self.verbose = options.verbose
+        self.github_user = options.github_user
+        self.github_pass = options.github_pass
+        self.github_token = options.github_token
+        # Name of the repo in state files and output, and on GitHub
         self.github_repo = github_repo
-        self.pr_number = pr_number
-        self.start_at_pr = start_at_pr
-        self.always_pause = always_pause
-        self.force = force
+        self.full_name = full_name or ("ansible/ansible-modules-%s" %
+                                       github_repo)
+        self.maintainers_file = (maintainers_file or
+                                 MAINTAINERS_FILES[github_repo])
+        # Label policy, see MODULE_NAMESPACE_LABELS and IGNORE_LABELS
+        self.namespace_labels = (MODULE_NAMESPACE_LABELS
+                                 if namespace_labels is None
+                                 else namespace_labels)
+        self.static_labels = (IGNORE_LABELS if static_labels is None
+                              else static_labels)
+        self.pr_number = options.pr_number
+        self.start_at_pr = options.start_at_pr
+        self.always_pause = options.always_pause
+        self.force = options.force
+        self.cache_dir = options.cache_dir
+        self.state_dir = options.state_dir or statestore.DEFAULT_STATE_DIR
+        self.incremental = options.incremental
+        self.workers = options.workers
+        self.pool_size = max(options.pool_size or ghclient.DEFAULT_POOL_SIZE,
+                             (options.workers or 0) + options.writers + 2)
+        self.budget = options.budget
+        self.mergeable_deadline = options.mergeable_deadline
+        self.replay_latency = options.replay_latency
+        self.base_url = options.base_url
+        self.profile = options.profile
+        # Set when running in one process with the Triage of other repos,
+        # which may hand over their client, membership and command caches
+        self.shared = shared
+        self.client = client
+        self.meter = client.meter if client else instrument.Meter()
+
+        # Traffic of the run is recorded into or replayed from a cassette
+        self.cassette = None
+        self.replay = bool(options.replay)
+        if options.replay:
+            self.cassette = ghclient.Cassette.load(options.replay)
+        elif options.record:
+            self.cassette = ghclient.Cassette(options.record)
+
+        self.response_cache = None
+        if self.cache_dir:
+            self.response_cache = ghclient.ResponseCache(
+                cache_dir=self.cache_dir
+            )
 
+        self.pr_state = statestore.JsonStore(
+            os.path.join(self.state_dir, "%s-prs.json" % self.github_repo)
+        )
+        self.comment_cursors = statestore.JsonStore(
+            os.path.join(self.state_dir,
+                         "%s-comment-cursors.json" % self.github_repo)
+        )
+        # Start of the last sweep that went over all PRs
+        self.runs = statestore.JsonStore(
+            os.path.join(self.state_dir, "%s-runs.json" % self.github_repo)
+        )
+        self.since = options.since
+        if options.since_last_run:
+            last_started_at = self.runs.get('last_started_at')
+            self.since = (parse_timestamp(last_started_at)
+                          if last_started_at else None)
+        self.stopped_early = False
+        # Writes planned and PRs finished in the current sweep
+        self.journal = statestore.ActionJournal(
+            os.path.join(self.state_dir, "%s-journal.jsonl" % self.github_repo)
+        )
+        # When the bot comment of a PR times out, see get_warning_due()
+        timers_path = os.path.join(self.state_dir,
+                                   "%s-warning-timers.json" % self.github_repo)
+        self.warning_timers = statestore.TimerWheel(timers_path)
+        self.actions_executed = False
+        self.ansible_members = ansible_members or statestore.MembershipCache(
+            os.path.join(self.state_dir, "%s-members.json" % ANSIBLE_ORG)
+        )
+        self.commit_states = statestore.CommitStateCache(
+            os.path.join(self.state_dir,
+                         "%s-commit-states.json" % self.github_repo)
+        )
+        self.command_scanner = command_scanner or commands.CommandScanner(
+            statestore.JsonStore(os.path.join(self.state_dir,
+                                              "comment-commands.json"))
+        )
+
+        # PRs waiting for GitHub to compute their mergeable state, a heap of
+        # (next check, sequence, attempt, deadline, pull request)
+        self.mergeable_queue = []
+        self.mergeable_seq = itertools.count()
+
+        # Set while a pipeline applies actions in a stage of its own
+        self.defer_actions = False
+        self.deferred_actions = None
+        self.action_queue = actionqueue.ActionQueue(self.write_actions,
+                                                    writers=options.writers)
+
+        # IssueSnapshot by number of every open issue, see snapshot_issues()
+        self.issue_snapshot = {}
         self.pull_request = None
-        self.maintainers = {}
         self.module_maintainers = []
         self.actions = {
             'newlabel': [],
@@ -263,19 +816,24 @@ class Triage:
 
     def _connect(self):
         """Connects to GitHub's API"""
-        return Github(login_or_token=self.github_token or self.github_user,
-                      password=self.github_pass)
+        if not self.client:
+            self.client = ghclient.GithubClient(
+                login_or_token=self.github_token or self.github_user,
+                password=self.github_pass,
+                base_url=self.base_url,
+                pool_size=self.pool_size,
+                cache=self.response_cache,
+                budget=self.budget,
+                cassette=self.cassette,
+                replay=self.replay,
+                replay_latency=self.replay_latency,
+                meter=self.meter,
+            )
+        return self.client.github
 
     def _get_maintainers(self):
-        """Reads all known maintainers from files and their owner namespace"""
-        if not self.maintainers:
-            f = open(MAINTAINERS_FILES[self.github_repo])
-            for line in f:
-                owner_space = (line.split(': ')[0]).strip()
-                maintainers_string = (line.split(': ')[-1]).strip()
-                self.maintainers[owner_space] = maintainers_string.split(' ')
-            f.close()
-        return self.maintainers
+        """Returns the index of all known maintainers by owner namespace"""
+        return maintainerindex.load(self.maintainers_file)
 
     def debug(self, msg=""):
         """Prints debug message if verbosity is given"""
@@ -283,47 +841,81 @@ class Triage:
             print("Debug: " + msg)
 
     def get_module_maintainers(self):
-        """Returns the dict of maintainers using the key as owner namespace"""
+        """Returns the list of maintainers of the files of the PR"""
         if self.module_maintainers:
             return self.module_maintainers
 
-        for owner_space, maintainers in self._get_maintainers().iteritems():
-            for filename in self.pull_request.get_pr_filenames():
-                if owner_space in filename:
-                    for maintainer in maintainers:
-                        if maintainer not in self.module_maintainers:
-                            self.module_maintainers.extend(maintainers)
+        self.module_maintainers = self._get_maintainers().lookup_all(
+            self.pull_request.get_pr_filenames()
+        )
         return self.module_maintainers
 
+    @instrument.step("labels")
     def keep_current_main_labels(self):
         current_labels = self.pull_request.get_current_labels()
         for current_label in current_labels:
             if current_label in MUTUALLY_EXCLUSIVE_LABELS:
                 self.pull_request.add_desired_label(name=current_label)
 
-    def is_ansible_member(self, login):
-        user = self._connect().get_user(login)
-        return self._connect().get_organization("ansible").has_in_members(user)
+    @instrument.step("ansible_members")
+    def prefetch_ansible_members(self):
+        """Loads all ansible org members with one paginated listing unless
+        the cached listing is still fresh"""
+        if self.ansible_members.listing_is_fresh():
+            return
+        self.debug(msg="Loading members of %s" % ANSIBLE_ORG)
+        org = self._connect().get_organization(ANSIBLE_ORG)
+        self.ansible_members.set_members(
+            member.login for member in org.get_members()
+        )
 
+    @instrument.step("ansible_member")
+    def is_ansible_member(self, login):
+        member = self.ansible_members.get(login)
+        if member is None:
+            github = self._connect()
+            user = github.get_user(login)
+            member = github.get_organization(ANSIBLE_ORG).has_in_members(user)
+            self.ansible_members.set(login, member)
+        return member
+
+    def should_defer_fetches(self, pull_request):
+        """Returns True if data which could only label the PR
+        needs_revision again should not be fetched to save API calls"""
+        return ("needs_revision" in pull_request.get_current_labels()
+                and self.client.rate_limiter.is_low())
+
+    @instrument.step("mergeability")
     def add_desired_labels_for_not_mergeable(self):
         """Adds labels for not mergeable conditions"""
-        if not self.pull_request.is_mergeable():
+        if self.should_defer_fetches(self.pull_request):
+            self.debug(msg="API budget low, deferring mergeable state")
+            self.pull_request.deferred_fetches.append("mergeable_state")
+            return
+        mergeable = self.pull_request.is_mergeable()
+        if mergeable is None:
+            self.debug(msg="Mergeable state still unknown, deciding "
+                           "without it")
+            self.pull_request.deferred_fetches.append("mergeable_state")
+        elif not mergeable:
             self.debug(msg="PR is not mergeable")
             self.pull_request.add_desired_label(name="needs_revision_not_mergeable")
         else:
             self.debug(msg="PR is mergeable")
 
+    @instrument.step("labels")
     def add_desired_labels_by_namespace(self):
         """Adds labels regarding module namespaces"""
         for pr_filename in self.pull_request.get_pr_filenames():
             namespace = pr_filename.split('/')[0]
-            for key, value in MODULE_NAMESPACE_LABELS.iteritems():
+            for key, value in self.namespace_labels.iteritems():
                 if key == namespace:
                     self.pull_request.add_desired_label(value)
 
+    @instrument.step("labels")
     def add_labels_by_issue_type(self):
         """Adds labels by issue type"""
-        body = self.pull_request.instance.body
+        body = self.pull_request.snapshot.body
 
         if not body:
             self.debug(msg="PR has no description")
@@ -346,6 +938,7 @@ class Triage:
             self.debug(msg="Feature Pull Request")
             self.pull_request.add_desired_label(name="feature_pull_request")
 
+    @instrument.step("labels")
     def add_desired_labels_by_gitref(self):
         """Adds labels regarding gitref"""
         if "stable" in self.pull_request.get_base_ref():
@@ -353,16 +946,22 @@ class Triage:
             self.pull_request.add_desired_label(name="core_review")
             self.pull_request.add_desired_label(name="backport")
 
+    @instrument.step("build_state")
     def add_desired_label_by_build_state(self):
         """Adds label regarding build state of last commit"""
-        build_status = self.pull_request.get_build_status()
-        if build_status:
-            self.debug(msg="Build state is %s" % build_status.state)
-            if build_status.state == "failure":
+        if self.should_defer_fetches(self.pull_request):
+            self.debug(msg="API budget low, deferring build state")
+            self.pull_request.deferred_fetches.append("build_state")
+            return
+        build_state = self.pull_request.get_build_state()
+        if build_state:
+            self.debug(msg="Build state is %s" % build_state)
+            if build_state == "failure":
                 self.pull_request.add_desired_label(name="needs_revision")
         else:
             self.debug(msg="No build state")
 
+    @instrument.step("maintainers")
     def add_desired_labels_by_maintainers(self):
         """Adds labels regarding maintainer infos"""
         module_maintainers = self.get_module_maintainers()
@@ -415,6 +1014,7 @@ class Triage:
                 name="community_review_existing"
             )
 
+    @instrument.step("comments")
     def process_comments(self):
         """ Processes PR comments for matching criteria for adding labels"""
         module_maintainers = self.get_module_maintainers()
@@ -423,12 +1023,15 @@ class Triage:
         self.debug(msg="--- START Processing Comments:")
 
         for comment in comments:
+            found = comment.commands
+            if found is None:
+                found = self.command_scanner.scan_comment(comment)
 
             # Is the last useful comment from a bot user?  Then we've got a
             # potential timeout case. Let's explore!
-            if comment.user.login in BOTLIST:
+            if comment.login in BOTLIST:
 
-                self.debug(msg="%s is in botlist: " % comment.user.login)
+                self.debug(msg="%s is in botlist: " % comment.login)
 
                 today = datetime.today()
                 time_delta = today - comment.created_at
@@ -437,14 +1040,16 @@ class Triage:
                 self.debug(msg="Days since last bot comment: %s" %
                            comment_days_old)
 
-                if comment_days_old > 14:
+                self.pull_request.last_bot_comment_at = comment.created_at
+
+                if comment_days_old > BOT_COMMENT_TIMEOUT_DAYS:
                     pr_labels = self.pull_request.desired_pr_labels
 
                     if "core_review" in pr_labels:
                         self.debug(msg="has core_review")
                         break
 
-                    if "pending" not in comment.body:
+                    if "pending" not in found:
                         if self.pull_request.is_labeled_for_interaction():
                             self.pull_request.add_desired_comment(
                                 boilerplate="submitter_first_warning"
@@ -481,42 +1086,41 @@ class Triage:
                             )
                             break
                 self.debug(msg="STATUS: no useful state change since last pass"
-                           "( %s )" % comment.user.login)
+                           "( %s )" % comment.login)
                 break
 
-            if (comment.user.login in module_maintainers
-                or comment.user.login.lower() in module_maintainers):
+            if (comment.login in module_maintainers
+                or comment.login.lower() in module_maintainers):
                 self.debug(msg="%s is module maintainer commented on %s." %
-                           (comment.user.login, comment.created_at))
+                           (comment.login, comment.created_at))
 
-                if ("shipit" in comment.body or "+1" in comment.body
-                    or "LGTM" in comment.body):
+                if found & commands.SHIPIT_COMMANDS:
                     self.debug(msg="...said shipit!")
                     # if maintainer was the submitter:
-                    if comment.user.login == self.pull_request.get_pr_submitter():
+                    if comment.login == self.pull_request.get_pr_submitter():
                         self.pull_request.add_desired_label(name="shipit_owner_pr")
                     else:
                         self.pull_request.add_desired_label(name="shipit")
                     break
 
-                elif "needs_revision" in comment.body:
+                elif "needs_revision" in found:
                     self.debug(msg="...said needs_revision!")
                     self.pull_request.add_desired_label(name="needs_revision")
                     break
 
-                elif "needs_info" in comment.body:
+                elif "needs_info" in found:
                     self.debug(msg="...said needs_info!")
                     self.pull_request.add_desired_label(name="needs_info")
 
-                elif "close_me" in comment.body:
+                elif "close_me" in found:
                     self.debug(msg="...said close_me!")
                     self.pull_request.add_desired_label(name="pending_action_close_me")
                     break
 
-            if comment.user.login == self.pull_request.get_pr_submitter():
+            if comment.login == self.pull_request.get_pr_submitter():
                 self.debug(msg="%s is PR submitter commented on %s." %
-                           (comment.user.login, comment.created_at))
-                if "ready_for_review" in comment.body:
+                           (comment.login, comment.created_at))
+                if "ready_for_review" in found:
                     self.debug(msg="...ready for review!")
                     if "ansible" in module_maintainers:
                         self.debug(msg="core does the review!")
@@ -536,23 +1140,22 @@ class Triage:
                         )
                     break
 
-            if (comment.user.login not in BOTLIST
-                and self.is_ansible_member(comment.user.login)):
+            if (found and comment.login not in BOTLIST
+                and self.is_ansible_member(comment.login)):
 
-                self.debug(msg="%s is a ansible member" % comment.user.login)
+                self.debug(msg="%s is a ansible member" % comment.login)
 
-                if ("shipit" in comment.body or "+1" in comment.body
-                    or "LGTM" in comment.body):
+                if found & commands.SHIPIT_COMMANDS:
                     self.debug(msg="...said shipit!")
                     self.pull_request.add_desired_label(name="shipit")
                     break
 
-                elif "needs_revision" in comment.body:
+                elif "needs_revision" in found:
                     self.debug(msg="...said needs_revision!")
                     self.pull_request.add_desired_label(name="needs_revision")
                     break
 
-                elif "needs_info" in comment.body:
+                elif "needs_info" in found:
                     self.debug(msg="...said needs_info!")
                     self.pull_request.add_desired_label(name="needs_info")
                     break
@@ -571,6 +1174,7 @@ class Triage:
         comment = template.render(maintainer=maintainers, submitter=submitter)
         return comment
 
+    @instrument.step("actions")
     def create_actions(self):
         """Creates actions from the desired label, unlabel and comment actions
         lists"""
@@ -620,7 +1224,7 @@ class Triage:
         for current_pr_label in self.pull_request.get_current_labels():
 
             # some labels we just ignore
-            if current_pr_label in IGNORE_LABELS:
+            if current_pr_label in self.static_labels:
                 continue
 
             # now check if we need to unlabel
@@ -632,6 +1236,36 @@ class Triage:
             self.debug(msg=comment)
             self.actions['comments'].append(comment)
 
+    def build_state_matters(self):
+        """Returns False if a failed build could not change the actions
+        after the mergeable state was looked at"""
+        desired_labels = self.pull_request.desired_pr_labels
+        if "needs_revision" in desired_labels:
+            return False
+        # Both end up as the needs_revision label the PR already has
+        return not ("needs_revision_not_mergeable" in desired_labels and
+                    "needs_revision" in
+                    self.pull_request.get_current_labels())
+
+    def run_revision_checks(self):
+        """Runs the checks which can only ask for needs_revision, the one
+        whose data is cheaper to get first. The other is skipped if its
+        outcome can not change the actions anymore."""
+        if (self.pull_request.fetch_cost('build_state') <
+                self.pull_request.fetch_cost('mergeable_state')):
+            self.add_desired_label_by_build_state()
+            if self.pull_request.build_state == "failure":
+                # Run after it, the failed build would overrule it
+                self.debug(msg="Build failed, mergeable state not needed")
+                return
+            self.add_desired_labels_for_not_mergeable()
+        else:
+            self.add_desired_labels_for_not_mergeable()
+            if not self.build_state_matters():
+                self.debug(msg="Labels decided, build state not needed")
+                return
+            self.add_desired_label_by_build_state()
+
     def process(self):
         """Processes the PR"""
         # clear all actions
@@ -642,11 +1276,14 @@ class Triage:
         }
         # clear module maintainers
         self.module_maintainers = []
+        self.actions_executed = False
         # print some general infos about the PR to be processed
+        if self.shared:
+            print("\n%s" % self.full_name, end="")
         print("\nPR #%s: %s" % (self.pull_request.pr_number,
-                                (self.pull_request.instance.title).encode('ascii','ignore')))
-        print("Created at %s" % self.pull_request.instance.created_at)
-        print("Updated at %s" % self.pull_request.instance.updated_at)
+                                (self.pull_request.snapshot.title).encode('ascii','ignore')))
+        print("Created at %s" % self.pull_request.snapshot.created_at)
+        print("Updated at %s" % self.pull_request.snapshot.updated_at)
 
         self.keep_current_main_labels()
         self.add_desired_labels_by_namespace()
@@ -659,8 +1296,7 @@ class Triage:
             self.add_desired_labels_by_gitref()
             # process comments after labels
             self.process_comments()
-            self.add_desired_labels_for_not_mergeable()
-            self.add_desired_label_by_build_state()
+            self.run_revision_checks()
             self.add_labels_by_issue_type()
 
         self.create_actions()
@@ -669,11 +1305,10 @@ class Triage:
         print("Submitter: %s" % self.pull_request.get_pr_submitter())
         print("Maintainers: %s" % ', '.join(self.get_module_maintainers()))
         print("Current Labels: %s" %
-              ', '.join(self.pull_request.current_pr_labels))
+              ', '.join(self.pull_request.get_current_labels()))
         print("Actions: %s" % self.actions)
 
-        if (self.actions['newlabel'] or self.actions['unlabel'] or
-                self.actions['comments']):
+        if self.has_actions():
             if self.force:
                 print("Running actions non-interactive as you forced.")
                 self.execute_actions()
@@ -691,34 +1326,608 @@ class Triage:
         else:
             print("Skipping.")
 
+    def has_actions(self):
+        """Returns True if processing the PR resulted in actions"""
+        return bool(self.actions['newlabel'] or self.actions['unlabel'] or
+                    self.actions['comments'])
+
+    def needs_triage(self):
+        """Returns True if the PR changed or a warning became due since it
+        was last processed"""
+        state = self.pr_state.get(self.pull_request.pr_number)
+        if not state:
+            return True
+        if state['fingerprint'] != self.pull_request.get_fingerprint():
+            self.debug(msg="PR changed since last run")
+            return True
+        if state['actions_pending']:
+            self.debug(msg="PR has actions not taken in last run")
+            return True
+        if state.get('deferred_fetches'):
+            self.debug(msg="PR was only partially triaged in last run")
+            return True
+        due = self.warning_timers.store.get(self.pull_request.pr_number)
+        if due is not None and due <= time.time():
+            self.debug(msg="Bot comment timed out since last run")
+            return True
+        return False
+
+    def record_state(self):
+        """Remembers the inputs and outcome of processing the PR"""
+        self.comment_cursors.set(self.pull_request.pr_number,
+                                 self.pull_request.get_comment_cursor())
+        warning_due = self.pull_request.get_warning_due()
+        if warning_due:
+            self.warning_timers.schedule(self.pull_request.pr_number,
+                                         time.mktime(warning_due.timetuple()))
+        else:
+            self.warning_timers.cancel(self.pull_request.pr_number)
+        self.pr_state.set(self.pull_request.pr_number, {
+            'fingerprint': self.pull_request.get_fingerprint(),
+            'actions': self.actions,
+            'actions_pending': (self.has_actions() and
+                                not self.actions_executed),
+            'deferred_fetches': self.pull_request.deferred_fetches,
+        })
+
     def execute_actions(self):
-        """Turns the actions into API calls"""
-        for unlabel in self.actions['unlabel']:
-            self.debug(msg="API Call unlabel: " + unlabel)
-            self.pull_request.remove_label(label=unlabel)
-        for newlabel in self.actions['newlabel']:
-            self.debug(msg="API Call newlabel: " + newlabel)
-            self.pull_request.add_label(label=newlabel)
-        for comment in self.actions['comments']:
-            self.debug(msg="API Call comment: " + comment)
-            self.pull_request.add_comment(comment=comment)
+        """Turns the actions into API calls. Unless asked before every PR,
+        they are queued and written in the background."""
+        self.actions_executed = True
+        if self.defer_actions:
+            self.deferred_actions = self.actions
+            return
+        self.queue_actions(self.pull_request, self.actions)
+        if not self.force:
+            self.finish_writes()
+
+    def queue_actions(self, pull_request, actions):
+        """Journals the writes for the actions of a PR and hands them to
+        the writer threads"""
+        writes = actionqueue.plan_writes(actions)
+        self.journal.planned(pull_request.pr_number, writes)
+        self.action_queue.submit(pull_request, writes)
+
+    def write_actions(self, pull_request, writes):
+        """Applies queued writes, called in a writer thread"""
+        with self.meter.pull_request(self.meter_key(pull_request.pr_number)):
+            self.apply_actions(pull_request, writes)
+
+    @instrument.step("writes")
+    def apply_actions(self, pull_request, writes):
+        """Makes the API calls planned for a PR, journaling each"""
+        for index, (verb, path, data) in enumerate(writes):
+            self.debug(msg="API Call %s %s: %s" % (verb, path, data))
+            pull_request.write(verb, path, data)
+            self.journal.written(pull_request.pr_number, index)
+        self.journal.finish(pull_request.pr_number)
+
+    def finish_writes(self):
+        """Waits for the queued actions to be written. PRs whose actions
+        failed are left for the next run to take them again, and returned
+        as a dict of number to error."""
+        failed = {}
+        for pull_request, writes, error in self.action_queue.flush():
+            print("Error: PR #%s: writing actions failed: %s" %
+                  (pull_request.pr_number, error), file=sys.stderr)
+            failed[pull_request.pr_number] = str(error)
+            self.journal.failed(pull_request.pr_number)
+            state = self.pr_state.get(pull_request.pr_number)
+            if state:
+                state['actions_pending'] = True
+        return failed
+
+    def within_budget(self, pulls):
+        """Yields pulls until the API budget of the sweep is used up"""
+        for pull in pulls:
+            if self.client.rate_limiter.is_exhausted():
+                self.stopped_early = True
+                print("\nAPI budget of %s calls used up, stopping before "
+                      "PR #%s. The next run continues the sweep."
+                      % (self.budget, pull.number))
+                return
+            yield pull
+
+    def finished_in_sweep(self, pull):
+        """Returns True if an earlier run of the resumed sweep finished the
+        PR and it was not updated since"""
+        if not self.journal.is_resuming():
+            return False
+        updated_at = calendar.timegm(pull.updated_at.timetuple())
+        if not self.journal.is_finished(pull.number, updated_at):
+            return False
+        print("\nPR #%s: finished earlier in this sweep, skipping."
+              % pull.number)
+        return True
+
+    def was_commented(self, repo, number, body, since):
+        """Returns True if the issue got a comment with body since the
+        given time, seconds since the epoch"""
+        _, comments = self.client.requester.requestJsonAndCheck(
+            "GET", "%s/issues/%s/comments" % (repo.url, number),
+            parameters={
+                "since": format_timestamp(datetime.utcfromtimestamp(since)),
+                "per_page": COMMENTS_PER_PAGE,
+            }
+        )
+        return any(comment['body'] == body for comment in comments)
+
+    def resume_writes(self, repo):
+        """Sends the writes an interrupted run planned but did not get to.
+        A comment is only posted if it is not there yet, the run may have
+        died between posting it and journaling that."""
+        for number, plan in sorted(self.journal.unfinished.items()):
+            print("PR #%s: finishing the writes of an interrupted run"
+                  % number)
+            try:
+                for index, (verb, path, data) in enumerate(plan['writes']):
+                    if index in plan['written']:
+                        continue
+                    if not (path == '/comments' and self.was_commented(
+                            repo, number, data['body'], plan['at'])):
+                        self.debug(msg="API Call %s %s: %s" %
+                                       (verb, path, data))
+                        actionqueue.send(self.client.requester, verb,
+                                         "%s/issues/%s%s" % (repo.url, number,
+                                                             path),
+                                         data)
+                    self.journal.written(number, index)
+            except github.GithubException as e:
+                print("Error: PR #%s: writing actions failed: %s" %
+                      (number, e), file=sys.stderr)
+                self.journal.failed(number)
+                continue
+            self.journal.finish(number)
+
+    def needs_mergeable_state(self):
+        """Returns True if the rules will look at the mergeable state of
+        the current PR"""
+        pull_request = self.pull_request
+        if pull_request.is_a_wip() or self.should_defer_fetches(pull_request):
+            return False
+        # See run_revision_checks()
+        return not (pull_request.fetch_cost('build_state') <
+                    pull_request.fetch_cost('mergeable_state') and
+                    pull_request.get_build_state() == "failure")
+
+    def defer_until_mergeable_known(self):
+        """Queues the current PR until GitHub computed its mergeable state"""
+        now = time.time()
+        heapq.heappush(self.mergeable_queue, (
+            now + MERGEABLE_RETRY_DELAY,
+            next(self.mergeable_seq),
+            0,
+            now + self.mergeable_deadline,
+            self.pull_request,
+        ))
+
+    def due_deferred(self, wait=False):
+        """Yields queued PRs whose mergeable state is known now or whose
+        deadline passed. Rechecks are backed off exponentially. Unless wait
+        is given, returns as soon as no recheck is due."""
+        while self.mergeable_queue:
+            check_at, seq, attempt, deadline, pull_request = \
+                self.mergeable_queue[0]
+            now = time.time()
+            if check_at > now:
+                if not wait:
+                    return
+                time.sleep(check_at - now)
+            heapq.heappop(self.mergeable_queue)
+
+            pull_request.refresh()
+            if (pull_request.is_mergeable() is None and
+                    time.time() < deadline):
+                delay = min(MERGEABLE_RETRY_DELAY * 2 ** (attempt + 1),
+                            MERGEABLE_MAX_RETRY_DELAY)
+                heapq.heappush(self.mergeable_queue, (
+                    min(time.time() + delay, deadline), seq, attempt + 1,
+                    deadline, pull_request,
+                ))
+                continue
+            pull_request.mergeable_wait_over = True
+            yield pull_request
+
+    def triage_deferred(self, wait=False):
+        """Processes the queued PRs which are due"""
+        for pull_request in self.due_deferred(wait=wait):
+            self.pull_request = pull_request
+            self.triage_pull_request()
+
+    def triage_pull_request(self):
+        """Processes the current PR unless incremental mode may skip it or
+        its mergeable state is not known yet"""
+        with self.meter.pull_request(
+                self.meter_key(self.pull_request.pr_number)):
+            if self.incremental and not self.needs_triage():
+                print("\nPR #%s: unchanged since last run, skipping."
+                      % self.pull_request.pr_number)
+                self.journal.finish(self.pull_request.pr_number)
+                return
+            if (not self.pull_request.mergeable_wait_over and
+                    self.needs_mergeable_state() and
+                    self.pull_request.is_mergeable() is None):
+                print("\nPR #%s: mergeable state unknown, coming back to "
+                      "it later." % self.pull_request.pr_number)
+                self.defer_until_mergeable_known()
+                return
+            self.process()
+            self.record_state()
+            if not self.actions_executed:
+                self.journal.finish(self.pull_request.pr_number)
+
+    @instrument.step("issue_snapshot")
+    def snapshot_issues(self, repo):
+        """Loads the labels and other fields of all open issues, PRs
+        included, with one paginated listing"""
+        self.issue_snapshot = {}
+        params = {"state": "open", "per_page": ISSUES_PER_PAGE}
+        if self.since:
+            params["since"] = format_timestamp(self.since)
+        # Not repo.get_issues(), its per_page would need to be set on the
+        # Github object, which breaks reversed listings in PyGithub 1.26
+        issues = github.PaginatedList.PaginatedList(
+            github.Issue.Issue,
+            self.client.requester,
+            repo.url + "/issues",
+            params
+        )
+        for issue in issues:
+            self.issue_snapshot[issue.number] = IssueSnapshot(issue)
+        self.debug(msg="Loaded %d open issues" % len(self.issue_snapshot))
+
+    def list_pulls(self, repo):
+        """Yields the open PRs to triage. With a since cutoff only the PRs
+        updated after it are listed, newest first, and the PRs whose bot
+        comment timed out since."""
+        if not self.since:
+            for pull in repo.get_pulls():
+                yield pull
+            return
+
+        seen = set()
+        pulls = github.PaginatedList.PaginatedList(
+            github.PullRequest.PullRequest,
+            self.client.requester,
+            repo.url + "/pulls",
+            {"state": "open", "sort": "updated", "direction": "desc",
+             "per_page": ISSUES_PER_PAGE}
+        )
+        for pull in pulls:
+            if pull.updated_at < self.since:
+                break
+            seen.add(pull.number)
+            yield pull
+
+        # Warnings are due without the PR being updated
+        for number, _ in self.warning_timers.due():
+            if number in seen:
+                continue
+            pull = repo.get_pull(number)
+            if pull.state == "open":
+                yield pull
+            else:
+                self.warning_timers.cancel(number)
+
+    def meter_key(self, number):
+        """Returns what the meter accounts the PR number to, qualified by
+        the repo if the meter is shared with the Triage of other repos"""
+        if self.shared:
+            return "%s#%s" % (self.github_repo, number)
+        return number
+
+    def make_pull_request(self, repo, pull=None, pr_number=None):
+        """Returns a PullRequest sharing the caches of this run"""
+        number = pull.number if pull else pr_number
+        return PullRequest(repo=repo, pr_number=pr_number, pr=pull,
+                           meter=self.meter,
+                           commit_states=self.commit_states,
+                           issue_snapshot=self.issue_snapshot.get(number),
+                           comment_cursor=self.comment_cursors.get(number),
+                           command_scanner=self.command_scanner,
+                           requester=self.client.requester)
 
     def run(self):
         """Starts a triage run"""
-        repo = self._connect().get_repo("ansible/ansible-modules-%s" %
-                                        self.github_repo)
-
-        if self.pr_number:
-            self.pull_request = PullRequest(repo=repo,
-                                            pr_number=self.pr_number)
-            self.process()
-        else:
-            pulls = repo.get_pulls()
-            for pull in pulls:
-                if self.start_at_pr and pull.number > self.start_at_pr:
-                    continue
-                self.pull_request = PullRequest(repo=repo, pr=pull)
-                self.process()
+        started_at = datetime.utcnow()
+        repo = self._connect().get_repo(self.full_name)
+
+        profiler = None
+        if self.profile:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            self.prefetch_ansible_members()
+            if self.pr_number:
+                self.pull_request = self.make_pull_request(
+                    repo, pr_number=self.pr_number
+                )
+                self.triage_pull_request()
+                self.triage_deferred(wait=True)
+            else:
+                pulls = self.start_sweep(repo)
+                if self.workers:
+                    pipeline.Pipeline(
+                        self,
+                        lambda pull: self.make_pull_request(repo, pull),
+                        workers=self.workers,
+                    ).run(pulls)
+                else:
+                    for _ in self.sweep(repo, pulls):
+                        pass
+                self.end_sweep(started_at)
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(self.profile)
+            self.close()
+            if self.cassette and not self.replay:
+                self.cassette.save()
+        self.print_summary()
+
+    def start_sweep(self, repo):
+        """Starts a sweep of repo, or resumes an interrupted one, and
+        returns the PRs to triage"""
+        if self.journal.is_resuming():
+            print("Resuming the sweep of %s started at %s" % (
+                self.full_name,
+                format_timestamp(datetime.utcfromtimestamp(
+                    self.journal.started_at))))
+        self.journal.start()
+        self.resume_writes(repo)
+        self.snapshot_issues(repo)
+        return self.within_budget(
+            pull for pull in self.list_pulls(repo)
+            if (not self.start_at_pr or pull.number <= self.start_at_pr) and
+            not self.finished_in_sweep(pull)
+        )
+
+    def sweep(self, repo, pulls, wait=True):
+        """Triages pulls one at a time, yielding the number of each. Unless
+        wait is given, the PRs still waiting for their mergeable state at
+        the end are rechecked with multirepo.WAITING yielded in between,
+        instead of sleeping until a recheck is due."""
+        for pull in pulls:
+            self.pull_request = self.make_pull_request(repo, pull)
+            self.triage_pull_request()
+            self.triage_deferred()
+            yield pull.number
+        if wait:
+            self.triage_deferred(wait=True)
+            return
+        while self.mergeable_queue:
+            self.triage_deferred()
+            if self.mergeable_queue:
+                yield multirepo.WAITING
+
+    def end_sweep(self, started_at):
+        """Completes a sweep started at started_at once all PRs are
+        triaged"""
+        self.finish_writes()
+        if not self.stopped_early:
+            self.journal.end()
+        if not self.stopped_early and not self.start_at_pr:
+            self.runs.set('last_started_at', format_timestamp(started_at))
+
+    def close(self):
+        """Waits for the writes of the run and saves its state"""
+        self.finish_writes()
+        self.action_queue.close()
+        self.journal.close()
+        self.save_state()
+
+    def print_summary(self):
+        print("")
+        for line in self.meter.summary():
+            print(line)
+        if self.response_cache:
+            self.debug(msg="Response cache: %(fresh)s fresh, "
+                           "%(not_modified)s not modified, "
+                           "%(fetched)s fetched" % self.response_cache.stats)
+
+    def serve(self, address, secret=None, debounce=webhook.DEFAULT_DEBOUNCE):
+        """Runs as a daemon triaging single PRs on webhook events, see
+        webhook.py"""
+        repo = self._connect().get_repo(self.full_name)
+        self.prefetch_ansible_members()
+        daemon = webhook.Daemon(self, repo, bots=BOTLIST, secret=secret,
+                                debounce=debounce, verbose=self.verbose)
+        try:
+            daemon.serve(address)
+        finally:
+            self.close()
+
+    def enqueue(self, path, shards=workqueue.DEFAULT_SHARDS):
+        """Puts the PRs to triage into the work queue at path instead of
+        triaging them, see workqueue.py and run_worker()"""
+        started_at = datetime.utcnow()
+        repo = self._connect().get_repo(self.full_name)
+        queue = workqueue.WorkQueue(path, shards=shards)
+        try:
+            # The timers are kept with the state of the shards
+            for shard in range(queue.shards):
+                timers = statestore.TimerWheel(os.path.join(
+                    shard_state_dir(self.state_dir, self.github_repo, shard),
+                    "%s-warning-timers.json" % self.github_repo))
+                for number, due in timers.due():
+                    self.warning_timers.schedule(number, due)
+            due = [number for number, _ in self.warning_timers.due()]
+            numbers = [pull.number for pull in
+                       self.within_budget(self.list_pulls(repo))]
+            # Closed in the meantime, the worker drops their timer
+            numbers.extend(number for number in due
+                           if self.warning_timers.store.get(number) is None)
+            added = queue.put(self.github_repo, numbers)
+            retried = queue.requeue_failed(self.github_repo)
+            print("Queued %d of %d PRs of %s, %d failed ones again" %
+                  (added, len(numbers), self.full_name, retried))
+            counts = queue.counts(self.github_repo)
+            print(", ".join("%s %s" % (counts[state], state)
+                            for state in sorted(counts)))
+        finally:
+            queue.close()
+        if not self.stopped_early:
+            self.runs.set('last_started_at', format_timestamp(started_at))
+            self.runs.save()
+
+    def work(self, repo, queue, worker, shard,
+             lease=workqueue.DEFAULT_LEASE):
+        """Triages the PRs of the shard of the work queue the worker
+        leased, until none are left or the lease was lost. Returns False
+        in the latter case."""
+        self.journal.start()
+        self.resume_writes(repo)
+        heartbeat = workqueue.Heartbeat(queue.path, worker, self.github_repo,
+                                        shard, lease)
+        heartbeat.start()
+        try:
+            while not heartbeat.lost.is_set():
+                numbers = queue.take(worker, self.github_repo, shard)
+                if not numbers:
+                    break
+                taken = []
+                failed = {}
+                for number in numbers:
+                    # The rest is taken again by the next holder
+                    if heartbeat.lost.is_set():
+                        break
+                    taken.append(number)
+                    try:
+                        self.pull_request = self.make_pull_request(
+                            repo, pr_number=number)
+                        if self.pull_request.snapshot.state != 'open':
+                            print("\nPR #%s: closed, skipping." % number)
+                            self.warning_timers.cancel(number)
+                            continue
+                        self.triage_pull_request()
+                        self.triage_deferred()
+                    except github.GithubException as e:
+                        print("Error: PR #%s: %s" % (number, e),
+                              file=sys.stderr)
+                        failed[number] = str(e)
+                self.triage_deferred(wait=True)
+                failed.update(self.finish_writes())
+                for number in taken:
+                    if number in failed:
+                        queue.fail(worker, self.github_repo, number,
+                                   failed[number])
+                    else:
+                        queue.ack(worker, self.github_repo, number)
+        finally:
+            heartbeat.stop()
+        if heartbeat.lost.is_set():
+            print("Error: lost the lease of shard %s of %s, leaving it" %
+                  (shard, self.full_name), file=sys.stderr)
+            return False
+        self.journal.end()
+        return True
+
+    def save_state(self):
+        """Writes the state kept between runs"""
+        self.pr_state.save()
+        self.runs.save()
+        self.comment_cursors.save()
+        self.ansible_members.save()
+        self.command_scanner.save()
+        self.commit_states.save()
+        self.warning_timers.save()
+
+
+def shard_state_dir(state_dir, repo, shard):
+    """Returns the directory of the state of a shard of the work queue"""
+    return os.path.join(state_dir, "shards", "%s-%s" % (repo, shard))
+
+
+def run_worker(path, github_repo, options, worker=None,
+               lease=workqueue.DEFAULT_LEASE):
+    """Triages PRs of github_repo taken from the work queue at path until
+    none are left, waiting for the shards held by other workers to be
+    done or their lease to run out, see workqueue.py. Every shard taken
+    is triaged by a Triage of its own with the Options options, keeping
+    its state in shard_state_dir()."""
+    worker = worker or "%s-%s" % (socket.gethostname(), os.getpid())
+    state_dir = options.state_dir or statestore.DEFAULT_STATE_DIR
+    # Holds the client and the caches of the worker, shared by all shards
+    base = Triage(github_repo, options.replace(
+        state_dir=os.path.join(state_dir, "workers", worker)))
+    repo = base._connect().get_repo(base.full_name)
+    options = options.replace(cache_dir=None, record=None, replay=None)
+    queue = workqueue.WorkQueue(path)
+    try:
+        base.prefetch_ansible_members()
+        while True:
+            shard = queue.claim_shard(worker, base.github_repo, lease)
+            if shard is None:
+                if not queue.pending(base.github_repo):
+                    break
+                time.sleep(min(workqueue.CLAIM_INTERVAL, lease))
+                continue
+            print("Worker %s: taking shard %s of %s" %
+                  (worker, shard, base.full_name))
+            triage = Triage(
+                github_repo,
+                options.replace(state_dir=shard_state_dir(
+                    state_dir, github_repo, shard)),
+                client=base.client, ansible_members=base.ansible_members,
+                command_scanner=base.command_scanner)
+            try:
+                triage.work(repo, queue, worker, shard, lease)
+            finally:
+                triage.close()
+                queue.release_shard(worker, base.github_repo, shard)
+    finally:
+        queue.close()
+        base.ansible_members.save()
+        base.command_scanner.save()
+        if base.cassette and not base.replay:
+            base.cassette.save()
+    base.print_summary()
+
+
+def run_repos(repos, options, policy=multirepo.DEFAULT_POLICY):
+    """Sweeps several repos in one process, see multirepo.py. repos are
+    as returned by multirepo.load_config(), the Options options apply to
+    the Triage of every repo."""
+    started_at = datetime.utcnow()
+    options = options.replace(pool_size=max(options.pool_size or 0,
+                                            len(repos) * options.writers + 2))
+    triages = []
+    shared = {}
+    for entry in repos:
+        if triages:
+            first = triages[0]
+            shared = dict(client=first.client,
+                          ansible_members=first.ansible_members,
+                          command_scanner=first.command_scanner)
+            options = options.replace(cache_dir=None, record=None,
+                                      replay=None)
+        triage = Triage(entry['name'], options, full_name=entry['repo'],
+                        maintainers_file=entry['maintainers'],
+                        namespace_labels=entry['namespace_labels'],
+                        static_labels=entry['static_labels'], shared=True,
+                        **shared)
+        triage._connect()
+        triages.append(triage)
+
+    first = triages[0]
+    scheduler = multirepo.Scheduler(
+        cost=(lambda: first.meter.calls) if policy == 'fair' else None
+    )
+    try:
+        first.prefetch_ansible_members()
+        for triage, entry in zip(triages, repos):
+            repo = triage._connect().get_repo(triage.full_name)
+            scheduler.add(triage, entry['weight'],
+                          triage.sweep(repo, triage.start_sweep(repo),
+                                       wait=False))
+        for triage in scheduler.run():
+            triage.end_sweep(started_at)
+    finally:
+        for triage in triages:
+            triage.close()
+        if first.cassette and not first.replay:
+            first.cassette.save()
+    first.print_summary()
 
 
 def main():
@@ -728,7 +1937,14 @@ def main():
                                                  "access to the repo in "
                                                  "question.)")
     parser.add_argument("repo", type=str, choices=['core', 'extras'],
-                        help="Repo to be triaged")
+                        nargs='?', help="Repo to be triaged")
+    parser.add_argument("--repos", type=str, metavar="FILE",
+                        help="Triage the repos listed in this JSON file in "
+                             "one process instead, see multirepo.py")
+    parser.add_argument("--schedule", type=str, choices=multirepo.POLICIES,
+                        default=multirepo.DEFAULT_POLICY,
+                        help="How PRs of several repos are interleaved: "
+                             "fair shares of API calls or of PRs")
     parser.add_argument("--gh-user", "-u", type=str,
                         help="Github username or token of triager")
     parser.add_argument("--gh-pass", "-P", type=str,
@@ -747,30 +1963,226 @@ def main():
                         help="Triage only the specified pr")
     parser.add_argument("--start-at", type=int,
                         help="Start triage at the specified pr")
+    parser.add_argument("--base-url", type=str,
+                        default=ghclient.DEFAULT_BASE_URL,
+                        help="URL of the GitHub API, e.g. of a fakegithub.py "
+                             "server")
+    parser.add_argument("--cache-dir", type=str,
+                        default=ghclient.DEFAULT_CACHE_DIR,
+                        help="Directory of the API response cache")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not cache API responses")
+    parser.add_argument("--state-dir", type=str,
+                        default=statestore.DEFAULT_STATE_DIR,
+                        help="Directory of the state kept between runs")
+    parser.add_argument("--incremental", "-i", action="store_true",
+                        help="Only triage PRs changed since the last run")
+    parser.add_argument("--since", type=str, metavar="TIMESTAMP",
+                        help="Only triage PRs updated after this UTC time, "
+                             "e.g. 2016-05-01T12:00:00Z")
+    parser.add_argument("--since-last-run", action="store_true",
+                        help="Only triage PRs updated since the start of "
+                             "the last complete run")
+    parser.add_argument("--workers", "-w", type=int,
+                        help="Fetch PRs with this many threads, requires "
+                             "--force")
+    parser.add_argument("--writers", type=int,
+                        default=actionqueue.DEFAULT_WRITERS,
+                        help="Threads writing labels and comments")
+    parser.add_argument("--pool-size", type=int,
+                        help="HTTP connections kept open to GitHub")
+    parser.add_argument("--budget", type=int,
+                        help="Maximum number of API calls of this run")
+    parser.add_argument("--mergeable-deadline", type=int,
+                        default=DEFAULT_MERGEABLE_DEADLINE,
+                        help="Seconds to wait for GitHub to compute the "
+                             "mergeable state of a PR before triaging it "
+                             "without")
+    parser.add_argument("--record", type=str, metavar="CASSETTE",
+                        help="Record all API traffic into this file")
+    parser.add_argument("--replay", type=str, metavar="CASSETTE",
+                        help="Serve all API calls from a recorded file, "
+                             "without network access")
+    parser.add_argument("--replay-latency", type=float, metavar="SECONDS",
+                        help="Delay every replayed response")
+    parser.add_argument("--profile", type=str, metavar="FILE",
+                        help="Write a cProfile dump of the run to this file "
+                             "(with --workers, of the decide stage only)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Triage single PRs as GitHub webhook events "
+                             "come in instead of sweeping, requires --force")
+    parser.add_argument("--listen", type=str, metavar="HOST:PORT",
+                        default=webhook.DEFAULT_LISTEN,
+                        help="Address taking webhook events with --daemon")
+    parser.add_argument("--debounce", type=float,
+                        default=webhook.DEFAULT_DEBOUNCE,
+                        help="Seconds without events before a PR is "
+                             "triaged with --daemon")
+    parser.add_argument("--webhook-secret", type=str,
+                        default=os.environ.get("TRIAGE_WEBHOOK_SECRET"),
+                        help="Secret webhook deliveries are signed with "
+                             "(default: $TRIAGE_WEBHOOK_SECRET)")
+    parser.add_argument("--coordinator", type=str, metavar="QUEUE",
+                        help="Put the PRs to triage into this work queue "
+                             "file for --worker processes instead of "
+                             "triaging them, see workqueue.py")
+    parser.add_argument("--worker", type=str, metavar="QUEUE",
+                        help="Triage PRs taken from this work queue file "
+                             "until it is empty, requires --force")
+    parser.add_argument("--worker-id", type=str,
+                        help="Name of this worker in the work queue "
+                             "(default: host name and process id)")
+    parser.add_argument("--lease", type=int, default=workqueue.DEFAULT_LEASE,
+                        help="Seconds after which the PRs of a worker which "
+                             "stopped renewing its lease are taken over")
+    parser.add_argument("--shards", type=int,
+                        default=workqueue.DEFAULT_SHARDS,
+                        help="Shards the PRs are split into, when "
+                             "--coordinator creates the work queue")
     args = parser.parse_args()
 
+    if bool(args.repo) == bool(args.repos):
+        print("Error: Give either a repo or --repos", file=sys.stderr)
+        sys.exit(1)
+
+    repos = None
+    if args.repos:
+        for option in ('pr', 'start_at', 'workers', 'daemon', 'profile'):
+            if getattr(args, option):
+                print("Error: Mutually exclusive: --repos and --%s" %
+                      option.replace('_', '-'), file=sys.stderr)
+                sys.exit(1)
+        try:
+            repos = multirepo.load_config(args.repos)
+        except (IOError, ValueError) as e:
+            print("Error: --repos: %s" % e, file=sys.stderr)
+            sys.exit(1)
+
     if args.pr and args.start_at:
         print("Error: Mutually exclusive: --start-at and --pr",
               file=sys.stderr)
         sys.exit(1)
 
+    if args.since and args.since_last_run:
+        print("Error: Mutually exclusive: --since and --since-last-run",
+              file=sys.stderr)
+        sys.exit(1)
+
+    if args.pr and (args.since or args.since_last_run):
+        print("Error: Mutually exclusive: --since and --pr",
+              file=sys.stderr)
+        sys.exit(1)
+
+    since = None
+    if args.since:
+        try:
+            since = parse_timestamp(args.since)
+        except ValueError as e:
+            print("Error: --since: %s" % e, file=sys.stderr)
+            sys.exit(1)
+
     if args.force and args.pause:
         print("Error: Mutually exclusive: --force and --pause",
               file=sys.stderr)
         sys.exit(1)
 
-    triage = Triage(
+    if args.record and args.replay:
+        print("Error: Mutually exclusive: --record and --replay",
+              file=sys.stderr)
+        sys.exit(1)
+
+    if args.workers and not args.force:
+        print("Error: --workers requires --force", file=sys.stderr)
+        sys.exit(1)
+
+    if args.coordinator and args.worker:
+        print("Error: Mutually exclusive: --coordinator and --worker",
+              file=sys.stderr)
+        sys.exit(1)
+
+    if args.coordinator or args.worker:
+        mode = '--coordinator' if args.coordinator else '--worker'
+        for option in ('repos', 'pr', 'start_at', 'workers', 'daemon',
+                       'profile'):
+            if getattr(args, option):
+                print("Error: Mutually exclusive: %s and --%s" %
+                      (mode, option.replace('_', '-')), file=sys.stderr)
+                sys.exit(1)
+        if args.shards < 1 or args.lease < 1:
+            print("Error: --shards and --lease must be positive",
+                  file=sys.stderr)
+            sys.exit(1)
+
+    if args.worker:
+        if not args.force:
+            print("Error: --worker requires --force", file=sys.stderr)
+            sys.exit(1)
+        if args.since or args.since_last_run:
+            print("Error: --since is up to --coordinator, not --worker",
+                  file=sys.stderr)
+            sys.exit(1)
+
+    listen = None
+    if args.daemon:
+        if not args.force:
+            print("Error: --daemon requires --force", file=sys.stderr)
+            sys.exit(1)
+        for option in ('pr', 'start_at', 'since', 'since_last_run',
+                       'workers'):
+            if getattr(args, option):
+                print("Error: Mutually exclusive: --daemon and --%s" %
+                      option.replace('_', '-'), file=sys.stderr)
+                sys.exit(1)
+        host, _, port = args.listen.rpartition(':')
+        try:
+            listen = (host or 'localhost', int(port))
+        except ValueError:
+            print("Error: --listen: expected HOST:PORT, got %s" %
+                  args.listen, file=sys.stderr)
+            sys.exit(1)
+
+    options = Options(
         verbose=args.verbose,
         github_user=args.gh_user,
         github_pass=args.gh_pass,
         github_token=args.gh_token,
-        github_repo=args.repo,
-        pr_number=args.pr,
-        start_at_pr=args.start_at,
         always_pause=args.pause,
         force=args.force,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        state_dir=args.state_dir,
+        incremental=args.incremental,
+        pool_size=args.pool_size,
+        budget=args.budget,
+        mergeable_deadline=args.mergeable_deadline,
+        record=args.record,
+        replay=args.replay,
+        replay_latency=args.replay_latency,
+        base_url=args.base_url,
+        since=since,
+        since_last_run=args.since_last_run,
+        writers=args.writers,
     )
-    triage.run()
+    if repos:
+        run_repos(repos, options, policy=args.schedule)
+        return
+    if args.worker:
+        run_worker(args.worker, args.repo, options, worker=args.worker_id,
+                   lease=args.lease)
+        return
+
+    triage = Triage(args.repo, options.replace(
+        pr_number=args.pr,
+        start_at_pr=args.start_at,
+        workers=args.workers,
+        profile=args.profile,
+    ))
+    if args.daemon:
+        triage.serve(listen, secret=args.webhook_secret,
+                     debounce=args.debounce)
+    elif args.coordinator:
+        triage.enqueue(args.coordinator, shards=args.shards)
+    else:
+        triage.run()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,546 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""Daemon triaging single PRs as GitHub webhook events come in.
+
+An HTTP server takes the webhook deliveries of the repository and maps
+every event to the open PR it concerns:
+
+  pull_request    the PR
+  issue_comment   the issue commented on, if it is a PR
+  issues          the issue, if it is a PR, e.g. when it was labeled
+  status          the open PR whose head commit the status is for, looked
+                  up by the main loop if the commit is not known yet
+
+label events are about the labels of the repository rather than of any
+PR and are ignored, like events the bot caused itself with its labels and
+comments. PRs whose bot comment timed out, see Triage.warning_timers, are
+queued like for an event once the timeout passes.
+
+The events of a PR are debounced: the PR is triaged once no event came in
+for it for a few seconds, but not later than a maximum delay after its
+first event, so a burst of events is merged into one evaluation. A PR is
+triaged with the rules of a sweep, Triage.triage_pull_request(), one at a
+time. Its writes are done before the next one is triaged. A PR failing to
+be triaged, e.g. as GitHub errs, is queued again with growing delays and
+given up after a few attempts, the daemon goes on with the other PRs.
+
+The seconds from the first event of an evaluation until its labels and
+comments are written are served as metrics at /metrics, in the Prometheus
+text format. Payloads can be posted locally, the event named in the
+X-GitHub-Event header like GitHub does:
+
+    ./triage.py core --force --daemon --listen localhost:8000 &
+    curl -H 'X-GitHub-Event: issue_comment' -d @payload.json \\
+        http://localhost:8000/
+"""
+
+from __future__ import print_function
+
+import hashlib
+import hmac
+import json
+import sys
+import threading
+import time
+from collections import deque
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+import github.PaginatedList
+import github.PullRequest
+
+DEFAULT_LISTEN = "localhost:8000"
+
+# Seconds without events before a PR is triaged, and the most seconds its
+# first event waits
+DEFAULT_DEBOUNCE = 10
+DEFAULT_MAX_DELAY = 60
+
+# Seconds between looking for the PRs due, also for the PRs waiting for
+# their mergeable state
+POLL_INTERVAL = 1
+
+# Seconds between listings of the open PRs to map status events to PRs,
+# statuses of branches without PR would list them all the time otherwise
+HEADS_REFRESH_INTERVAL = 60
+
+# Returned by Daemon.pr_number() for a status of a commit not known yet
+UNKNOWN_HEAD = object()
+
+# Seconds before a PR which failed to be triaged is tried again, doubled
+# on every further failure, and the attempts before it is given up
+RETRY_DELAY = 30
+MAX_ATTEMPTS = 5
+
+# Latencies kept for the quantiles of /metrics
+LATENCY_WINDOW = 1000
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def quantile(values, q):
+    """Returns the q quantile of sorted values, nearest rank"""
+    index = min(len(values) - 1, int(q * len(values)))
+    return values[index]
+
+
+class Debouncer(object):
+    """PRs waiting to be triaged, each due delay seconds after its last
+    event but at most max_delay seconds after its first one"""
+
+    def __init__(self, delay=DEFAULT_DEBOUNCE, max_delay=DEFAULT_MAX_DELAY):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.condition = threading.Condition()
+        # Number -> [first event, last event, events, not before]
+        self.pending = {}
+
+    def due_at(self, entry):
+        return max(entry[3],
+                   min(entry[1] + self.delay, entry[0] + self.max_delay))
+
+    def add(self, number, received_at, not_before=0):
+        """Takes note of an event for the PR number, which is not due
+        before not_before if given"""
+        with self.condition:
+            entry = self.pending.get(number)
+            if entry is None:
+                self.pending[number] = [received_at, received_at, 1,
+                                        not_before]
+            else:
+                entry[0] = min(entry[0], received_at)
+                entry[1] = max(entry[1], received_at)
+                entry[2] += 1
+                entry[3] = max(entry[3], not_before)
+            self.condition.notify()
+
+    def take(self, timeout):
+        """Waits up to timeout seconds for a PR to become due, returns it
+        as (number, first event, events) or None"""
+        deadline = time.time() + timeout
+        with self.condition:
+            while True:
+                now = time.time()
+                wait_until = deadline
+                if self.pending:
+                    number, entry = min(self.pending.items(),
+                                        key=lambda item: self.due_at(item[1]))
+                    if self.due_at(entry) <= now:
+                        del self.pending[number]
+                        return number, entry[0], entry[2]
+                    wait_until = min(deadline, self.due_at(entry))
+                if wait_until <= now:
+                    return None
+                self.condition.wait(wait_until - now)
+
+    def __len__(self):
+        with self.condition:
+            return len(self.pending)
+
+
+class Metrics(object):
+    """Counters and latencies of the daemon"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = 0
+        self.ignored = 0
+        self.evaluations = 0
+        self.errors = 0
+        self.writes = 0
+        self.latency_sum = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def count_event(self, ignored):
+        with self.lock:
+            self.events += 1
+            if ignored:
+                self.ignored += 1
+
+    def count_ignored(self):
+        """Takes note of an event found to be ignored after it was
+        counted"""
+        with self.lock:
+            self.ignored += 1
+
+    def count_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def count_evaluation(self, latency, wrote):
+        """Takes note of an evaluation done latency seconds after its
+        first event, which wrote labels or comments if wrote is set"""
+        with self.lock:
+            self.evaluations += 1
+            if wrote:
+                self.writes += 1
+                self.latency_sum += latency
+                self.latencies.append(latency)
+
+    def render(self):
+        """Returns the metrics in the Prometheus text format"""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            lines = [
+                "# TYPE triage_webhook_events_total counter",
+                "triage_webhook_events_total %d" % self.events,
+                "# TYPE triage_webhook_events_ignored_total counter",
+                "triage_webhook_events_ignored_total %d" % self.ignored,
+                "# TYPE triage_evaluations_total counter",
+                "triage_evaluations_total %d" % self.evaluations,
+                "# TYPE triage_errors_total counter",
+                "triage_errors_total %d" % self.errors,
+                "# TYPE triage_event_to_label_seconds summary",
+            ]
+            for q in QUANTILES:
+                if latencies:
+                    lines.append(
+                        'triage_event_to_label_seconds{quantile="%s"} %.3f'
+                        % (q, quantile(latencies, q)))
+            lines.append("triage_event_to_label_seconds_sum %.3f" %
+                         self.latency_sum)
+            lines.append("triage_event_to_label_seconds_count %d" %
+                         self.writes)
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Returns a summary as a list of lines"""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            lines = [
+                "Daemon: %d events, %d ignored, %d evaluations, %d with "
+                "writes, %d errors" % (self.events, self.ignored,
+                                       self.evaluations, self.writes,
+                                       self.errors),
+            ]
+            if latencies:
+                lines.append(
+                    "Event to label: %.1f s median, %.1f s at the 90th "
+                    "percentile, %.1f s at most" % (
+                        quantile(latencies, 0.5), quantile(latencies, 0.9),
+                        latencies[-1]))
+        return lines
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Request handler taking webhook deliveries for a Daemon"""
+
+    def log_message(self, format, *args):
+        if self.server.daemon.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def respond(self, status, text):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.respond(404, "Not found\n")
+            return
+        self.respond(200, self.server.daemon.metrics.render())
+
+    def do_POST(self):
+        daemon = self.server.daemon
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if not daemon.is_signed(body, self.headers.get('X-Hub-Signature')):
+            self.respond(403, "Bad signature\n")
+            return
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except ValueError:
+            self.respond(400, "Payload is not JSON\n")
+            return
+        try:
+            queued = daemon.receive(self.headers.get('X-GitHub-Event'),
+                                    payload)
+        except (AttributeError, KeyError, TypeError):
+            self.respond(400, "Payload does not fit the event\n")
+            return
+        if queued is None:
+            self.respond(200, "Ignored\n")
+        else:
+            self.respond(202, "Queued %s\n" % queued)
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, daemon):
+        HTTPServer.__init__(self, address, Handler)
+        self.daemon = daemon
+
+
+class Daemon(object):
+    """Triages the PRs of repo as webhook events come in.
+
+    triage is the Triage whose rules and state are used, bots the logins
+    whose events are ignored. Deliveries must be signed with secret if
+    one is given.
+    """
+
+    def __init__(self, triage, repo, bots=(), secret=None,
+                 debounce=DEFAULT_DEBOUNCE, max_delay=DEFAULT_MAX_DELAY,
+                 verbose=False):
+        self.triage = triage
+        self.repo = repo
+        self.bots = bots
+        self.secret = secret
+        self.verbose = verbose
+        self.debouncer = Debouncer(debounce, max_delay)
+        self.metrics = Metrics()
+        self.lock = threading.Lock()
+        # Open PRs by the SHA of their head commit, for status events
+        self.heads = {}
+        self.heads_listed_at = None
+        # First status event by SHA of the commits not known to be the head
+        # of an open PR yet, see resolve_statuses()
+        self.statuses = {}
+        # First event of the PRs waiting for their mergeable state, and of
+        # the events which came in for them meanwhile
+        self.waiting = {}
+        self.held_back = {}
+        # Failed attempts of the PRs queued again after an error
+        self.attempts = {}
+        self.unsaved = False
+
+    def is_signed(self, body, signature):
+        """Returns True if no secret is set or signature is the HMAC of
+        body GitHub sends in X-Hub-Signature"""
+        if not self.secret:
+            return True
+        if not signature:
+            return False
+        expected = "sha1=" + hmac.new(self.secret.encode('utf-8'), body,
+                                      hashlib.sha1).hexdigest()
+        return hmac.compare_digest(expected, str(signature))
+
+    def receive(self, event, payload):
+        """Queues the PR an event is about. Returns what was queued, or
+        None if the event is ignored."""
+        received_at = time.time()
+        number = self.pr_number(event, payload)
+        self.metrics.count_event(number is None)
+        if number is None:
+            return None
+        if number is UNKNOWN_HEAD:
+            sha = payload['sha']
+            with self.lock:
+                self.statuses.setdefault(sha, received_at)
+            return "status of %s" % sha[:7]
+        self.debouncer.add(number, received_at)
+        return "PR #%s" % number
+
+    def pr_number(self, event, payload):
+        """Returns the number of the open PR an event is about, or
+        UNKNOWN_HEAD for a status of a commit whose PR is not known"""
+        repository = payload.get('repository') or {}
+        if repository.get('full_name') != self.triage.full_name:
+            return None
+        if (payload.get('sender') or {}).get('login') in self.bots:
+            return None
+        if event == 'pull_request':
+            pull = payload['pull_request']
+            if pull['state'] != 'open':
+                return None
+            with self.lock:
+                self.heads[pull['head']['sha']] = pull['number']
+            return pull['number']
+        if event in ('issue_comment', 'issues'):
+            issue = payload['issue']
+            if 'pull_request' not in issue or issue['state'] != 'open':
+                return None
+            return issue['number']
+        if event == 'status':
+            with self.lock:
+                return self.heads.get(payload['sha'], UNKNOWN_HEAD)
+        return None
+
+    def resolve_statuses(self):
+        """Queues the PRs of the status events whose commit was not known
+        when they came in. Unless that was done lately, the open PRs are
+        listed to learn their head commits, and the statuses of commits
+        which are still not the head of any are dropped."""
+        with self.lock:
+            if not self.statuses:
+                return
+            now = time.time()
+            listing_due = (self.heads_listed_at is None or
+                           now - self.heads_listed_at >=
+                           HEADS_REFRESH_INTERVAL)
+        if listing_due:
+            self.heads_listed_at = now
+            # The handler threads go on with the heads known so far
+            pulls = github.PaginatedList.PaginatedList(
+                github.PullRequest.PullRequest,
+                self.triage.client.requester,
+                self.repo.url + "/pulls",
+                {"state": "open", "per_page": 100}
+            )
+            heads = dict((pull.head.sha, pull.number) for pull in pulls)
+        with self.lock:
+            if listing_due:
+                self.heads = heads
+            for sha, received_at in list(self.statuses.items()):
+                number = self.heads.get(sha)
+                if number is not None:
+                    self.debouncer.add(number, received_at)
+                elif listing_due and received_at < now:
+                    self.metrics.count_ignored()
+                else:
+                    # Maybe of a commit pushed after the listing
+                    continue
+                del self.statuses[sha]
+
+    def is_waiting_for_mergeable(self, pull_request):
+        return any(item[-1] is pull_request
+                   for item in self.triage.mergeable_queue)
+
+    def evaluate(self, received_at):
+        """Triages triage.pull_request and waits for its writes, unless
+        it waits for its mergeable state"""
+        triage = self.triage
+        pull_request = triage.pull_request
+        triage.actions_executed = False
+        triage.triage_pull_request()
+        if self.is_waiting_for_mergeable(pull_request):
+            self.waiting[pull_request.pr_number] = received_at
+            return
+        self.unsaved = True
+        failed = triage.finish_writes()
+        if failed:
+            raise RuntimeError("writing actions failed: %s" %
+                               failed[pull_request.pr_number])
+        self.attempts.pop(pull_request.pr_number, None)
+        latency = time.time() - received_at
+        wrote = triage.actions_executed
+        self.metrics.count_evaluation(latency, wrote)
+        print("PR #%s: triaged %.1f s after its first event%s" % (
+            pull_request.pr_number, latency,
+            ", actions written" if wrote else ""))
+        if pull_request.snapshot.is_loaded('head_sha'):
+            with self.lock:
+                self.heads[pull_request.snapshot.head_sha] = \
+                    pull_request.pr_number
+
+    def triage_due(self, number, received_at, events):
+        """Triages a PR whose events are due"""
+        triage = self.triage
+        triage.debug(msg="PR #%s: %d events" % (number, events))
+        if number in self.waiting:
+            # Queued again once the PR was triaged
+            self.held_back[number] = min(
+                received_at, self.held_back.get(number, received_at))
+            return
+        pull_request = triage.make_pull_request(self.repo, pr_number=number)
+        if pull_request.snapshot.state != 'open':
+            print("PR #%s: closed, skipping" % number)
+            triage.warning_timers.cancel(number)
+            return
+        triage.pull_request = pull_request
+        self.evaluate(received_at)
+
+    def failed(self, number, received_at, error):
+        """Queues a PR which failed to be triaged again after a delay,
+        unless it failed too often already"""
+        self.metrics.count_error()
+        self.waiting.pop(number, None)
+        held_back = self.held_back.pop(number, None)
+        attempts = self.attempts.get(number, 0) + 1
+        print("Error: PR #%s: triage failed: %s" % (number, error),
+              file=sys.stderr)
+        if attempts >= MAX_ATTEMPTS:
+            print("Error: PR #%s: giving up after %d attempts" %
+                  (number, attempts), file=sys.stderr)
+            self.attempts.pop(number, None)
+            return
+        self.attempts[number] = attempts
+        self.debouncer.add(number, min(received_at, held_back or received_at),
+                           not_before=time.time() +
+                           RETRY_DELAY * 2 ** (attempts - 1))
+
+    def triage_deferred(self):
+        """Evaluates the PRs whose mergeable state is known now"""
+        triage = self.triage
+        try:
+            for pull_request in triage.due_deferred():
+                number = pull_request.pr_number
+                triage.pull_request = pull_request
+                received_at = self.waiting.pop(number)
+                try:
+                    self.evaluate(received_at)
+                except Exception as e:
+                    self.failed(number, received_at, e)
+                    continue
+                if number in self.held_back:
+                    self.debouncer.add(number, self.held_back.pop(number))
+        except Exception as e:
+            # Rechecking a PR failed, it is out of the mergeable queue
+            for number, received_at in list(self.waiting.items()):
+                if not any(item[-1].pr_number == number
+                           for item in triage.mergeable_queue):
+                    self.failed(number, received_at, e)
+
+    def serve(self, address):
+        """Takes events on address, a (host, port) tuple, until
+        interrupted"""
+        server = Server(address, self)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        print("Listening for webhook events on http://%s:%d/" %
+              server.server_address)
+        triage = self.triage
+        try:
+            while True:
+                due = self.debouncer.take(POLL_INTERVAL)
+                if due is not None:
+                    try:
+                        self.triage_due(*due)
+                    except Exception as e:
+                        self.failed(due[0], due[1], e)
+                self.triage_deferred()
+                try:
+                    self.resolve_statuses()
+                except Exception as e:
+                    # Tried again once the next listing is due
+                    self.metrics.count_error()
+                    print("Error: listing the open PRs failed: %s" % e,
+                          file=sys.stderr)
+                # Warnings are due without any event
+                for number, due_at in triage.warning_timers.pop_due():
+                    print("PR #%s: bot comment timed out" % number)
+                    self.debouncer.add(number, due_at)
+                    self.unsaved = True
+                if due is None and self.unsaved and not self.debouncer:
+                    triage.save_state()
+                    self.unsaved = False
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+            server.server_close()
+            for line in self.metrics.summary():
+                print(line)
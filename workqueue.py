@@ -0,0 +1,277 @@
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""Durable queue of PRs to triage, shared by worker processes.
+
+The queue is a SQLite database. Workers on several hosts can share it
+over a filesystem with working locks. A coordinator puts PRs into it,
+workers take them out. Every PR belongs to one of a fixed number of
+shards, its number modulo the shard count. A worker leases a whole shard
+at a time and triages its PRs, so a PR is only ever triaged by one worker,
+and the state kept for the PRs of a shard is only written by the worker
+holding it.
+
+A lease lasts lease seconds and is renewed by a Heartbeat while the
+worker is busy. Once the lease of a crashed or stuck worker runs out,
+another worker takes the shard over, including the PRs the first one had
+taken but not acknowledged. A PR taken max_attempts times without being
+acknowledged is marked failed rather than taken again. Workers only stop
+once no PR is left queued or held by another worker.
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_SHARDS = 16
+DEFAULT_LEASE = 300
+DEFAULT_MAX_ATTEMPTS = 3
+
+# PRs handed out at once
+DEFAULT_BATCH = 20
+
+# Seconds to wait for a lock on the database
+LOCK_TIMEOUT = 60
+
+# Seconds between attempts to take over a shard held by another worker
+CLAIM_INTERVAL = 5
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    # state is queued, leased, done or failed. requeue is set when a PR is
+    # put again while leased, it is queued again once acknowledged.
+    "CREATE TABLE IF NOT EXISTS items ("
+    " repo TEXT, number INTEGER, shard INTEGER, state TEXT, worker TEXT,"
+    " attempts INTEGER DEFAULT 0, requeue INTEGER DEFAULT 0, error TEXT,"
+    " queued_at REAL, PRIMARY KEY (repo, number))",
+    "CREATE INDEX IF NOT EXISTS items_shard ON items (repo, shard, state)",
+    "CREATE TABLE IF NOT EXISTS shards ("
+    " repo TEXT, shard INTEGER, worker TEXT, last_worker TEXT,"
+    " lease_until REAL, PRIMARY KEY (repo, shard))",
+]
+
+
+class WorkQueue(object):
+    """Connection to a queue database. The shard count is fixed when the
+    database is created, shards only applies then."""
+
+    def __init__(self, path, shards=DEFAULT_SHARDS,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        # Transactions are begun explicitly, see transaction()
+        self.db = sqlite3.connect(path, timeout=LOCK_TIMEOUT,
+                                  isolation_level=None)
+        with self.transaction():
+            for statement in SCHEMA:
+                self.db.execute(statement)
+            self.db.execute("INSERT OR IGNORE INTO meta VALUES "
+                            "('shards', ?)", (str(shards),))
+            self.shards = int(self.db.execute(
+                "SELECT value FROM meta WHERE key = 'shards'"
+            ).fetchone()[0])
+
+    @contextmanager
+    def transaction(self):
+        """Runs the statements inside holding the write lock"""
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def shard_of(self, number):
+        return number % self.shards
+
+    def put(self, repo, numbers):
+        """Queues the PRs numbers of repo, returns how many were not
+        queued already"""
+        added = 0
+        now = time.time()
+        with self.transaction():
+            for number in numbers:
+                row = self.db.execute(
+                    "SELECT state FROM items WHERE repo = ? AND number = ?",
+                    (repo, number)
+                ).fetchone()
+                if row is None:
+                    self.db.execute(
+                        "INSERT INTO items (repo, number, shard, state, "
+                        "queued_at) VALUES (?, ?, ?, 'queued', ?)",
+                        (repo, number, self.shard_of(number), now))
+                elif row[0] == 'leased':
+                    self.db.execute(
+                        "UPDATE items SET requeue = 1 "
+                        "WHERE repo = ? AND number = ?", (repo, number))
+                elif row[0] != 'queued':
+                    self.db.execute(
+                        "UPDATE items SET state = 'queued', worker = NULL, "
+                        "attempts = 0, error = NULL, queued_at = ? "
+                        "WHERE repo = ? AND number = ?", (now, repo, number))
+                else:
+                    continue
+                added += 1
+        return added
+
+    def claim_shard(self, worker, repo, lease=DEFAULT_LEASE):
+        """Leases a shard of repo with PRs to triage which no other worker
+        holds, preferring shards the worker held before. Returns the shard
+        or None if there is none."""
+        now = time.time()
+        with self.transaction():
+            row = self.db.execute(
+                "SELECT items.shard FROM items LEFT JOIN shards"
+                " ON shards.repo = items.repo AND shards.shard = items.shard"
+                " WHERE items.repo = ? AND items.state IN ('queued', 'leased')"
+                " AND (shards.worker IS NULL OR shards.worker = ?"
+                " OR shards.lease_until < ?)"
+                " GROUP BY items.shard"
+                " ORDER BY MAX(shards.last_worker = ?) DESC,"
+                " MIN(items.queued_at) LIMIT 1",
+                (repo, worker, now, worker)
+            ).fetchone()
+            if row is None:
+                return None
+            shard = row[0]
+            self.db.execute(
+                "INSERT OR REPLACE INTO shards VALUES (?, ?, ?, ?, ?)",
+                (repo, shard, worker, worker, now + lease))
+            # Taken by an earlier holder, but never acknowledged
+            self.db.execute(
+                "UPDATE items SET state = 'queued', worker = NULL "
+                "WHERE repo = ? AND shard = ? AND state = 'leased'",
+                (repo, shard))
+        return shard
+
+    def renew(self, worker, repo, shard, lease=DEFAULT_LEASE):
+        """Extends the lease of a shard, returns False if the worker does
+        not hold it anymore"""
+        with self.transaction():
+            cursor = self.db.execute(
+                "UPDATE shards SET lease_until = ? WHERE repo = ? AND "
+                "shard = ? AND worker = ?",
+                (time.time() + lease, repo, shard, worker))
+        return cursor.rowcount == 1
+
+    def release_shard(self, worker, repo, shard):
+        with self.transaction():
+            self.db.execute(
+                "UPDATE shards SET worker = NULL, lease_until = NULL "
+                "WHERE repo = ? AND shard = ? AND worker = ?",
+                (repo, shard, worker))
+
+    def take(self, worker, repo, shard, limit=DEFAULT_BATCH):
+        """Returns up to limit PR numbers of a shard the worker holds. PRs
+        taken max_attempts times already are marked failed instead."""
+        with self.transaction():
+            self.db.execute(
+                "UPDATE items SET state = 'failed', worker = NULL, "
+                "error = 'taken too often without being acknowledged' "
+                "WHERE repo = ? AND shard = ? AND "
+                "state = 'queued' AND attempts >= ?",
+                (repo, shard, self.max_attempts))
+            numbers = [row[0] for row in self.db.execute(
+                "SELECT number FROM items WHERE repo = ? AND shard = ? AND "
+                "state = 'queued' ORDER BY number DESC LIMIT ?",
+                (repo, shard, limit))]
+            for number in numbers:
+                self.db.execute(
+                    "UPDATE items SET state = 'leased', worker = ?, "
+                    "attempts = attempts + 1, requeue = 0 "
+                    "WHERE repo = ? AND number = ?", (worker, repo, number))
+        return numbers
+
+    def ack(self, worker, repo, number):
+        """Marks a PR taken by the worker as triaged"""
+        with self.transaction():
+            self.db.execute(
+                "UPDATE items SET worker = NULL, attempts = 0, state = "
+                "CASE requeue WHEN 1 THEN 'queued' ELSE 'done' END "
+                "WHERE repo = ? AND number = ? AND worker = ? AND "
+                "state = 'leased'", (repo, number, worker))
+
+    def fail(self, worker, repo, number, error):
+        """Hands a PR the worker failed on back, or marks it failed once it
+        was taken max_attempts times"""
+        with self.transaction():
+            self.db.execute(
+                "UPDATE items SET worker = NULL, error = ?, state = "
+                "CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END "
+                "WHERE repo = ? AND number = ? AND worker = ? AND "
+                "state = 'leased'",
+                (error, self.max_attempts, repo, number, worker))
+
+    def requeue_failed(self, repo):
+        """Queues the failed PRs of repo again, returns how many"""
+        with self.transaction():
+            cursor = self.db.execute(
+                "UPDATE items SET state = 'queued', attempts = 0 "
+                "WHERE repo = ? AND state = 'failed'", (repo,))
+        return cursor.rowcount
+
+    def pending(self, repo):
+        """Returns the number of PRs of repo queued or being triaged"""
+        return self.db.execute(
+            "SELECT COUNT(*) FROM items WHERE repo = ? AND "
+            "state IN ('queued', 'leased')", (repo,)).fetchone()[0]
+
+    def counts(self, repo):
+        """Returns the number of PRs of repo by state"""
+        return dict(self.db.execute(
+            "SELECT state, COUNT(*) FROM items WHERE repo = ? "
+            "GROUP BY state", (repo,)))
+
+    def close(self):
+        self.db.close()
+
+
+class Heartbeat(threading.Thread):
+    """Renews the lease of a shard every lease / 3 seconds. lost is set
+    once the lease could not be renewed."""
+
+    def __init__(self, path, worker, repo, shard, lease=DEFAULT_LEASE):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.path = path
+        self.worker = worker
+        self.repo = repo
+        self.shard = shard
+        self.lease = lease
+        self.lost = threading.Event()
+        self.stopped = threading.Event()
+
+    def run(self):
+        # SQLite connections can not be shared between threads
+        queue = WorkQueue(self.path)
+        try:
+            while not self.stopped.wait(self.lease / 3.0):
+                try:
+                    renewed = queue.renew(self.worker, self.repo,
+                                          self.shard, self.lease)
+                except sqlite3.Error:
+                    renewed = False
+                if not renewed:
+                    self.lost.set()
+                    return
+        finally:
+            queue.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()